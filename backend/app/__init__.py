@@ -19,6 +19,7 @@ def create_app():
     # DB Config
     app.config['SQLALCHEMY_DATABASE_URI'] = config.SQLALCHEMY_DATABASE_URI
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = config.SQLALCHEMY_TRACK_MODIFICATIONS
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = config.SQLALCHEMY_ENGINE_OPTIONS
     app.secret_key = config.SECRET_KEY
 
     print("DB URI used:", app.config['SQLALCHEMY_DATABASE_URI'])
@@ -1,10 +1,22 @@
 from flask import Blueprint, request, jsonify
+from sqlalchemy import select, bindparam
+from sqlalchemy.exc import IntegrityError
 from app import db
 from app.models import User
 import bcrypt
 
 auth_bp = Blueprint('auth_bp', __name__)
 
+# Column-only selects: plain rows, no ORM objects or identity-map bookkeeping
+LOGIN_QUERY = select(
+    User.user_id, User.role, User.full_name, User.password
+).where(User.email == bindparam('email')).limit(1)
+
+PROFILE_QUERY = select(
+    User.user_id, User.full_name, User.email, User.phone_number,
+    User.address, User.role, User.profile_picture
+).where(User.user_id == bindparam('user_id')).limit(1)
+
 # ✅ DB Check Route
 @auth_bp.route('/check-db')
 def check_db():
@@ -28,10 +40,6 @@ def register():
     if not all([full_name, email, password, phone_number, address, role]):
         return jsonify({'message': 'All fields are required'}), 400
 
-    existing_user = User.query.filter_by(email=email).first()
-    if existing_user:
-        return jsonify({'message': 'Email already exists'}), 409
-
     hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
     new_user = User(
@@ -43,8 +51,13 @@ def register():
         address=address
     )
 
+    # The unique key on users.email rejects duplicates; no lookup before the insert
     db.session.add(new_user)
-    db.session.commit()
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'message': 'Email already exists'}), 409
 
     return jsonify({'message': 'User registered successfully'}), 201
 
@@ -58,7 +71,7 @@ def login():
     if not email or not password:
         return jsonify({'message': 'Email and password are required'}), 400
 
-    user = User.query.filter_by(email=email).first()
+    user = db.session.execute(LOGIN_QUERY, {'email': email}).first()
 
     if user and bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
         return jsonify({
@@ -72,19 +85,11 @@ def login():
 
 @auth_bp.route('/profile/<int:user_id>', methods=['GET'])
 def get_profile(user_id):
-    user = User.query.filter_by(user_id=user_id).first()
+    user = db.session.execute(PROFILE_QUERY, {'user_id': user_id}).first()
     if user:
         return jsonify({
             "status": "success",
-            "data": {
-                "user_id": user.user_id,
-                "full_name": user.full_name,
-                "email": user.email,
-                "phone_number": user.phone_number,
-                "address": user.address,
-                "role": user.role,
-                "profile_picture": user.profile_picture
-            }
+            "data": dict(user._mapping)
         })
     return jsonify({"status": "error", "message": "User not found"}), 404
 
@@ -0,0 +1,102 @@
+import os
+import logging
+from flask import Flask, send_from_directory
+from flask_cors import CORS
+from dotenv import load_dotenv
+from config import (
+    UPLOAD_FOLDER, PROFILE_PICTURES_FOLDER, DONATION_IMAGES_FOLDER,
+    CORS_ORIGINS, CORS_METHODS, CORS_HEADERS
+)
+import db
+import compression
+import log_pipeline
+import deadlines
+from utils import format_response
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+def create_app():
+    app = Flask(__name__)
+    # First, so the access log runs after every other after_request hook
+    log_pipeline.init_app(app)
+
+    # CORS setup for both local and deployed frontend
+    CORS(app, resources={
+        r"/api/*": {
+            "origins": CORS_ORIGINS,
+            "methods": CORS_METHODS,
+            "allow_headers": CORS_HEADERS
+        }
+    }, supports_credentials=True)
+
+    # A known fallback key would let anyone sign tokens, so refuse to start without one
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
+    if not app.config['SECRET_KEY']:
+        raise RuntimeError('SECRET_KEY must be set to sign tokens')
+    app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['PROFILE_PICTURES_FOLDER'] = PROFILE_PICTURES_FOLDER
+    app.config['DONATION_IMAGES_FOLDER'] = DONATION_IMAGES_FOLDER
+
+    db.init_app(app)
+    app.teardown_appcontext(db.close_db)
+    compression.init_app(app)
+    deadlines.init_app(app)
+
+    # Register blueprints
+    from routes.user_routes import user_bp
+    from routes.donation_routes import donation_bp
+    from routes.request_routes import request_bp
+    from routes.leaderboard_routes import leaderboard_bp
+    from routes.feedback_routes import feedback_bp
+    from routes.referral_routes import referral_bp
+    from routes.metrics_routes import metrics_bp
+    from routes.event_routes import event_bp
+    from routes.stats_routes import stats_bp
+    from routes.analytics_routes import analytics_bp
+    from routes.batch_routes import batch_bp
+    from routes.audit_routes import audit_bp
+    app.register_blueprint(user_bp)
+    app.register_blueprint(donation_bp, url_prefix='/api/donations')
+    app.register_blueprint(request_bp, url_prefix='/api/requests')
+    app.register_blueprint(leaderboard_bp, url_prefix='/api/leaderboard')
+    app.register_blueprint(feedback_bp, url_prefix='/api/feedback')
+    app.register_blueprint(referral_bp, url_prefix='/api/referrals')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    app.register_blueprint(event_bp, url_prefix='/api/events')
+    app.register_blueprint(stats_bp, url_prefix='/api/stats')
+    app.register_blueprint(analytics_bp, url_prefix='/api/analytics')
+    app.register_blueprint(batch_bp, url_prefix='/api/batch')
+    app.register_blueprint(audit_bp, url_prefix='/api/audit')
+
+    @app.route('/', methods=['GET'])
+    def health():
+        return format_response('success', 'Food For All API is running'), 200
+
+    @app.route('/uploads/<path:filename>', methods=['GET'])
+    def uploaded_file(filename):
+        return send_from_directory(os.path.abspath(UPLOAD_FOLDER), filename)
+
+    return app
+
+def start_background(app):
+    """Start per-process background work (filters, relays, flushers).
+
+    Threads don't survive fork, so a pre-forking server calls this in each
+    worker rather than in the master.
+    """
+    import email_filter
+    import events
+    import write_behind
+    import donation_feed
+    import audit
+    import archive
+    import recommendations
+    email_filter.init_app(app)
+    events.init_app(app)
+    write_behind.init_app(app)
+    donation_feed.init_app(app)
+    audit.init_app(app)
+    archive.init_app(app)
+    recommendations.init_app(app)
@@ -0,0 +1,183 @@
+"""
+Archival of finished donations and their requests.
+
+``fooddonations`` and ``requests`` only grow, and the hot list queries scan
+and sort whatever is in them. This module moves donations that are done
+with into ``fooddonations_archive``, together with all of their requests,
+which go into ``requests_archive``. That keeps the hot tables proportional
+to live inventory. A donation is finished when it is:
+
+    claimed, and untouched for ARCHIVE_AFTER_DAYS, or
+    past its expiry date by ARCHIVE_EXPIRED_AFTER_DAYS, whatever its status,
+
+and has no pending requests. A donation moves with all of its requests in
+one transaction, so every archived request references an archived donation
+and foreign keys hold on both sides.
+
+``run`` moves at most ARCHIVE_MAX_BATCHES batches of ARCHIVE_BATCH_SIZE
+donations. It pauses ARCHIVE_PAUSE_SECONDS between batches. Candidates are
+locked with SKIP LOCKED, so a batch never waits on a donation a request is
+busy with. Each worker runs it every ARCHIVE_INTERVAL_SECONDS, but a MySQL
+named lock lets only one mover at a time through across the whole
+deployment. ``python archive.py run`` does the same from the command line.
+
+Reads that may hit archived rows fall back to the archive tables
+(single donation, my-requests). The ``all_fooddonations`` and
+``all_requests`` views cover history-wide totals (stats, leaderboards,
+rollup backfills). Each archived donation leaves a tombstone for delta-sync
+clients (sync.py), and a run ends by purging expired tombstones.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+import db
+import holds
+import donation_feed
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+AFTER_DAYS = int(os.getenv('ARCHIVE_AFTER_DAYS', 30))
+EXPIRED_AFTER_DAYS = int(os.getenv('ARCHIVE_EXPIRED_AFTER_DAYS', 7))
+BATCH_SIZE = int(os.getenv('ARCHIVE_BATCH_SIZE', 200))
+MAX_BATCHES = int(os.getenv('ARCHIVE_MAX_BATCHES', 50))
+PAUSE_SECONDS = float(os.getenv('ARCHIVE_PAUSE_SECONDS', 0.5))
+INTERVAL_SECONDS = float(os.getenv('ARCHIVE_INTERVAL_SECONDS', 600))
+
+LOCK_NAME = 'foodforall.archive'
+
+# Shared by the hot and archive tables; a column added to one needs adding to the other
+DONATION_COLUMNS = ('donation_id', 'food_item', 'quantity', 'expiry_date', 'description', 'status',
+                    'donor_id', 'donation_image', 'created_at', 'updated_at')
+REQUEST_COLUMNS = ('request_id', 'donation_id', 'requester_id', 'quantity_requested', 'purpose', 'status',
+                   'created_at', 'updated_at')
+
+_NO_PENDING = """NOT EXISTS (SELECT 1 FROM requests r
+                             WHERE r.donation_id = d.donation_id AND r.status = 'pending')"""
+
+# One query per criterion, so each can use its own index
+CANDIDATE_QUERIES = [
+    f"""SELECT d.donation_id FROM fooddonations d
+        WHERE d.status = 'claimed' AND d.updated_at < NOW() - INTERVAL %s DAY AND {_NO_PENDING}
+        ORDER BY d.updated_at LIMIT %s FOR UPDATE SKIP LOCKED""",
+    f"""SELECT d.donation_id FROM fooddonations d
+        WHERE d.expiry_date < CURRENT_DATE() - INTERVAL %s DAY AND {_NO_PENDING}
+        ORDER BY d.expiry_date LIMIT %s FOR UPDATE SKIP LOCKED""",
+]
+
+
+def _in(ids):
+    return f"IN ({', '.join(['%s'] * len(ids))})"
+
+
+def _copy(table, columns, ids):
+    column_list = ', '.join(columns)
+    return db.update(
+        f"""INSERT INTO {table}_archive ({column_list})
+            SELECT {column_list} FROM {table} WHERE donation_id {_in(ids)}""",
+        tuple(ids)
+    )
+
+
+def archive_batch(query, age_days):
+    """Move one batch of finished donations and their requests; returns the donations moved"""
+    started = time.monotonic()
+    with db.transaction():
+        ids = [row['donation_id'] for row in db.fetch_all(query, (age_days, BATCH_SIZE))]
+        if not ids:
+            return 0
+        # Parents go into the archive first and leave the hot tables last
+        donations = _copy('fooddonations', DONATION_COLUMNS, ids)
+        requests = _copy('requests', REQUEST_COLUMNS, ids)
+        db.delete(f"DELETE FROM requests WHERE donation_id {_in(ids)}", tuple(ids))
+        db.delete(f"DELETE FROM fooddonations WHERE donation_id {_in(ids)}", tuple(ids))
+        # Delta-sync clients drop these from their donation lists (see sync.py). Stamped by the
+        # last statement, so the time until COMMIT stays well inside SYNC_SETTLE_SECONDS
+        db.update(
+            f"""INSERT INTO sync_tombstones (entity, entity_id, removed_at)
+                SELECT 'donation', donation_id, NOW() FROM fooddonations_archive WHERE donation_id {_in(ids)}""",
+            tuple(ids)
+        )
+
+    for donation_id in ids:
+        holds.ledger.invalidate(donation_id)
+    metrics.incr('archive.donations', donations)
+    metrics.incr('archive.requests', requests)
+    metrics.observe('archive.batch', time.monotonic() - started)
+    return len(ids)
+
+
+def run(max_batches=MAX_BATCHES):
+    """Archive up to ``max_batches`` batches; returns the donations moved"""
+    acquired = db.execute_query("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,)).fetchone()['acquired']
+    if not acquired:
+        logger.debug("Another archiver holds the lock; skipping this run")
+        return 0
+    moved = batches = 0
+    try:
+        for query, age_days in zip(CANDIDATE_QUERIES, (AFTER_DAYS, EXPIRED_AFTER_DAYS)):
+            while batches < max_batches:
+                count = archive_batch(query, age_days)
+                batches += 1
+                moved += count
+                if count < BATCH_SIZE:
+                    break
+                time.sleep(PAUSE_SECONDS)
+        # sync imports this module, so it is looked up here
+        import sync
+        sync.purge_tombstones()
+    finally:
+        db.execute_query("SELECT RELEASE_LOCK(%s) AS released", (LOCK_NAME,))
+    if moved:
+        logger.info("Archived %d donations in %d batches", moved, batches)
+        donation_feed.feed.rebuild_soon()
+    return moved
+
+
+def _loop(app):
+    # Spread workers out so they don't all race for the lock at once
+    time.sleep(random.uniform(0, INTERVAL_SECONDS))
+    while True:
+        try:
+            with app.app_context():
+                run()
+        except Exception as e:
+            metrics.incr('archive.failures')
+            logger.error("Archival run failed: %s", e)
+        time.sleep(INTERVAL_SECONDS)
+
+
+_thread = None
+
+
+def init_app(app):
+    """Archive in the background from this worker"""
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(app,), name='archive', daemon=True)
+    _thread.start()
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Move finished donations and requests to the archive tables")
+    parser.add_argument('command', choices=['run'])
+    parser.add_argument('--batches', type=int, default=MAX_BATCHES)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    with app.app_context():
+        moved = run(args.batches)
+    print(f"Archived {moved} donations")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,353 @@
+"""
+ASGI entry point for the read-heavy endpoints of the Food For All API.
+
+Serves the donation detail, leaderboards, my-requests and profile reads
+on an event loop over an aiomysql connection pool, so a slow client holds a
+coroutine instead of a worker thread. Writes stay on the Flask app, and so
+does the donation list: its in-memory snapshot, paging, sorting and
+conditional GET live in routes/donation_routes.py.
+
+Responses use the same envelope as ``utils.format_response``, and browser
+origins are allowed as in the Flask app's CORS setup (config.CORS_ORIGINS).
+This module imports neither Flask nor the MySQLdb layer in db.py.
+
+Usage:
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+"""
+
+import os
+import re
+import logging
+from urllib.parse import parse_qs
+
+import aiomysql
+from dotenv import load_dotenv
+
+import json_codec
+from config import CORS_ORIGINS, CORS_HEADERS
+from envelope import build_envelope, verify_token
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DB_POOL_MIN = int(os.getenv('ASGI_DB_POOL_MIN', 2))
+DB_POOL_MAX = int(os.getenv('ASGI_DB_POOL_MAX', 20))
+
+# Read once: there is no Flask app config here
+SECRET_KEY = os.getenv('SECRET_KEY')
+if not SECRET_KEY:
+    raise RuntimeError('SECRET_KEY must be set to verify tokens')
+
+_pool = None
+
+
+async def init_pool():
+    """Create the aiomysql pool used by all handlers"""
+    global _pool
+    if _pool is None:
+        _pool = await aiomysql.create_pool(
+            host=os.getenv('MYSQL_HOST', 'localhost'),
+            port=int(os.getenv('MYSQL_PORT', 3306)),
+            user=os.getenv('MYSQL_USER', 'root'),
+            password=os.getenv('MYSQL_PASSWORD', ''),
+            db=os.getenv('MYSQL_DB', 'foodbank_ai'),
+            minsize=DB_POOL_MIN,
+            maxsize=DB_POOL_MAX,
+            autocommit=True,
+            cursorclass=aiomysql.DictCursor
+        )
+        logger.info("✅ aiomysql pool initialized")
+    return _pool
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+        _pool = None
+
+
+async def fetch_one(query, params=None):
+    async with _pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params or ())
+            return await cursor.fetchone()
+
+
+async def fetch_all(query, params=None):
+    async with _pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, params or ())
+            return await cursor.fetchall()
+
+
+def _donation_image_url(row):
+    if row['donation_image']:
+        row['donation_image'] = f"/uploads/donation_images/{row['donation_image']}"
+    return row
+
+
+def _profile_picture_url(row):
+    if row['profile_picture']:
+        row['profile_picture'] = f"/uploads/profile_pictures/{row['profile_picture']}"
+    return row
+
+
+class Request:
+    """The parts of an ASGI HTTP scope the handlers need"""
+
+    def __init__(self, scope, path_params):
+        self.path_params = path_params
+        self.headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+        self.args = {k: v[0] for k, v in parse_qs(scope['query_string'].decode('latin-1')).items()}
+        self.user = None
+
+    def arg(self, name, default=None, type=None):
+        value = self.args.get(name)
+        if value is None:
+            return default
+        if type is None:
+            return value
+        try:
+            return type(value)
+        except ValueError:
+            return default
+
+
+# ---------------------------------------------------------------------------
+# Handlers (mirror the Flask blueprints in routes/)
+# ---------------------------------------------------------------------------
+
+async def get_donation(req):
+    try:
+        # Finished donations live in the archive table once archive.py has moved them
+        for table in ('fooddonations', 'fooddonations_archive'):
+            donation = await fetch_one(
+                f"SELECT d.*, u.full_name as donor_name FROM {table} d JOIN users u ON d.donor_id = u.user_id WHERE d.donation_id = %s",
+                (req.path_params['donation_id'],)
+            )
+            if donation:
+                break
+
+        if not donation:
+            return 404, build_envelope('error', 'Donation not found', error='Not found')
+
+        return 200, build_envelope('success', 'Donation retrieved successfully', data=_donation_image_url(donation))
+    except Exception as e:
+        return 500, build_envelope('error', 'Failed to retrieve donation', error=str(e))
+
+
+LEADERBOARD_QUERY = """SELECT u.user_id, u.full_name, u.profile_picture, COUNT(d.donation_id) as donation_count,
+          SUM(d.quantity) as total_quantity
+       FROM users u
+       JOIN all_fooddonations d ON u.user_id = d.donor_id
+       {where}
+       GROUP BY u.user_id, u.full_name, u.profile_picture
+       ORDER BY donation_count DESC, total_quantity DESC
+       LIMIT %s"""
+
+MONTHLY_FILTER = "WHERE MONTH(d.created_at) = MONTH(CURRENT_DATE()) AND YEAR(d.created_at) = YEAR(CURRENT_DATE())"
+
+
+async def get_leaderboard(req):
+    try:
+        donors = await fetch_all(LEADERBOARD_QUERY.format(where=''), (req.arg('limit', 10, type=int),))
+        donors = [_profile_picture_url(d) for d in donors]
+        return 200, build_envelope('success', 'Leaderboard retrieved successfully', data=donors)
+    except Exception as e:
+        return 500, build_envelope('error', 'Failed to retrieve leaderboard', error=str(e))
+
+
+async def get_monthly_leaderboard(req):
+    try:
+        donors = await fetch_all(LEADERBOARD_QUERY.format(where=MONTHLY_FILTER), (req.arg('limit', 10, type=int),))
+        donors = [_profile_picture_url(d) for d in donors]
+        return 200, build_envelope('success', 'Monthly leaderboard retrieved successfully', data=donors)
+    except Exception as e:
+        return 500, build_envelope('error', 'Failed to retrieve monthly leaderboard', error=str(e))
+
+
+# archive.REQUEST_COLUMNS, spelled out because archive imports db (MySQLdb) and the shared-memory tables
+REQUEST_COLUMNS = ('request_id', 'donation_id', 'requester_id', 'quantity_requested', 'purpose', 'status',
+                   'created_at', 'updated_at')
+
+
+async def get_my_requests(req):
+    try:
+        status = req.arg('status')
+        page = req.arg('page', 1, type=int)
+        limit = req.arg('limit', 10, type=int)
+        offset = (page - 1) * limit
+
+        sources = [('requests', 'fooddonations')]
+        if status != 'pending':
+            sources.append(('requests_archive', 'fooddonations_archive'))
+
+        status_sql = ""
+        params = [req.user['user_id']]
+        if status:
+            status_sql = " AND r.status = %s"
+            params.append(status)
+        params = params * len(sources)
+
+        columns = ', '.join(f'r.{column}' for column in REQUEST_COLUMNS)
+        query = " UNION ALL ".join(
+            f"""
+            SELECT {columns}, d.food_item, d.donation_image, u.full_name as donor_name
+            FROM {requests_table} r
+            JOIN {donations_table} d ON r.donation_id = d.donation_id
+            JOIN users u ON d.donor_id = u.user_id
+            WHERE r.requester_id = %s{status_sql}
+            """
+            for requests_table, donations_table in sources
+        )
+
+        count_result = await fetch_one(f"SELECT COUNT(*) as count FROM ({query}) as filtered_requests", tuple(params))
+        total = count_result['count'] if count_result else 0
+
+        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
+        params.extend([limit, offset])
+
+        requests_list = await fetch_all(query, tuple(params))
+
+        return 200, build_envelope('success', 'Requests retrieved successfully', data={
+            'requests': requests_list,
+            'pagination': {
+                'total': total,
+                'page': page,
+                'limit': limit,
+                'pages': (total + limit - 1) // limit
+            }
+        })
+    except Exception as e:
+        logger.error("Error retrieving requests: %s", e)
+        return 500, build_envelope('error', 'Failed to retrieve requests', error=str(e))
+
+
+async def get_profile(req):
+    user_id = req.path_params['user_id']
+    if req.user['user_id'] != user_id and req.user['role'] != 'admin':
+        return 403, build_envelope('error', 'Unauthorized', error='Forbidden')
+    user = await fetch_one(
+        "SELECT user_id, email, full_name, phone_number, address, role, profile_picture, created_at FROM users WHERE user_id = %s",
+        (user_id,)
+    )
+    if not user:
+        return 404, build_envelope('error', 'User not found')
+    return 200, build_envelope('success', 'Profile loaded', data=_profile_picture_url(user))
+
+
+# (pattern, handler, auth required) - paths match the Flask url prefixes
+ROUTES = [
+    (re.compile(r'^/api/donations/(?P<donation_id>\d+)$'), get_donation, True),
+    (re.compile(r'^/api/leaderboard/?$'), get_leaderboard, False),
+    (re.compile(r'^/api/leaderboard/monthly$'), get_monthly_leaderboard, False),
+    (re.compile(r'^/api/requests/my-requests$'), get_my_requests, True),
+    (re.compile(r'^/api/user/profile/(?P<user_id>\d+)$'), get_profile, True),
+]
+
+
+def _authenticate(req):
+    """Same checks and error bodies as utils.token_required"""
+    auth_header = req.headers.get('authorization')
+    token = None
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(' ')[1]
+
+    if not token:
+        return 401, {'status': 'error', 'message': 'Token is missing', 'error': 'Unauthorized access'}
+
+    data = verify_token(token, SECRET_KEY)
+    if not data:
+        return 401, {'status': 'error', 'message': 'Token is invalid or expired', 'error': 'Unauthorized access'}
+
+    req.user = data
+    return None
+
+
+def _cors_headers(scope, preflight=False):
+    """Same allowances as flask_cors in app.py, for this read-only app's methods"""
+    origin = next((v.decode('latin-1') for k, v in scope['headers'] if k == b'origin'), None)
+    if origin not in CORS_ORIGINS:
+        return []
+    headers = [
+        (b'access-control-allow-origin', origin.encode('latin-1')),
+        (b'access-control-allow-credentials', b'true'),
+        (b'vary', b'Origin'),
+    ]
+    if preflight:
+        headers += [
+            (b'access-control-allow-methods', b'GET, HEAD, OPTIONS'),
+            (b'access-control-allow-headers', ', '.join(CORS_HEADERS).encode('latin-1')),
+        ]
+    return headers
+
+
+async def _dispatch(scope):
+    if scope['method'] not in ('GET', 'HEAD'):
+        return 405, build_envelope('error', 'Method not allowed', error='Method not allowed')
+
+    for pattern, handler, auth in ROUTES:
+        match = pattern.match(scope['path'])
+        if not match:
+            continue
+        path_params = {k: int(v) for k, v in match.groupdict().items()}
+        req = Request(scope, path_params)
+        if auth:
+            failure = _authenticate(req)
+            if failure:
+                return failure
+        return await handler(req)
+
+    return 404, build_envelope('error', 'Not found', error='Not found')
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await init_pool()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logger.error("❌ Failed to initialize pool: %s", e)
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_pool()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application callable"""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    if scope['method'] == 'OPTIONS':
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': _cors_headers(scope, preflight=True) + [(b'content-length', b'0')]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    if _pool is None:
+        await init_pool()
+
+    status, envelope = await _dispatch(scope)
+    body = json_codec.dumps(envelope)
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode('latin-1')),
+        ] + _cors_headers(scope),
+    })
+    await send({
+        'type': 'http.response.body',
+        'body': b'' if scope['method'] == 'HEAD' else body,
+    })
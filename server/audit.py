@@ -0,0 +1,205 @@
+"""
+Append-only audit log of request and donation events.
+
+Every event the write paths publish (request created, approved or rejected,
+donation updated or status changed) reaches ``record`` through an
+``events`` listener. ``record`` appends it to a bounded in-memory ring
+buffer, so the write path pays for a deque append, not an INSERT. When the
+buffer is full the oldest unflushed events are dropped and counted in
+``audit.dropped``.
+
+A background thread drains the buffer in batches of AUDIT_BATCH_SIZE, or
+every AUDIT_FLUSH_SECONDS, into one of two sinks (AUDIT_SINK):
+
+    mysql     multi-row INSERTs into ``audit_events`` (default)
+    segments  JSON lines appended to size-rotated files in AUDIT_SEGMENT_DIR,
+              for deployments that ship logs elsewhere; reading history
+              scans every segment
+
+``history`` reads events for one donation or request, newest first, from
+whichever sink is configured. It is served at ``/api/audit`` to admins and
+the parties involved (the donor, and a request's requester). History lags
+writes by up to AUDIT_FLUSH_SECONDS, and a worker that dies without a
+clean shutdown loses what it had buffered.
+"""
+
+import os
+import json
+import glob
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+import db
+import events
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SINK = os.getenv('AUDIT_SINK', 'mysql')
+BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', 10000))
+BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', 500))
+FLUSH_SECONDS = float(os.getenv('AUDIT_FLUSH_SECONDS', 1.0))
+SEGMENT_DIR = os.getenv('AUDIT_SEGMENT_DIR', 'audit/')
+SEGMENT_BYTES = int(os.getenv('AUDIT_SEGMENT_BYTES', 64 * 1024 * 1024))
+
+SUBJECTS = ('donation_id', 'request_id')
+
+
+def _entry(event):
+    data = event.data or {}
+    return {
+        'id': int(event.id),  # publish time in ns
+        'event_type': event.type,
+        'donation_id': data.get('donation_id'),
+        'request_id': data.get('request_id'),
+        'actor_id': data.get('actor_id'),
+        'payload': data,
+        'occurred_at': datetime.fromtimestamp(int(event.id) / 1e9),
+    }
+
+
+class MySQLSink:
+    INSERT = """INSERT INTO audit_events
+                (event_type, donation_id, request_id, actor_id, payload, occurred_at)
+                VALUES (%s, %s, %s, %s, %s, %s)"""
+
+    def write(self, entries):
+        db.insert_many(self.INSERT, [
+            (e['event_type'], e['donation_id'], e['request_id'], e['actor_id'],
+             json.dumps(e['payload'], default=str), e['occurred_at'])
+            for e in entries
+        ])
+
+    def history(self, subject, subject_id, limit, before=None):
+        query = f"""SELECT event_id, event_type, donation_id, request_id, actor_id, payload, occurred_at
+                    FROM audit_events WHERE {subject} = %s"""
+        params = [subject_id]
+        if before is not None:
+            query += " AND event_id < %s"
+            params.append(before)
+        query += " ORDER BY event_id DESC LIMIT %s"
+        params.append(limit)
+        rows = db.fetch_all(query, tuple(params))
+        for row in rows:
+            row['payload'] = json.loads(row['payload'])
+        return rows
+
+
+class SegmentSink:
+    """JSON lines in files named <first event ns>-<pid>.jsonl, rotated by size"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._file = None
+
+    def write(self, entries):
+        if self._file is None or self._file.tell() >= SEGMENT_BYTES:
+            if self._file is not None:
+                self._file.close()
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{entries[0]['id']}-{os.getpid()}.jsonl")
+            self._file = open(path, 'a', encoding='utf-8')
+        self._file.write(''.join(json.dumps(e, default=str) + '\n' for e in entries))
+        self._file.flush()
+
+    def history(self, subject, subject_id, limit, before=None):
+        # Workers write their own segments concurrently, so every file is scanned
+        matches = []
+        for path in glob.glob(os.path.join(self.directory, '*.jsonl')):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry[subject] == subject_id and (before is None or entry['id'] < before):
+                        entry['event_id'] = entry.pop('id')
+                        matches.append(entry)
+        matches.sort(key=lambda m: m['event_id'], reverse=True)
+        return matches[:limit]
+
+
+class AuditLog:
+    def __init__(self, sink):
+        self.sink = sink
+        self._buffer = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._app = None
+
+    def record(self, event):
+        """events listener: buffer the event for the next flush"""
+        entry = _entry(event)
+        with self._cond:
+            if len(self._buffer) >= BUFFER_SIZE:
+                self._buffer.popleft()
+                metrics.incr('audit.dropped')
+            self._buffer.append(entry)
+            if len(self._buffer) >= BATCH_SIZE:
+                self._cond.notify()
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._app = app
+        events.broker.add_listener(self.record)
+        self._thread = threading.Thread(target=self._run, name='audit-flush', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush_all)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._buffer) < BATCH_SIZE:
+                    self._cond.wait(FLUSH_SECONDS)
+            if not self.flush():
+                time.sleep(FLUSH_SECONDS)
+
+    def flush(self):
+        """Write up to one batch; returns False if the sink failed"""
+        with self._flush_lock:
+            with self._cond:
+                batch = [self._buffer[i] for i in range(min(BATCH_SIZE, len(self._buffer)))]
+            if not batch:
+                return True
+            started = time.monotonic()
+            try:
+                with self._app.app_context():
+                    self.sink.write(batch)
+            except Exception as e:
+                metrics.incr('audit.flush_failures')
+                logger.error("Audit flush of %d events failed: %s", len(batch), e)
+                return False
+            with self._cond:
+                # Drop what was written; anything evicted meanwhile was older still
+                written = {id(entry) for entry in batch}
+                while self._buffer and id(self._buffer[0]) in written:
+                    self._buffer.popleft()
+                depth = len(self._buffer)
+            metrics.observe('audit.flush', time.monotonic() - started)
+            metrics.incr('audit.events_flushed', len(batch))
+            metrics.set_gauge('audit.depth', depth)
+            return True
+
+    def flush_all(self):
+        while self._buffer and self.flush():
+            pass
+
+    def history(self, subject, subject_id, limit=50, before=None):
+        """Events for one donation or request, newest first"""
+        if subject not in SUBJECTS:
+            raise ValueError(f'subject must be one of: {SUBJECTS}')
+        return self.sink.history(subject, subject_id, limit, before)
+
+
+log = AuditLog(SegmentSink(SEGMENT_DIR) if SINK == 'segments' else MySQLSink())
+
+
+def init_app(app):
+    """Start recording and flushing in this worker"""
+    log.start(app)
+
+
+def flush_all():
+    log.flush_all()
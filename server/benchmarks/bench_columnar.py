@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""
+Benchmark the columnar list format against row objects.
+
+Builds a page of request-listing rows (``r.*`` plus the joined columns,
+13 keys) the way each cursor delivers them: a dict per row for DictCursor,
+plain tuples for the columnar path. It then encodes the response envelope.
+Reports payload size (raw and gzipped), time to build and encode, and the
+peak traced allocation.
+
+Usage:
+    python benchmarks/bench_columnar.py [rows]
+"""
+
+import os
+import sys
+import gzip
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+
+COLUMNS = [
+    'request_id', 'donation_id', 'requester_id', 'quantity_requested', 'purpose', 'status',
+    'created_at', 'updated_at', 'requester_name', 'requester_email', 'food_item', 'donor_id',
+    'donation_image',
+]
+
+
+def make_tuples(n):
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    return tuple((
+        i, 1000 + i % 300, 1 + i % 500, 1 + i % 9, 'Community kitchen', 'pending',
+        created + timedelta(minutes=i), created + timedelta(minutes=i, seconds=5),
+        f'Requester {i % 500}', f'requester{i % 500}@example.org', f'Item {i % 40}', 1 + i % 200,
+        f'{i:032x}_rice.jpg',
+    ) for i in range(n))
+
+
+def objects(rows):
+    # What DictCursor does for every fetched row
+    data = [dict(zip(COLUMNS, row)) for row in rows]
+    return json_codec.dumps({'status': 'success', 'message': 'Requests retrieved successfully', 'data': data})
+
+
+def columnar_rows(rows):
+    data = {'columns': COLUMNS, 'rows': rows}
+    return json_codec.dumps({'status': 'success', 'message': 'Requests retrieved successfully', 'data': data})
+
+
+def columnar_columns(rows):
+    data = {'columns': COLUMNS, 'values': [list(column) for column in zip(*rows)]}
+    return json_codec.dumps({'status': 'success', 'message': 'Requests retrieved successfully', 'data': data})
+
+
+def measure(label, fn, rows, number=20, repeat=5):
+    fn(rows)  # warm up
+    best = min(timeit.repeat(lambda: fn(rows), number=number, repeat=repeat)) / number
+    tracemalloc.start()
+    body = fn(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<18}{len(body):>10}{len(gzip.compress(body, 6)):>10}{best * 1000:>11.3f}{peak / 1024:>12.1f}")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rows = make_tuples(n)
+    print(f"{n} request rows, {len(COLUMNS)} columns, encoder {json_codec.get_encoder().name}\n")
+    print(f"{'format':<18}{'bytes':>10}{'gzip':>10}{'ms':>11}{'peak KiB':>12}")
+    measure('objects', objects, rows)
+    measure('columnar rows', columnar_rows, rows)
+    measure('columnar columns', columnar_columns, rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+
+"""
+Benchmark CPU time against bytes on the wire per encoding and level.
+
+Compresses a donations list response (the same rows as bench_json.py) with
+every installed codec at a range of levels. For each it reports the
+compressed size, the ratio, the time per response and the throughput, and
+the egress cost per million responses at --price dollars per GB. Pick the
+level where the saved bytes stop paying for the extra CPU.
+
+Usage:
+    python benchmarks/bench_compression.py [--rows 200] [--price 0.09]
+"""
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+import compression  # noqa: E402
+from bench_json import make_donations  # noqa: E402
+
+LEVELS = {
+    'gzip': (compression.Gzip, [1, 3, 6, 9]),
+    'br': (compression.Brotli, [1, 4, 6, 9, 11]),
+    'zstd': (compression.Zstd, [1, 3, 6, 12, 19]),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=200)
+    parser.add_argument('--price', type=float, default=0.09, help="egress $ per GB")
+    args = parser.parse_args()
+
+    envelope = {'status': 'success', 'message': 'Donations retrieved successfully',
+                'data': make_donations(args.rows)}
+    body = json_codec.dumps(envelope)
+    per_million = lambda size: size * 1_000_000 / 1e9 * args.price  # noqa: E731
+
+    print(f"{args.rows}-donation response, {len(body)} bytes uncompressed "
+          f"(${per_million(len(body)):.2f} per million at ${args.price}/GB)\n")
+    print(f"{'codec':<8}{'level':>6}{'bytes':>10}{'ratio':>8}{'ms/resp':>10}{'MB/s':>9}{'$/M resp':>10}")
+
+    for name, (codec_class, levels) in LEVELS.items():
+        if name not in compression.codecs:
+            print(f"{name:<8} skipped: library not installed")
+            continue
+        for level in levels:
+            codec = codec_class(level)
+            size = len(codec.compress(body))
+            number = max(1, int(2_000_000 / len(body)))
+            seconds = min(timeit.repeat(lambda: codec.compress(body), number=number, repeat=3)) / number
+            print(f"{name:<8}{level:>6}{size:>10}{len(body) / size:>8.1f}{seconds * 1000:>10.3f}"
+                  f"{len(body) / seconds / 1e6:>9.1f}{per_million(size):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
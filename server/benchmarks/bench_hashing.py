@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+
+"""
+Benchmark serial bcrypt hashing against the hashing process pool.
+
+Hashes the same passwords one after another in this process, then with
+hashing.hash_many across HASH_WORKERS processes. Reports the time per batch
+and per hash, and extrapolates to a 5,000-user onboarding upload. The pool's
+start-up cost is measured separately so it is not counted per batch.
+
+Usage:
+    HASH_WORKERS=8 python benchmarks/bench_hashing.py [count]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hashing  # noqa: E402
+
+
+def report(label, count, seconds):
+    print(f"{label:<22}{seconds:>9.2f} s{seconds / count * 1000:>10.1f} ms/hash"
+          f"{seconds / count * 5000 / 60:>10.1f} min per 5,000")
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    passwords = [f'password-{i}' for i in range(count)]
+    print(f"{count} passwords, {hashing.HASH_WORKERS} hash workers\n")
+
+    started = time.perf_counter()
+    for password in passwords:
+        hashing.hash_password(password)
+    report('serial', count, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    hashing.hash_many(passwords[:2])
+    print(f"{'pool start-up':<22}{time.perf_counter() - started:>9.2f} s")
+
+    started = time.perf_counter()
+    hashing.hash_many(passwords)
+    report('process pool', count, time.perf_counter() - started)
+
+
+if __name__ == '__main__':
+    main()
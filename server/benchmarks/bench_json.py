@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Benchmark JSON encoding of a 1,000-donation list response.
+
+Compares the previous jsonify path (stdlib json with Flask's default hooks
+and sorted keys) against the json_codec backends, and a cached payload
+spliced into the envelope with dumps_envelope. Reports the best time per
+encode and the peak traced allocation.
+
+Usage:
+    python benchmarks/bench_json.py [rows]
+"""
+
+import os
+import sys
+import json
+import timeit
+import tracemalloc
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import json_codec  # noqa: E402
+from werkzeug.http import http_date  # noqa: E402
+
+
+def make_donations(n):
+    created = datetime(2024, 1, 1, 12, 0, 0)
+    return [{
+        'donation_id': i,
+        'food_item': f'Item {i % 40}',
+        'quantity': 10 + i % 25,
+        'expiry_date': date(2024, 2, 1) + timedelta(days=i % 30),
+        'description': 'Freshly cooked, packed in sealed containers',
+        'status': 'available',
+        'donor_id': 1 + i % 200,
+        'donation_image': f'/uploads/donation_images/{i:032x}_rice.jpg',
+        'created_at': created + timedelta(minutes=i),
+        'updated_at': created + timedelta(minutes=i, seconds=30),
+        'donor_name': f'Donor {1 + i % 200}',
+        'total_value': Decimal('125.50'),
+    } for i in range(n)]
+
+
+def flask_default(o):
+    """Flask's DefaultJSONProvider fallback"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, Decimal):
+        return str(o)
+    raise TypeError(type(o).__name__)
+
+
+def flask_jsonify_equivalent(envelope):
+    """What jsonify did: stdlib json, Flask default hook, sorted compact keys"""
+    return json.dumps(
+        envelope, default=flask_default, sort_keys=True, separators=(',', ':')
+    ).encode('utf-8')
+
+
+def measure(label, fn, number=20, repeat=5):
+    fn()  # warm up
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    size = len(fn())
+    print(f"{label:<32} {best * 1000:9.3f} ms  {peak / 1024:9.1f} KiB peak  {size:9d} bytes")
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    donations = make_donations(rows)
+    envelope = {'status': 'success', 'message': 'Donations retrieved successfully', 'data': donations}
+    bare = {'status': 'success', 'message': 'Donations retrieved successfully'}
+
+    print(f"Encoding a {rows}-donation response\n")
+    measure('jsonify equivalent', lambda: flask_jsonify_equivalent(envelope))
+
+    for name in json_codec.ENCODERS:
+        for fmt in ('http', 'iso'):
+            try:
+                encoder = json_codec.create_encoder(name, fmt)
+            except RuntimeError as e:
+                print(f"{name}/{fmt:<25} skipped: {e}")
+                continue
+            measure(f'{name}/{fmt}', lambda: encoder.dumps(envelope))
+
+    json_codec.set_encoder('auto')
+    cached = json_codec.dumps(donations)
+    measure('pre-serialized envelope', lambda: json_codec.dumps_envelope(bare, raw_data=cached))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+"""
+Benchmark recommendation ranking at feed scale.
+
+Builds a donation_feed snapshot of synthetic available donations and a
+request history for synthetic users. It then times:
+
+  * the batch job's reduction of (user, item, weight) rows to each user's
+    top items (recommendations.top_items);
+  * the per-snapshot donation scores, computed once per version and day;
+  * one ranked top-20 per request for a sample of users, with the
+    vectorized Ranker and with a plain Python loop over the rows.
+
+Usage:
+    python benchmarks/bench_recommendations.py [donations] [users]
+"""
+
+import os
+import sys
+import time
+import heapq
+import math
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import donation_feed  # noqa: E402
+import recommendations  # noqa: E402
+
+ITEMS = 500
+SAMPLE_USERS = 2000
+PYTHON_USERS = 20
+LIMIT = 20
+
+
+def make_rows(n, today):
+    rng = random.Random(1)
+    return [{
+        'donation_id': i + 1,
+        'food_item': f"{'Item' if i % 7 else 'item'} {rng.randrange(ITEMS)}",
+        'quantity': rng.randint(1, 200),
+        'expiry_date': today + timedelta(days=rng.randint(-2, 30)),
+        'created_at': datetime.combine(today, datetime.min.time()) - timedelta(minutes=rng.randrange(60 * 24 * 30)),
+        'donor_id': rng.randrange(5000),
+        'donation_image': None,
+    } for i in range(n)]
+
+
+def make_history(users, rng):
+    """One row per (user, item) with a decayed request weight, ~8 items per user"""
+    counts = rng.poisson(8, users)
+    user_ids = np.repeat(np.arange(1, users + 1), counts)
+    items = rng.integers(0, ITEMS, len(user_ids))
+    weights = rng.exponential(1.0, len(user_ids))
+    return user_ids, items, weights
+
+
+def python_top(rows, preferences, today, limit):
+    weights = recommendations.WEIGHTS
+    max_quantity = math.log1p(max(row['quantity'] for row in rows))
+    midnight = datetime.combine(today, datetime.min.time())
+    scored = []
+    for row in rows:
+        days_left = (row['expiry_date'] - today).days
+        if days_left < 0:
+            continue
+        age_days = max((midnight - row['created_at']).total_seconds() / 86400, 0)
+        score = (weights['urgency'] * math.exp(-days_left / recommendations.URGENCY_DAYS)
+                 + weights['quantity'] * math.log1p(row['quantity']) / max_quantity
+                 + weights['freshness'] * math.exp(-age_days / recommendations.FRESHNESS_DAYS)
+                 + weights['affinity'] * preferences.get(row['food_item'].strip().lower(), 0.0))
+        scored.append((score, row['donation_id'], row))
+    return heapq.nlargest(limit, scored, key=lambda s: (s[0], s[1]))
+
+
+def percentile(samples, p):
+    return sorted(samples)[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+def main():
+    donations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 100_000
+    today = date.today()
+    rng = np.random.default_rng(1)
+
+    rows = make_rows(donations, today)
+    vocabulary = donation_feed.Vocabulary()
+    snapshot = donation_feed.Snapshot(1, rows, vocabulary, datetime.now())
+    print(f"{donations:,} donations, {users:,} users, top {LIMIT}\n")
+
+    user_ids, items, weights = make_history(users, rng)
+    started = time.perf_counter()
+    keep, scaled = recommendations.top_items(user_ids, weights)
+    print(f"{'preference batch':<26}{(time.perf_counter() - started) * 1000:>9.1f} ms"
+          f"   ({len(user_ids):,} rows -> {len(keep):,})")
+
+    preferences = {}
+    sample = set(rng.choice(np.arange(1, users + 1), min(SAMPLE_USERS, users), replace=False).tolist())
+    for i, weight in zip(keep.tolist(), scaled.tolist()):
+        user_id = int(user_ids[i])
+        if user_id in sample:
+            preferences.setdefault(user_id, {})[f"item {items[i]}"] = weight
+
+    ranker = recommendations.Ranker()
+    started = time.perf_counter()
+    ranker.base_scores(snapshot, today)
+    print(f"{'base scores (per version)':<26}{(time.perf_counter() - started) * 1000:>9.1f} ms")
+
+    timings = []
+    for prefs in preferences.values():
+        started = time.perf_counter()
+        ranker.top(snapshot, vocabulary, prefs, LIMIT, today)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{'vectorized per request':<26}{percentile(timings, 50):>9.2f} ms p50"
+          f"{percentile(timings, 99):>9.2f} ms p99   ({len(timings):,} users)")
+
+    timings = []
+    for prefs in list(preferences.values())[:PYTHON_USERS]:
+        started = time.perf_counter()
+        python_top(rows, prefs, today, LIMIT)
+        timings.append((time.perf_counter() - started) * 1000)
+    print(f"{'python loop per request':<26}{percentile(timings, 50):>9.2f} ms p50"
+          f"{percentile(timings, 99):>9.2f} ms p99   ({len(timings):,} users)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+
+"""
+Benchmark serve.py against the development runner (app.run).
+
+Starts each runner in a subprocess on the same app, then drives it with
+closed-loop client threads spread over one process per CPU (one
+connection per request, as both servers close after each response). Reports throughput and p50/p99 latency.
+
+The default path "/" needs no database; point --path at an API route
+(e.g. /api/leaderboard) to include MySQL work.
+
+Usage:
+    python benchmarks/bench_serving.py [--path /] [--clients 32] [--seconds 10] [--workers 4]
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+import subprocess
+import http.client
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEV_RUNNER = (
+    "import os; from app import create_app; "
+    "create_app().run(host='127.0.0.1', port=int(os.environ['PORT']), "
+    "debug=os.getenv('FLASK_DEBUG', 'True').lower() == 'true', use_reloader=False)"
+)
+
+
+def start(name, port, workers):
+    env = dict(os.environ, PORT=str(port), SERVE_HOST='127.0.0.1', SERVE_WORKERS=str(workers))
+    env.setdefault('SECRET_KEY', 'benchmark-secret-key')
+    if name == 'app.run':
+        args = [sys.executable, '-c', DEV_RUNNER]
+    else:
+        args = [sys.executable, 'serve.py']
+    return subprocess.Popen(args, cwd=SERVER_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_up(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def _drive_process(job):
+    port, path, clients, stop_at = job
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client():
+        mine, failed = [], 0
+        while time.time() < stop_at:
+            started = time.perf_counter()
+            try:
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                if response.status >= 500:
+                    failed += 1
+                    continue
+            except OSError:
+                failed += 1
+                continue
+            mine.append(time.perf_counter() - started)
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors[0]
+
+
+def drive(port, path, clients, seconds):
+    """Spread the client threads over processes so the load generator isn't GIL-bound"""
+    processes = max(1, min(clients, os.cpu_count() or 1))
+    stop_at = time.time() + seconds
+    jobs = [(port, path, clients // processes + (i < clients % processes), stop_at) for i in range(processes)]
+    with multiprocessing.Pool(processes) as pool:
+        results = pool.map(_drive_process, jobs)
+    latencies = sorted(l for result, _ in results for l in result)
+    return latencies, sum(errors for _, errors in results)
+
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--path', default='/')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--port', type=int, default=5801)
+    args = parser.parse_args()
+
+    print(f"GET {args.path}, {args.clients} clients, {args.seconds:g}s each")
+    print(f"{'runner':<24}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for i, name in enumerate(('app.run', 'serve.py')):
+        port = args.port + i
+        proc = start(name, port, args.workers)
+        try:
+            wait_until_up(port)
+            latencies, errors = drive(port, args.path, args.clients, args.seconds)
+        finally:
+            proc.terminate()
+            proc.wait()
+        label = name if name == 'app.run' else f"serve.py ({args.workers} workers)"
+        print(f"{label:<24}{len(latencies) / args.seconds:>10.0f}"
+              f"{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}{errors:>8}")
+
+
+if __name__ == '__main__':
+    main()
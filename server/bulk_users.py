@@ -0,0 +1,245 @@
+"""
+Bulk user registration for NGO onboarding.
+
+An upload can hold BULK_REGISTER_MAX_ROWS users, and bcrypt makes each one
+cost a good fraction of a second, so uploads run as background jobs.
+``submit`` checks the upload, records a row in ``bulk_register_jobs`` and
+queues the work on this worker's BULK_JOB_WORKERS job threads. The route
+answers 202 with the job id. ``get_job`` reads the job back from MySQL, so
+any worker can answer the status poll. A job reports how many rows it has
+processed as it goes. A running job with no progress for
+BULK_JOB_STALE_SECONDS (its worker was stopped) is reported as failed.
+
+``register_users`` takes parsed rows, either from a JSON list or from a CSV
+with a header line. It returns a per-row report. Rows go through these steps:
+
+1. Validation: required fields, the email, phone and password patterns,
+   allowed roles, and duplicates within the upload.
+2. Existing emails are rejected before any hashing. The registered-emails
+   Bloom filter clears most of them without a query; the "maybe" ones are
+   checked in chunked ``IN`` lookups.
+3. Rows go in BULK_INSERT_BATCH at a time. Each batch's passwords are
+   hashed in parallel across the hashing process pool, then the batch is
+   inserted in one transaction with one multi-row INSERT. If a batch hits
+   a duplicate (a concurrent registration), it is replayed row by row so
+   only the offending rows fail.
+"""
+
+import os
+import io
+import csv
+import json
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import MySQLdb
+import db
+import hashing
+import metrics
+from email_filter import registered_emails, normalize_email
+from utils import validate_email, validate_password, validate_phone
+
+logger = logging.getLogger(__name__)
+
+MAX_ROWS = int(os.getenv('BULK_REGISTER_MAX_ROWS', 10000))
+INSERT_BATCH = int(os.getenv('BULK_INSERT_BATCH', 500))
+LOOKUP_CHUNK = 1000
+JOB_WORKERS = int(os.getenv('BULK_JOB_WORKERS', 1))
+JOB_STALE_SECONDS = int(os.getenv('BULK_JOB_STALE_SECONDS', 900))
+
+FIELDS = ('email', 'password', 'full_name', 'phone_number', 'address', 'role')
+REQUIRED = ('email', 'password', 'full_name', 'phone_number', 'address')
+ALLOWED_ROLES = {'consumer', 'donor'}
+DEFAULT_ROLE = 'consumer'
+
+INSERT_QUERY = """
+    INSERT INTO users (email, password, full_name, phone_number, address, role)
+    VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+
+class UploadError(ValueError):
+    """The upload as a whole could not be read"""
+
+
+def parse_csv(text):
+    reader = csv.DictReader(io.StringIO(text))
+    if not reader.fieldnames or 'email' not in [f.strip() for f in reader.fieldnames]:
+        raise UploadError('CSV needs a header row including email')
+    rows = []
+    for row in reader:
+        rows.append({(k or '').strip(): (v or '').strip() for k, v in row.items()})
+        if len(rows) > MAX_ROWS:
+            break
+    return rows
+
+
+def _validate(row, seen):
+    """The row cleaned for insertion, or an error message"""
+    if not isinstance(row, dict):
+        return None, 'Row must be an object'
+    values = {k: str(row.get(k) or '').strip() for k in FIELDS}
+    values['password'] = str(row.get('password') or '')
+    missing = [k for k in REQUIRED if not values[k]]
+    if missing:
+        return None, f"Missing fields: {', '.join(missing)}"
+    if not validate_email(values['email']):
+        return None, 'Invalid email'
+    if not validate_phone(values['phone_number']):
+        return None, 'Invalid phone number'
+    if not validate_password(values['password']):
+        return None, 'Password too short'
+    values['role'] = values['role'] or DEFAULT_ROLE
+    if values['role'] not in ALLOWED_ROLES:
+        return None, f'Role must be one of: {sorted(ALLOWED_ROLES)}'
+    key = normalize_email(values['email'])
+    if key in seen:
+        return None, f'Duplicate of row {seen[key]} in this upload'
+    return values, None
+
+
+def _existing_emails(emails):
+    """Normalized emails among ``emails`` that already belong to a user"""
+    candidates = [e for e in emails if registered_emails.might_contain(e)]
+    existing = set()
+    for i in range(0, len(candidates), LOOKUP_CHUNK):
+        chunk = candidates[i:i + LOOKUP_CHUNK]
+        placeholders = ', '.join(['%s'] * len(chunk))
+        rows = db.fetch_all(f"SELECT email FROM users WHERE email IN ({placeholders})", tuple(chunk))
+        existing.update(normalize_email(row['email']) for row in rows)
+    return existing
+
+
+def _insert_batch(batch, errors):
+    """Insert (row number, values) pairs; returns how many were created"""
+    params = [tuple(values[k] for k in FIELDS) for _, values in batch]
+    try:
+        with db.transaction():
+            db.insert_many(INSERT_QUERY, params)
+        return len(batch)
+    except MySQLdb.IntegrityError:
+        metrics.incr('bulk_users.batch_replays')
+
+    created = 0
+    for (number, values), row_params in zip(batch, params):
+        try:
+            db.insert(INSERT_QUERY, row_params)
+            created += 1
+        except MySQLdb.IntegrityError as e:
+            error = 'Email already registered' if db.is_duplicate(e) else f'Could not be inserted: {e}'
+            errors.append({'row': number, 'email': values['email'], 'error': error})
+    return created
+
+
+def check_upload(rows):
+    if not isinstance(rows, list) or not rows:
+        raise UploadError('No users in the upload')
+    if len(rows) > MAX_ROWS:
+        raise UploadError(f'At most {MAX_ROWS} users per upload')
+
+
+def register_users(rows, progress=None):
+    """Validate, hash and insert ``rows``; returns the report.
+
+    ``progress(rows processed)`` is called after each insert batch.
+    """
+    check_upload(rows)
+
+    errors, valid, seen = [], [], {}
+    for number, row in enumerate(rows, start=1):
+        values, error = _validate(row, seen)
+        if error:
+            errors.append({'row': number, 'email': row.get('email') if isinstance(row, dict) else None, 'error': error})
+            continue
+        seen[normalize_email(values['email'])] = number
+        valid.append((number, values))
+
+    existing = _existing_emails([values['email'] for _, values in valid])
+    if existing:
+        for number, values in valid:
+            if normalize_email(values['email']) in existing:
+                errors.append({'row': number, 'email': values['email'], 'error': 'Email already registered'})
+        valid = [(n, v) for n, v in valid if normalize_email(v['email']) not in existing]
+
+    created = 0
+    for i in range(0, len(valid), INSERT_BATCH):
+        batch = valid[i:i + INSERT_BATCH]
+        hashed = hashing.hash_many([values['password'] for _, values in batch])
+        for (_, values), password_hash in zip(batch, hashed):
+            values['password'] = password_hash
+        created += _insert_batch(batch, errors)
+        if progress:
+            progress(len(rows) - len(valid) + i + len(batch))
+
+    failed = {e['row'] for e in errors}
+    for number, values in valid:
+        if number not in failed:
+            registered_emails.add(values['email'])
+
+    errors.sort(key=lambda e: e['row'])
+    metrics.incr('bulk_users.created', created)
+    metrics.incr('bulk_users.failed', len(errors))
+    return {'total': len(rows), 'created': created, 'failed': len(errors), 'errors': errors}
+
+
+# -- background jobs -------------------------------------------------------
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _executor_pid
+    with _executor_lock:
+        # Threads don't survive fork; each worker starts its own
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix='bulk-register')
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def submit(app, user_id, rows):
+    """Queue ``rows`` for registration; returns the job id"""
+    check_upload(rows)
+    job_id = uuid.uuid4().hex
+    db.insert("INSERT INTO bulk_register_jobs (job_id, user_id, total) VALUES (%s, %s, %s)",
+              (job_id, user_id, len(rows)))
+    _get_executor().submit(_run_job, app, job_id, rows)
+    metrics.incr('bulk_users.jobs')
+    return job_id
+
+
+def _run_job(app, job_id, rows):
+    with app.app_context():
+        try:
+            db.update("UPDATE bulk_register_jobs SET status = 'running' WHERE job_id = %s", (job_id,))
+            report = register_users(rows, progress=lambda processed: db.update(
+                "UPDATE bulk_register_jobs SET processed = %s WHERE job_id = %s", (processed, job_id)))
+            db.update(
+                "UPDATE bulk_register_jobs SET status = 'done', processed = %s, report = %s WHERE job_id = %s",
+                (report['total'], json.dumps(report, default=str), job_id)
+            )
+        except Exception as e:
+            metrics.incr('bulk_users.job_failures')
+            logger.error("Bulk registration job %s failed: %s", job_id, e)
+            db.update("UPDATE bulk_register_jobs SET status = 'failed', error = %s WHERE job_id = %s",
+                      (str(e)[:255], job_id))
+
+
+def get_job(job_id):
+    """The job's status, progress and (once done) report, or None"""
+    job = db.fetch_one(
+        """SELECT job_id, user_id, status, total, processed, report, error, created_at, updated_at,
+                  TIMESTAMPDIFF(SECOND, updated_at, NOW()) AS idle_seconds
+           FROM bulk_register_jobs WHERE job_id = %s""",
+        (job_id,)
+    )
+    if not job:
+        return None
+    idle_seconds = job.pop('idle_seconds')
+    if job['status'] == 'running' and idle_seconds > JOB_STALE_SECONDS:
+        job['status'], job['error'] = 'failed', 'The job stopped making progress; upload again'
+    job['report'] = json.loads(job['report']) if job['report'] else None
+    return job
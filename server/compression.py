@@ -0,0 +1,225 @@
+"""
+Response compression negotiated from Accept-Encoding.
+
+Every encoding whose library is installed is offered: gzip (stdlib),
+brotli (``brotli``) and zstd (``zstandard``). The best one the client
+accepts wins, with ties going to COMPRESSION_ENCODINGS order. Bodies smaller
+than COMPRESSION_MIN_SIZE, non-text types (image uploads are already
+compressed), file passthroughs and responses that already carry a
+Content-Encoding go out unchanged.
+
+Streamed responses (e.g. the SSE stream) are compressed chunk by chunk,
+with a sync flush after every chunk so events are not held back.
+
+Compressed bodies of responses with an ETag are kept in a small LRU keyed
+by ETag, encoding and a hash of the body. A repeat of a cached payload
+(e.g. the leaderboard) skips the compression work. ETags become weak,
+since the compressed bytes differ from the identity encoding.
+
+benchmarks/bench_compression.py compares CPU time and bytes per level.
+"""
+
+import os
+import time
+import zlib
+import threading
+from collections import OrderedDict
+from flask import request
+import metrics
+
+try:
+    import brotli
+except ImportError:  # optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+ENABLED = os.getenv('COMPRESSION_ENABLED', 'true').lower() == 'true'
+MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', 1024))
+PREFERENCE = [e.strip() for e in os.getenv('COMPRESSION_ENCODINGS', 'zstd,br,gzip').split(',') if e.strip()]
+CACHE_SIZE = int(os.getenv('COMPRESSION_CACHE_SIZE', 256))
+CACHE_MAX_BODY = int(os.getenv('COMPRESSION_CACHE_MAX_BODY', 1024 * 1024))
+
+COMPRESSIBLE_TYPES = {'application/json', 'application/javascript', 'application/xml', 'image/svg+xml'}
+
+
+class Gzip:
+    name = 'gzip'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        return compressor.compress(data) + compressor.flush()
+
+    def stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class Brotli:
+    name = 'br'
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            data = compressor.process(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class Zstd:
+    name = 'zstd'
+
+    def __init__(self, level):
+        self.level = level
+        self._local = threading.local()
+
+    def _compressor(self):
+        # ZstdCompressor instances are not thread-safe; keep one per thread
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level)
+        return compressor
+
+    def compress(self, data):
+        return self._compressor().compress(data)
+
+    def stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+def available_codecs():
+    codecs = {'gzip': Gzip(int(os.getenv('COMPRESSION_GZIP_LEVEL', 6)))}
+    if brotli is not None:
+        codecs['br'] = Brotli(int(os.getenv('COMPRESSION_BROTLI_LEVEL', 4)))
+    if zstandard is not None:
+        codecs['zstd'] = Zstd(int(os.getenv('COMPRESSION_ZSTD_LEVEL', 3)))
+    return codecs
+
+
+codecs = available_codecs()
+
+
+class CompressedCache:
+    """LRU of compressed bodies keyed by (ETag, encoding, body hash)"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+cache = CompressedCache(CACHE_SIZE)
+
+
+def negotiate(accept_encodings):
+    """The encoding to use for this request, or None for identity"""
+    best, best_quality = None, 0
+    for name in PREFERENCE:
+        if name not in codecs:
+            continue
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = name, quality
+    return best
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 304):
+        return False
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return False
+    mimetype = response.mimetype or ''
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def _as_bytes(chunks):
+    for chunk in chunks:
+        yield chunk.encode('utf-8') if isinstance(chunk, str) else chunk
+
+
+def compress_response(response):
+    if response.status_code == 304:
+        # Revalidation of a compressed representation: echo the weak ETag it was sent with
+        etag, weak = response.get_etag()
+        if etag and not weak and negotiate(request.accept_encodings):
+            response.set_etag(etag, weak=True)
+        return response
+    if not _compressible(response):
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+    codec = codecs[encoding]
+
+    if response.is_streamed:
+        response.response = codec.stream(_as_bytes(response.response))
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        metrics.incr('compression.streams', encoding=encoding)
+        return response
+
+    body = response.get_data()
+    if len(body) < MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    key = (etag, encoding, len(body), hash(body)) if etag and len(body) <= CACHE_MAX_BODY else None
+    compressed = cache.get(key) if key else None
+    if compressed is None:
+        started = time.perf_counter()
+        compressed = codec.compress(body)
+        metrics.observe('compression.compress', time.perf_counter() - started, encoding=encoding)
+        if key:
+            cache.put(key, compressed)
+    else:
+        metrics.incr('compression.cache_hits', encoding=encoding)
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    metrics.incr('compression.bytes_in', len(body), encoding=encoding)
+    metrics.incr('compression.bytes_out', len(compressed), encoding=encoding)
+    return response
+
+
+def init_app(app):
+    if ENABLED:
+        app.after_request(compress_response)
@@ -11,3 +11,8 @@ MYSQL_CONFIG = {
 UPLOAD_FOLDER = 'uploads/'
 PROFILE_PICTURES_FOLDER = 'uploads/profile_pictures/'
 DONATION_IMAGES_FOLDER = 'uploads/donation_images/'
+
+# Browser origins allowed to call the API (the Flask app and asgi.py)
+CORS_ORIGINS = ["http://localhost:3000", "https://food-for-all-bharat-hackathon.vercel.app"]
+CORS_METHODS = ["GET", "POST", "PUT", "DELETE", "OPTIONS"]
+CORS_HEADERS = ["Content-Type", "Authorization"]
@@ -1,33 +1,438 @@
 import os
+import re
+import mmap
+import time
+import heapq
+import struct
+import queue
+import socket
+import hashlib
 import logging
-from flask import g
+import threading
+import multiprocessing
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, request, has_request_context
 from flask_mysqldb import MySQL
+import MySQLdb
+import MySQLdb.cursors
 from dotenv import load_dotenv
+import metrics
 
 load_dotenv()
 
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 mysql = MySQL()
 _initialized = False
 
+# Read replicas (MYSQL_REPLICAS="host:port,host:port") share the primary's credentials
+READ_YOUR_WRITES_SECONDS = float(os.getenv('READ_YOUR_WRITES_SECONDS', 5))
+READ_YOUR_WRITES_SLOTS = int(os.getenv('READ_YOUR_WRITES_SLOTS', 16384))
+REPLICA_COOLDOWN_SECONDS = float(os.getenv('REPLICA_COOLDOWN_SECONDS', 30))
+
+# Client errors that mean the server is unreachable rather than the query being bad
+CONNECTION_ERRORS = {2002, 2003, 2006, 2013}
+
+# Idle connections kept per server; 0 falls back to one flask_mysqldb connection per request
+POOL_SIZE = int(os.getenv('MYSQL_POOL_SIZE', 10))
+POOL_PING_AFTER_SECONDS = 30
+
+# Server-side prepared statements for call sites that pass prepare=True. Off by
+# default: each parameterized call costs an extra round trip (see StatementCache),
+# which only pays off where parsing dominates, so measure before turning it on
+PREPARED_STATEMENTS = os.getenv('MYSQL_PREPARED_STATEMENTS', 'false').lower() == 'true'
+PREPARED_CACHE_SIZE = int(os.getenv('MYSQL_PREPARED_CACHE_SIZE', 64))
+UNKNOWN_PREPARED_STATEMENT = 1243
+
+# Client-side backstop for any single read off the socket, in seconds
+READ_TIMEOUT = int(os.getenv('MYSQL_READ_TIMEOUT', 30))
+
+# How long a budgeted read may stay blocked past its route's deadline before the
+# client cuts the connection, for servers that stop honouring MAX_EXECUTION_TIME
+CLIENT_DEADLINE_GRACE_SECONDS = float(os.getenv('MYSQL_CLIENT_DEADLINE_GRACE_SECONDS', 0.5))
+
+# ER_QUERY_TIMEOUT: a SELECT ran past its MAX_EXECUTION_TIME hint
+QUERY_TIMEOUT = 3024
+
+# ER_DUP_ENTRY: a unique key refused the row (other IntegrityErrors are NOT NULL, FK, ...)
+DUPLICATE_ENTRY = 1062
+
+# Statements slower than this are logged to the "db" logger; 0 disables
+SLOW_QUERY_MS = float(os.getenv('LOG_SLOW_QUERY_MS', 200))
+
+
+class ConnectionPool:
+    """Idle connections to one server, reused across requests.
+
+    Connections idle for longer than POOL_PING_AFTER_SECONDS are pinged before
+    reuse; at most ``size`` are kept and extra ones are closed on release.
+    """
+
+    def __init__(self, connect, size):
+        self._connect = connect
+        self._size = size
+        self._idle = queue.LifoQueue()
+
+    def acquire(self):
+        while True:
+            try:
+                conn, released_at = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - released_at < POOL_PING_AFTER_SECONDS:
+                return conn
+            try:
+                conn.ping()
+                return conn
+            except MySQLdb.Error:
+                _close_quietly(conn)
+
+    def release(self, conn, discard=False):
+        if not discard and self._idle.qsize() < self._size:
+            try:
+                conn.rollback()
+                self._idle.put((conn, time.monotonic()))
+                return
+            except MySQLdb.Error:
+                pass
+        _close_quietly(conn)
+
+    def clear(self):
+        """Close every idle connection (e.g. in a freshly forked worker)"""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            _close_quietly(conn)
+
+    def forget(self):
+        """Drop idle connections without closing them.
+
+        After fork the sockets are shared with the parent, and closing them
+        here would send COM_QUIT on the parent's sessions.
+        """
+        self._idle = queue.LifoQueue()
+
+
+class QueryTimeout(MySQLdb.OperationalError):
+    """A read ran out of the current route's DB time budget"""
+
+
+def _close_quietly(resource):
+    try:
+        if resource:
+            resource.close()
+    except MySQLdb.Error:
+        pass
+
+
+def fingerprint(query):
+    """Stable key for a SQL text, ignoring whitespace differences"""
+    return hashlib.sha1(' '.join(query.split()).encode('utf-8')).hexdigest()
+
+
+class StatementCache:
+    """Prepared statements on one connection, evicted least-recently-used.
+
+    mysqlclient has no binary-protocol API, so statements are prepared with SQL
+    PREPARE and run as ``SET @p0 = ..`` + ``EXECUTE .. USING @p0``: the server
+    skips parsing, at the cost of a second round trip for parameterized calls.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._statements = OrderedDict()
+
+    def execute(self, cursor, query, params):
+        key = fingerprint(query)
+        name = self._statements.get(key)
+        if name is not None:
+            self._statements.move_to_end(key)
+            metrics.incr('db.prepared_cache.hits')
+        else:
+            metrics.incr('db.prepared_cache.misses')
+            name = self._prepare(cursor, key, query)
+
+        try:
+            self._execute(cursor, name, params)
+        except MySQLdb.OperationalError as e:
+            if e.args[0] != UNKNOWN_PREPARED_STATEMENT:
+                raise
+            # Server forgot it (e.g. after a reconnect): prepare once more
+            self._statements.pop(key, None)
+            name = self._prepare(cursor, key, query)
+            self._execute(cursor, name, params)
+
+    def _prepare(self, cursor, key, query):
+        name = f"ps_{key[:16]}"
+        cursor.execute(f"PREPARE {name} FROM %s", (_to_placeholders(query),))
+        self._statements[key] = name
+        if len(self._statements) > self.capacity:
+            _, evicted = self._statements.popitem(last=False)
+            cursor.execute(f"DEALLOCATE PREPARE {evicted}")
+            metrics.incr('db.prepared_cache.evictions')
+        return name
+
+    @staticmethod
+    def _execute(cursor, name, params):
+        if params:
+            variables = [f"@p{i}" for i in range(len(params))]
+            cursor.execute("SET " + ", ".join(f"{v} = %s" for v in variables), tuple(params))
+            cursor.execute(f"EXECUTE {name} USING " + ", ".join(variables))
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+
+_PLACEHOLDER = re.compile(r'%(s|%)')
+
+
+def _to_placeholders(query):
+    """DB-API %s placeholders to server-side ? markers"""
+    return _PLACEHOLDER.sub(lambda m: '?' if m.group(1) == 's' else '%', query)
+
+
+def _statement_cache(conn):
+    cache = getattr(conn, 'statement_cache', None)
+    if cache is None:
+        cache = conn.statement_cache = StatementCache(PREPARED_CACHE_SIZE)
+    return cache
+
+
+@metrics.register_collector
+def _prepared_cache_hit_rate():
+    hits = metrics.get_counter('db.prepared_cache.hits')
+    misses = metrics.get_counter('db.prepared_cache.misses')
+    return {'db.prepared_cache.hit_rate': metrics.ratio(hits, hits + misses)}
+
+
+class Replica:
+    """A read replica and its health as seen from this process"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.in_use = 0
+        self.failures = 0
+        self.down_until = 0.0
+        self.pool = None
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+    def mark_down(self):
+        self.failures += 1
+        self.down_until = time.monotonic() + REPLICA_COOLDOWN_SECONDS
+
+    def mark_up(self):
+        self.failures = 0
+        self.down_until = 0.0
+
+    def connect(self, config):
+        return MySQLdb.connect(
+            host=self.host,
+            port=self.port,
+            user=config['MYSQL_USER'],
+            passwd=config['MYSQL_PASSWORD'],
+            db=config['MYSQL_DB'],
+            cursorclass=MySQLdb.cursors.DictCursor,
+            autocommit=True,
+            read_timeout=READ_TIMEOUT
+        )
+
+
+_pool = None
+_replicas = []
+_replica_lock = threading.Lock()
+_next_replica = 0
+
+
+
+class PinTable:
+    """user_id -> deadline until which that user's reads go to the primary.
+
+    Lives in an anonymous mmap created at import, so every worker forked from
+    a preloading master sees the pins the others set. Deadlines are
+    time.monotonic(), which is system-wide. A user hashes to a slot with a
+    short probe; when all of them are live, the one expiring first is taken.
+    """
+
+    ENTRY = struct.Struct('<qd')
+    PROBE = 4
+
+    def __init__(self, slots=READ_YOUR_WRITES_SLOTS):
+        self.slots = slots
+        self._map = mmap.mmap(-1, slots * self.ENTRY.size)
+        self._lock = multiprocessing.Lock()
+
+    def _offsets(self, user_id):
+        start = user_id % self.slots
+        return [((start + i) % self.slots) * self.ENTRY.size for i in range(self.PROBE)]
+
+    def pin(self, user_id, deadline):
+        with self._lock:
+            entries = [(offset,) + self.ENTRY.unpack_from(self._map, offset) for offset in self._offsets(user_id)]
+            mine = [e for e in entries if e[1] == user_id]
+            offset = (mine or [min(entries, key=lambda e: e[2])])[0][0]
+            self.ENTRY.pack_into(self._map, offset, user_id, deadline)
+
+    def pinned(self, user_id, now):
+        with self._lock:
+            for offset in self._offsets(user_id):
+                stored_id, deadline = self.ENTRY.unpack_from(self._map, offset)
+                if stored_id == user_id:
+                    return deadline > now
+        return False
+
+
+_pins = PinTable()
+
+
+class _Watch:
+    __slots__ = ('conn', 'fired')
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.fired = False
+
+
+class Watchdog:
+    """Cuts off budgeted reads still blocked after their deadline.
+
+    MAX_EXECUTION_TIME only helps while the server answers; a stalled server
+    or network would hold the read until MYSQL_READ_TIMEOUT. One thread per
+    process watches the armed reads and shuts down the socket of any that
+    outlive their deadline, so the blocked call fails at once with
+    CR_SERVER_LOST and the dead connection is dropped on release. The
+    shutdown happens under the lock, so a read that ``disarm`` reports as
+    fired is already cut off. Under gevent a blocking read stalls the whole
+    worker, watchdog included, and MYSQL_READ_TIMEOUT is the only bound.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._heap = []
+        self._pid = None
+
+    def arm(self, conn, expires_at):
+        watch = _Watch(conn)
+        with self._cond:
+            if self._pid != os.getpid():
+                # Threads don't survive fork; start (or restart) ours in this process
+                self._pid = os.getpid()
+                self._heap = []
+                threading.Thread(target=self._watch, name='db-watchdog', daemon=True).start()
+            heapq.heappush(self._heap, (expires_at, id(watch), watch))
+            self._cond.notify()
+        return watch
+
+    def disarm(self, watch):
+        """Stop watching; returns whether the read was cut off"""
+        with self._cond:
+            watch.conn = None
+            return watch.fired
+
+    def _watch(self):
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2].conn is None:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._cond.wait()
+                    continue
+                expires_at, _, watch = self._heap[0]
+                now = time.monotonic()
+                if expires_at > now:
+                    self._cond.wait(expires_at - now)
+                    continue
+                heapq.heappop(self._heap)
+                watch.fired = True
+                _cut_off(watch.conn)
+                watch.conn = None
+
+
+def _cut_off(conn):
+    """Shut down a connection's socket so a read blocked on it returns"""
+    try:
+        sock = socket.socket(fileno=os.dup(conn.fileno()))
+    except (AttributeError, OSError, MySQLdb.Error) as e:
+        logger.warning("Could not cut off an overdue read: %s", e)
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+    metrics.incr('db.client_timeouts')
+
+
+_watchdog = Watchdog()
+
+
+def parse_replicas(value):
+    replicas = []
+    for entry in filter(None, (e.strip() for e in value.split(','))):
+        host, _, port = entry.partition(':')
+        replicas.append(Replica(host, int(port or 3306)))
+    return replicas
+
+def _connect_primary(config):
+    return MySQLdb.connect(
+        host=config['MYSQL_HOST'],
+        port=config['MYSQL_PORT'],
+        user=config['MYSQL_USER'],
+        passwd=config['MYSQL_PASSWORD'],
+        db=config['MYSQL_DB'],
+        cursorclass=MySQLdb.cursors.DictCursor,
+        read_timeout=READ_TIMEOUT
+    )
+
 def init_app(app):
-    global _initialized
+    global _initialized, _pool, _replicas
     app.config['MYSQL_HOST'] = os.getenv('MYSQL_HOST', 'localhost')
+    app.config['MYSQL_PORT'] = int(os.getenv('MYSQL_PORT', 3306))
     app.config['MYSQL_USER'] = os.getenv('MYSQL_USER', 'root')
     app.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD', '')
     app.config['MYSQL_DB'] = os.getenv('MYSQL_DB', 'foodbank_ai')
     app.config['MYSQL_CURSORCLASS'] = 'DictCursor'
+    # The per-request fallback connection (MYSQL_POOL_SIZE=0) gets the same backstop
+    app.config.setdefault('MYSQL_CUSTOM_OPTIONS', {'read_timeout': READ_TIMEOUT})
+    app.config.setdefault('MYSQL_REPLICAS', os.getenv('MYSQL_REPLICAS', ''))
     mysql.init_app(app)
+    config = app.config
+    if POOL_SIZE > 0:
+        _pool = ConnectionPool(lambda: _connect_primary(config), POOL_SIZE)
+    _replicas = parse_replicas(app.config['MYSQL_REPLICAS'])
+    for replica in _replicas:
+        replica.pool = ConnectionPool(lambda r=replica: r.connect(config), POOL_SIZE or 1)
     _initialized = True
-    logger.info("✅ MySQL initialized")
+    logger.info("✅ MySQL initialized (%d read replica(s))", len(_replicas))
+
+def close_all():
+    """Close every pooled connection, e.g. in a pre-fork master before forking"""
+    if _pool is not None:
+        _pool.clear()
+    for replica in _replicas:
+        replica.pool.clear()
+
+def reset_after_fork():
+    """Give a freshly forked worker its own connections and routing state"""
+    global _replica_lock
+    if _pool is not None:
+        _pool.forget()
+    for replica in _replicas:
+        replica.pool.forget()
+        replica.in_use = 0
+    _replica_lock = threading.Lock()
 
 def get_db():
     if not _initialized:
         raise Exception("MySQL not initialized. Did you call init_app?")
     if 'db' not in g:
-        g.db = mysql.connection
+        g.db = _pool.acquire() if _pool is not None else mysql.connection
         if g.db is None:
             logger.error("❌ mysql.connection is None!")
     return g.db
@@ -38,38 +443,250 @@ def get_cursor():
     return g.cursor
 
 def close_db(e=None):
+    _release_replica()
     cursor = g.pop('cursor', None)
     if cursor:
         cursor.close()
     db = g.pop('db', None)
     if db:
-        db.close()
-        logger.info("✅ DB connection closed.")
+        if _pool is not None:
+            _pool.release(db, discard=e is not None)
+        else:
+            db.close()
+        logger.debug("DB connection closed")
 
-def execute_query(query, params=None, commit=False):
-    cursor = get_cursor()
+# ---------------------------------------------------------------------------
+# Read routing
+# ---------------------------------------------------------------------------
+
+def _current_user_id():
+    if has_request_context():
+        user = getattr(request, 'user', None)
+        if user:
+            return user.get('user_id')
+    return None
+
+def _pin_current_user():
+    """Send this user's reads to the primary until replicas have caught up"""
+    g.wrote = True
+    user_id = _current_user_id()
+    if user_id is not None:
+        _pins.pin(user_id, time.monotonic() + READ_YOUR_WRITES_SECONDS)
+
+def _must_read_primary():
+    if g.get('in_transaction') or g.get('wrote'):
+        return True
+    user_id = _current_user_id()
+    if user_id is None:
+        return False
+    return _pins.pinned(user_id, time.monotonic())
+
+def _choose_replica():
+    """Least in-flight healthy replica, rotating between ties"""
+    global _next_replica
+    with _replica_lock:
+        healthy = [r for r in _replicas if r.healthy]
+        if not healthy:
+            return None
+        _next_replica = (_next_replica + 1) % len(healthy)
+        rotated = healthy[_next_replica:] + healthy[:_next_replica]
+        replica = min(rotated, key=lambda r: r.in_use)
+        replica.in_use += 1
+        return replica
+
+def _release_replica(failed=False):
+    replica = g.pop('replica', None)
+    cursor = g.pop('replica_cursor', None)
+    conn = g.pop('replica_db', None)
+    if replica is None:
+        return
+    with _replica_lock:
+        replica.in_use -= 1
+        if failed:
+            replica.mark_down()
+    _close_quietly(cursor)
+    if conn:
+        replica.pool.release(conn, discard=failed)
+
+def get_read_cursor():
+    """Cursor on a replica for plain reads, or None to read from the primary"""
+    if not _replicas or _must_read_primary():
+        return None
+    if 'replica_cursor' in g:
+        return g.replica_cursor
+
+    replica = _choose_replica()
+    if replica is None:
+        return None
+    g.replica = replica
     try:
-        cursor.execute(query, params or ())
-        if commit:
-            get_db().commit()
+        g.replica_db = replica.pool.acquire()
+    except MySQLdb.OperationalError as e:
+        logger.warning("⚠️ Replica %s:%s unavailable: %s", replica.host, replica.port, e)
+        _release_replica(failed=True)
+        return None
+    replica.mark_up()
+    g.replica_cursor = g.replica_db.cursor()
+    return g.replica_cursor
+
+_SELECT = re.compile(r'\s*SELECT\b', re.IGNORECASE)
+
+def _budget_exceeded(message):
+    g.query_timed_out = True
+    metrics.incr('db.budget_overruns', route=request.endpoint if has_request_context() else None)
+    return QueryTimeout(QUERY_TIMEOUT, message)
+
+def _apply_budget(query, prepare):
+    """Add a MAX_EXECUTION_TIME hint for what is left of the route's budget.
+
+    Only plain SELECTs outside transactions are bounded; writes always run.
+    Prepared statements get the route's whole budget, so their text (and
+    cache entry) stays the same from one request to the next. Returns the
+    query and when the client should give up on it (None: never).
+    """
+    deadline = g.get('query_deadline')
+    if deadline is None or g.get('in_transaction') or not _SELECT.match(query):
+        return query, None
+    now = time.monotonic()
+    remaining = deadline - now
+    if remaining <= 0:
+        raise _budget_exceeded("Route DB time budget already spent")
+    budget_ms = g.query_budget_ms if prepare else max(1, int(remaining * 1000))
+    hinted = _SELECT.sub(lambda m: f"{m.group(0)} /*+ MAX_EXECUTION_TIME({budget_ms}) */", query, count=1)
+    return hinted, now + budget_ms / 1000 + CLIENT_DEADLINE_GRACE_SECONDS
+
+def _run(cursor, conn, query, params, prepare):
+    query, give_up_at = _apply_budget(query, prepare)
+    watch = _watchdog.arm(conn, give_up_at) if give_up_at is not None else None
+    started = time.perf_counter()
+    try:
+        if prepare and PREPARED_STATEMENTS:
+            _statement_cache(conn).execute(cursor, query, params)
+        else:
+            cursor.execute(query, params or ())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if SLOW_QUERY_MS and elapsed_ms >= SLOW_QUERY_MS:
+            logger.info("Slow query", extra={'fields': {
+                'ms': round(elapsed_ms, 2),
+                'fingerprint': fingerprint(query),
+                'statement': ' '.join(query.split())[:500],
+                'route': request.endpoint if has_request_context() else None,
+            }})
+    except MySQLdb.OperationalError as e:
+        if watch is not None and _watchdog.disarm(watch):
+            raise _budget_exceeded("Read cut off client-side after the route's DB time budget") from e
+        if e.args[0] == QUERY_TIMEOUT and not isinstance(e, QueryTimeout):
+            raise _budget_exceeded(str(e)) from e
+        raise
+    finally:
+        if watch is not None:
+            _watchdog.disarm(watch)
+
+def _read(query, params=None, prepare=False, tuples=False):
+    cursor = get_read_cursor()
+    if cursor is not None:
+        if tuples:
+            cursor = g.replica_db.cursor(MySQLdb.cursors.Cursor)
+        try:
+            _run(cursor, g.replica_db, query, params, prepare)
+            return cursor
+        except MySQLdb.OperationalError as e:
+            if tuples:
+                cursor.close()
+            if e.args[0] not in CONNECTION_ERRORS:
+                raise
+            logger.warning("⚠️ Replica read failed, retrying on primary: %s", e)
+            _release_replica(failed=True)
+    return execute_query(query, params, prepare=prepare, tuples=tuples)
+
+# ---------------------------------------------------------------------------
+# Primary
+# ---------------------------------------------------------------------------
+
+@contextmanager
+def transaction():
+    """Run the enclosed statements as one transaction on the primary"""
+    execute_query("START TRANSACTION")
+    try:
+        yield
+    except Exception:
+        execute_query("ROLLBACK")
+        raise
+    execute_query("COMMIT")
+
+def execute_query(query, params=None, commit=False, prepare=False, tuples=False):
+    """Run a statement on the primary.
+
+    ``prepare=True`` marks a static, hot statement for the prepared statement
+    cache; SQL assembled per request should leave it off and use the text protocol.
+    ``tuples=True`` runs it on a plain cursor that returns rows as tuples.
+    """
+    cursor = get_db().cursor(MySQLdb.cursors.Cursor) if tuples else get_cursor()
+    # Only transaction control statements are short enough to matter here
+    statement = query.strip().upper() if len(query) < 32 else ''
+    try:
+        _run(cursor, get_db(), query, params, prepare)
+        if statement == "START TRANSACTION":
+            g.in_transaction = True
+        elif statement in ("COMMIT", "ROLLBACK"):
+            g.in_transaction = False
+            if g.pop('pending_write', False) and statement == "COMMIT":
+                _pin_current_user()
+        elif commit:
+            if g.get('in_transaction'):
+                # Committed by the enclosing COMMIT
+                g.pending_write = True
+            else:
+                get_db().commit()
+                _pin_current_user()
         return cursor
     except Exception as e:
-        logger.error(f"❌ Query failed: {e}")
-        if commit:
+        logger.error("❌ Query failed: %s", e)
+        if commit and not g.get('in_transaction'):
             get_db().rollback()
         raise
 
-def fetch_one(query, params=None):
-    return execute_query(query, params).fetchone()
+def is_duplicate(error):
+    """True if ``error`` is a unique key violation"""
+    return isinstance(error, MySQLdb.IntegrityError) and bool(error.args) and error.args[0] == DUPLICATE_ENTRY
+
+def fetch_one(query, params=None, prepare=False):
+    return _read(query, params, prepare).fetchone()
+
+def fetch_all(query, params=None, prepare=False):
+    return _read(query, params, prepare).fetchall()
+
+def fetch_columns(query, params=None, prepare=False):
+    """Like fetch_all, but returns (column names, row tuples) without building a dict per row"""
+    cursor = _read(query, params, prepare, tuples=True)
+    # A plain cursor per call, unlike the shared dict cursor, so it is closed here
+    try:
+        return [column[0] for column in cursor.description], cursor.fetchall()
+    finally:
+        cursor.close()
 
-def fetch_all(query, params=None):
-    return execute_query(query, params).fetchall()
+def insert(query, params=None, prepare=False):
+    return execute_query(query, params, commit=True, prepare=prepare).lastrowid
 
-def insert(query, params=None):
-    return execute_query(query, params, commit=True).lastrowid
+def insert_many(query, rows):
+    """Insert many rows with one multi-row INSERT; returns the affected row count"""
+    cursor = get_cursor()
+    try:
+        cursor.executemany(query, rows)
+        if g.get('in_transaction'):
+            g.pending_write = True
+        else:
+            get_db().commit()
+            _pin_current_user()
+        return cursor.rowcount
+    except Exception as e:
+        logger.error("❌ Query failed: %s", e)
+        if not g.get('in_transaction'):
+            get_db().rollback()
+        raise
 
-def update(query, params=None):
-    return execute_query(query, params, commit=True).rowcount
+def update(query, params=None, prepare=False):
+    return execute_query(query, params, commit=True, prepare=prepare).rowcount
 
-def delete(query, params=None):
-    return execute_query(query, params, commit=True).rowcount
+def delete(query, params=None, prepare=False):
+    return execute_query(query, params, commit=True, prepare=prepare).rowcount
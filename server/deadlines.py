@@ -0,0 +1,138 @@
+"""
+Per-route DB time budgets and stale fallbacks for cacheable reads.
+
+Each request to an endpoint in ROUTE_BUDGETS_MS gets a deadline when it
+starts. ``db`` bounds every SELECT that runs before the deadline with a
+``MAX_EXECUTION_TIME`` hint set to the time left. It refuses new SELECTs
+after the deadline, and it counts each overrun as
+``db.budget_overruns{route=...}``. Writes and statements inside
+``db.transaction()`` are never cut short. The client enforces the same
+deadline: a budgeted read still blocked MYSQL_CLIENT_DEADLINE_GRACE_SECONDS
+after it has its connection cut off by ``db.Watchdog``, and MYSQL_READ_TIMEOUT
+bounds any single read off the socket, pooled or not.
+
+Budgets are in milliseconds. QUERY_BUDGETS overrides or adds entries
+(``"leaderboard.get_leaderboard=1500,donation.get_donations=800"``), and
+QUERY_BUDGET_DEFAULT_MS applies to every other endpoint (0 means
+unbounded).
+
+Views decorated with ``@stale_on_timeout`` remember their last good
+response per URL. When a later request for that URL runs out of budget,
+they serve the remembered response, marked with ``X-Served-Stale``,
+instead of the error.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from functools import wraps
+from flask import g, request, make_response
+import metrics
+
+ROUTE_BUDGETS_MS = {
+    'leaderboard.get_leaderboard': 2000,
+    'leaderboard.get_monthly_leaderboard': 2000,
+    'donation.get_donations': 1500,
+    'donation.get_donation': 500,
+    'request.list_pending_requests': 1500,
+    'request.get_my_requests': 1500,
+    'feedback.get_all_feedback': 3000,
+    'referral.get_all_referrals': 3000,
+    'stats.get_platform_stats': 500,
+    'analytics.get_daily_series': 2000,
+    'user.get_profile': 500,
+}
+DEFAULT_BUDGET_MS = int(os.getenv('QUERY_BUDGET_DEFAULT_MS', 0))
+
+STALE_CACHE_SIZE = int(os.getenv('STALE_CACHE_SIZE', 256))
+STALE_MAX_BODY = int(os.getenv('STALE_MAX_BODY', 1024 * 1024))
+# Headers replayed with a stale body; anything else is recomputed per response
+STALE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'X-Total-Count')
+
+
+def _parse_overrides(value):
+    budgets = {}
+    for entry in value.split(','):
+        endpoint, _, budget = entry.partition('=')
+        if endpoint.strip() and budget.strip():
+            budgets[endpoint.strip()] = int(budget)
+    return budgets
+
+
+ROUTE_BUDGETS_MS.update(_parse_overrides(os.getenv('QUERY_BUDGETS', '')))
+
+
+def budget_for(endpoint):
+    """Milliseconds of DB time allowed for one request to ``endpoint`` (0: unbounded)"""
+    return ROUTE_BUDGETS_MS.get(endpoint, DEFAULT_BUDGET_MS)
+
+
+def start_budget():
+    budget_ms = budget_for(request.endpoint)
+    if budget_ms > 0:
+        g.query_budget_ms = budget_ms
+        g.query_deadline = time.monotonic() + budget_ms / 1000
+    else:
+        # Batch sub-requests share the outer request's g
+        g.pop('query_deadline', None)
+    g.query_timed_out = False
+
+
+class StaleCache:
+    """LRU of the last good (headers, body, stored_at) per URL"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+stale_cache = StaleCache(STALE_CACHE_SIZE)
+
+
+def stale_on_timeout(view):
+    """Serve the last good response for this URL when the route runs out of DB time.
+
+    Only for views whose response depends on the URL alone, not on the caller.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        response = make_response(view(*args, **kwargs))
+        key = request.full_path
+        if response.status_code == 200 and not response.is_streamed:
+            body = response.get_data()
+            if len(body) <= STALE_MAX_BODY:
+                headers = [(k, response.headers[k]) for k in STALE_HEADERS if k in response.headers]
+                stale_cache.put(key, (headers, body, time.time()))
+        elif response.status_code >= 500 and g.get('query_timed_out'):
+            cached = stale_cache.get(key)
+            if cached is None:
+                metrics.incr('deadlines.stale_misses', route=request.endpoint)
+                response.status_code = 503
+                return response
+            headers, body, stored_at = cached
+            response = make_response(body, 200, headers)
+            response.headers['X-Served-Stale'] = '1'
+            response.headers['Age'] = str(int(time.time() - stored_at))
+            metrics.incr('deadlines.stale_served', route=request.endpoint)
+        return response
+    return wrapper
+
+
+def init_app(app):
+    app.before_request(start_budget)
@@ -0,0 +1,206 @@
+"""
+In-memory columnar snapshot of available donations (the consumer home feed).
+
+Each worker keeps an immutable ``Snapshot``: NumPy arrays for id, quantity,
+expiry, created_at and donor_id, an interned food_item code column, and the
+formatted rows themselves. ``get_donations?status=available`` filters, sorts
+and pages it with vectorized operations and never queries MySQL.
+
+A background thread polls ``fooddonations`` for rows whose updated_at is at
+or after the last one it saw, minus DONATION_FEED_POLL_OVERLAP seconds for
+transactions that committed late. Every UPDATE bumps updated_at, so the
+poll sees every change. Each poll that changes something publishes a new
+snapshot with a higher version. Write paths call ``notify`` to poll at once,
+and a full rebuild every DONATION_FEED_REBUILD_SECONDS picks up deletions
+and donor renames. Until the first build finishes, ``current`` is None and
+callers fall back to SQL.
+"""
+
+import os
+import time
+import logging
+import threading
+import numpy as np
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('DONATION_FEED_ENABLED', 'true').lower() == 'true'
+POLL_SECONDS = float(os.getenv('DONATION_FEED_POLL_SECONDS', 1.0))
+POLL_OVERLAP_SECONDS = int(os.getenv('DONATION_FEED_POLL_OVERLAP', 5))
+REBUILD_SECONDS = float(os.getenv('DONATION_FEED_REBUILD_SECONDS', 300))
+
+SORTS = ('newest', 'expiry', 'quantity')
+
+_SELECT = """SELECT d.*, u.full_name as donor_name
+             FROM fooddonations d JOIN users u ON d.donor_id = u.user_id"""
+
+
+def _format(row):
+    if row['donation_image']:
+        row['donation_image'] = f"/uploads/donation_images/{row['donation_image']}"
+    return row
+
+
+class Vocabulary:
+    """Append-only interning of food_item strings to int32 codes"""
+
+    def __init__(self):
+        self.names = []
+        self._codes = {}
+        self._lock = threading.Lock()
+
+    def code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(name)
+                if code is None:
+                    code = self._codes[name] = len(self.names)
+                    self.names.append(name)
+        return code
+
+    def matching(self, needle):
+        """Codes of every item containing ``needle`` (case-insensitive)"""
+        needle = needle.lower()
+        return np.array([c for c, name in enumerate(list(self.names)) if needle in name.lower()], dtype=np.int32)
+
+
+class Snapshot:
+    """One immutable version of the feed; arrays are aligned by position"""
+
+    def __init__(self, version, rows, vocabulary, changed_at):
+        self.version = version
+        self.changed_at = changed_at
+        self.rows = np.empty(len(rows), dtype=object)
+        self.rows[:] = rows
+        self.ids = np.fromiter((r['donation_id'] for r in rows), dtype=np.int64, count=len(rows))
+        self.quantity = np.fromiter((r['quantity'] for r in rows), dtype=np.int64, count=len(rows))
+        self.donor = np.fromiter((r['donor_id'] for r in rows), dtype=np.int64, count=len(rows))
+        self.expiry = np.array([r['expiry_date'] for r in rows], dtype='datetime64[D]')
+        self.created = np.array([r['created_at'] for r in rows], dtype='datetime64[s]')
+        self.item = np.fromiter((vocabulary.code(r['food_item']) for r in rows), dtype=np.int32, count=len(rows))
+        self.positions = {donation_id: i for i, donation_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.rows)
+
+    def query(self, vocabulary, donor_id=None, food_item=None, sort='newest', offset=0, limit=None):
+        """Returns (total matches, rows for the requested page)"""
+        mask = np.ones(len(self), dtype=bool)
+        if donor_id is not None:
+            mask &= self.donor == donor_id
+        if food_item:
+            mask &= np.isin(self.item, vocabulary.matching(food_item))
+        selected = np.flatnonzero(mask)
+
+        # np.lexsort sorts by its last key first; ids break ties deterministically
+        if sort == 'expiry':
+            order = np.lexsort((self.ids[selected], self.expiry[selected]))
+        elif sort == 'quantity':
+            order = np.lexsort((-self.ids[selected], -self.quantity[selected]))
+        else:
+            order = np.lexsort((-self.ids[selected], -self.created[selected].astype(np.int64)))
+        page = selected[order][offset:None if limit is None else offset + limit]
+        return len(selected), self.rows[page].tolist()
+
+
+class DonationFeed:
+    def __init__(self):
+        self.vocabulary = Vocabulary()
+        self.current = None
+        self._watermark = None
+        self._built_at = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+
+    def lookup(self, donation_id):
+        """The available donation's row from the current snapshot, or None"""
+        snapshot = self.current
+        if snapshot is None:
+            return None
+        position = snapshot.positions.get(donation_id)
+        return None if position is None else snapshot.rows[position]
+
+    def notify(self):
+        """Poll for changes now (e.g. right after a write commits)"""
+        self._wake.set()
+
+    def rebuild_soon(self):
+        """Rebuild from scratch on the next refresh (e.g. after rows were deleted)"""
+        self._built_at = 0.0
+        self._wake.set()
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,), name='donation-feed', daemon=True)
+        self._thread.start()
+
+    def _run(self, app):
+        while True:
+            try:
+                with app.app_context():
+                    if self.current is None or time.monotonic() - self._built_at >= REBUILD_SECONDS:
+                        self.rebuild()
+                    else:
+                        self.poll()
+            except Exception as e:
+                metrics.incr('donation_feed.refresh_failures')
+                logger.error("Donation feed refresh failed: %s", e)
+            self._wake.wait(POLL_SECONDS)
+            self._wake.clear()
+
+    def rebuild(self):
+        started = time.monotonic()
+        watermark = db.fetch_one("SELECT MAX(updated_at) AS last_modified FROM fooddonations")['last_modified']
+        rows = [_format(row) for row in db.fetch_all(_SELECT + " WHERE d.status = 'available'")]
+        self._publish(rows, watermark)
+        self._built_at = time.monotonic()
+        metrics.observe('donation_feed.rebuild', time.monotonic() - started)
+
+    def poll(self):
+        if self._watermark is None:
+            return self.rebuild()
+        changed = db.fetch_all(
+            _SELECT + " WHERE d.updated_at >= %s - INTERVAL %s SECOND",
+            (self._watermark, POLL_OVERLAP_SECONDS),
+            prepare=True
+        )
+        snapshot = self.current
+        updates, removals = {}, set()
+        watermark = self._watermark
+        for row in changed:
+            row = _format(row)
+            watermark = max(watermark, row['updated_at'])
+            position = snapshot.positions.get(row['donation_id'])
+            if row['status'] == 'available':
+                if position is None or snapshot.rows[position] != row:
+                    updates[row['donation_id']] = row
+            elif position is not None:
+                removals.add(row['donation_id'])
+        if not updates and not removals:
+            self._watermark = watermark
+            return
+        dropped = removals | updates.keys()
+        rows = [row for row in snapshot.rows.tolist() if row['donation_id'] not in dropped]
+        rows.extend(updates.values())
+        self._publish(rows, watermark)
+        metrics.incr('donation_feed.rows_applied', len(dropped))
+
+    def _publish(self, rows, watermark):
+        version = self.current.version + 1 if self.current is not None else 1
+        self.current = Snapshot(version, rows, self.vocabulary, watermark)
+        self._watermark = watermark
+        metrics.set_gauge('donation_feed.rows', len(rows))
+        metrics.set_gauge('donation_feed.version', version)
+
+
+feed = DonationFeed()
+
+
+def init_app(app):
+    """Build the snapshot and keep it fresh in this worker"""
+    if ENABLED:
+        feed.start(app)
@@ -0,0 +1,171 @@
+"""
+Bloom filters over registered and referred emails.
+
+Each worker keeps its own filters and adds only its own inserts, so a row
+written by another worker (or by the backend/ app) is missing until the next
+rebuild. A "no" from ``might_contain`` is therefore only a hint. It is used
+to skip a duplicate query only where a UNIQUE key still rejects the insert
+(bulk registration, repeat referrals); a stale "no" then costs an
+IntegrityError rather than a wrong answer. A "yes" can be a false positive,
+so callers query MySQL for those.
+
+Filters are built with a streaming keyset scan when the app starts, updated
+on every insert, and rebuilt in a background thread every
+EMAIL_FILTER_REBUILD_SECONDS so deleted rows eventually drop out. Until the
+first build finishes every lookup answers "maybe".
+"""
+
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from flask import current_app
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+REBUILD_SECONDS = int(os.getenv('EMAIL_FILTER_REBUILD_SECONDS', 3600))
+FALSE_POSITIVE_RATE = float(os.getenv('EMAIL_FILTER_FALSE_POSITIVE_RATE', 0.01))
+SCAN_BATCH_SIZE = 5000
+MIN_CAPACITY = 10000
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter using double hashing over one blake2b digest"""
+
+    def __init__(self, capacity, error_rate=FALSE_POSITIVE_RATE):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+
+def normalize_email(email):
+    # MySQL's default collation compares emails case-insensitively
+    return email.strip().lower()
+
+
+class EmailFilter:
+    """A Bloom filter kept in sync with one table's email keys"""
+
+    def __init__(self, name, count_query, scan_query, key):
+        self.name = name
+        self._count_query = count_query
+        self._scan_query = scan_query
+        self._key = key
+        self._filter = None
+        self._built_at = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self._pending = []
+
+    def might_contain(self, *parts):
+        """False means not seen by this worker; True means check the database"""
+        self.maybe_rebuild()
+        current = self._filter
+        metrics.incr('email_filter.checks', filter=self.name)
+        if current is None:
+            return True
+        if normalize_email(self._join(parts)) in current:
+            return True
+        metrics.incr('email_filter.misses', filter=self.name)
+        return False
+
+    def add(self, *parts):
+        item = normalize_email(self._join(parts))
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(item)
+            if self._rebuilding:
+                self._pending.append(item)
+
+    def maybe_rebuild(self):
+        if self._rebuilding:
+            return
+        if self._built_at is not None and time.monotonic() - self._built_at < REBUILD_SECONDS:
+            return
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+        app = current_app._get_current_object()
+        threading.Thread(target=self._rebuild, args=(app,), name=f'{self.name}-filter', daemon=True).start()
+
+    def build(self):
+        """Scan the table in keyset-paginated batches into a new filter"""
+        started = time.monotonic()
+        count = db.fetch_one(self._count_query)['count']
+        bloom = BloomFilter(max(MIN_CAPACITY, count * 2))
+        last_id = 0
+        while True:
+            rows = db.fetch_all(self._scan_query, (last_id, SCAN_BATCH_SIZE))
+            for row in rows:
+                bloom.add(normalize_email(self._key(row)))
+            if len(rows) < SCAN_BATCH_SIZE:
+                break
+            last_id = rows[-1]['id']
+        metrics.observe('email_filter.build', time.monotonic() - started, filter=self.name)
+        return bloom
+
+    def _rebuild(self, app):
+        try:
+            with app.app_context():
+                bloom = self.build()
+            with self._lock:
+                for item in self._pending:
+                    bloom.add(item)
+                self._filter = bloom
+                self._built_at = time.monotonic()
+            logger.info("Email filter %s rebuilt", self.name)
+        except Exception as e:
+            # Retry on the next check after a short back-off
+            self._built_at = time.monotonic() - REBUILD_SECONDS + 60
+            logger.error("Failed to build email filter %s: %s", self.name, e)
+        finally:
+            with self._lock:
+                self._pending = []
+                self._rebuilding = False
+
+    @staticmethod
+    def _join(parts):
+        return ':'.join(str(p) for p in parts)
+
+
+registered_emails = EmailFilter(
+    'registered',
+    "SELECT COUNT(*) AS count FROM users",
+    "SELECT user_id AS id, email FROM users WHERE user_id > %s ORDER BY user_id LIMIT %s",
+    key=lambda row: row['email']
+)
+
+# Keyed by referrer too: the same email may be referred by different users
+referred_emails = EmailFilter(
+    'referred',
+    "SELECT COUNT(*) AS count FROM referrals",
+    "SELECT referral_id AS id, referrer_id, referred_email FROM referrals WHERE referral_id > %s ORDER BY referral_id LIMIT %s",
+    key=lambda row: f"{row['referrer_id']}:{row['referred_email']}"
+)
+
+
+def init_app(app):
+    """Start the initial builds in the background"""
+    with app.app_context():
+        registered_emails.maybe_rebuild()
+        referred_emails.maybe_rebuild()
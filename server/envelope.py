@@ -0,0 +1,34 @@
+"""
+The API response envelope and token verification.
+
+Kept free of Flask and MySQL so the ASGI entry point (asgi.py) can share
+them without importing the Flask app's database layer.
+"""
+
+import jwt
+
+
+def build_envelope(status, message, data=None, error=None):
+    """Build the standard API response envelope as a dict"""
+    response = {
+        'status': status,
+        'message': message
+    }
+    
+    if data is not None:
+        response['data'] = data
+    
+    if error is not None:
+        response['error'] = error
+    
+    return response
+
+
+def verify_token(token, secret_key):
+    """The JWT token's payload, or None if it is invalid or expired"""
+    try:
+        return jwt.decode(token, secret_key, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        return None
+    except jwt.InvalidTokenError:
+        return None
@@ -0,0 +1,329 @@
+"""
+In-process pub/sub for request and donation events, served over SSE.
+
+Write paths call ``publish`` after they commit. The broker fans each event
+out to this worker's matching subscribers, each with its own bounded queue;
+a slow subscriber loses its oldest events, and the publisher never blocks.
+
+Events reach the other workers of a node through a ring of fixed slots in
+an anonymous shared-memory map created at import, like the rate-limit
+buckets, so every worker forked from the serve.py master shares it. Each
+worker polls the ring every EVENTS_RING_POLL_SECONDS and delivers other
+workers' events locally, which also fills its replay history. A reader that
+falls more than EVENTS_RING_SLOTS events behind skips the overwritten ones.
+
+For several nodes set EVENTS_REDIS_URL to relay through Redis pub/sub
+instead (or any Redis-compatible server, such as ``python localredis.py``;
+see requirements-redis.txt for the client). Relayed events go through a
+bounded outbox drained by a background thread, so a slow or unreachable
+Redis never holds up the request that published; when the outbox is full,
+events are dropped from the relay (local subscribers still get them).
+
+Each open stream holds a request thread on threaded workers, so there the
+per-worker subscriber limit defaults to a quarter of SERVE_THREADS and is
+capped at half of it; gevent workers allow EVENTS_MAX_SUBSCRIBERS.
+
+``add_listener`` registers a callback for events published by this
+process, e.g. to record history.
+"""
+
+import os
+import json
+import mmap
+import time
+import uuid
+import queue
+import struct
+import logging
+import threading
+import multiprocessing
+from collections import deque
+import json_codec
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv('EVENTS_SUBSCRIBER_QUEUE_SIZE', 100))
+RING_SLOTS = int(os.getenv('EVENTS_RING_SLOTS', 256))
+RING_SLOT_BYTES = int(os.getenv('EVENTS_RING_SLOT_BYTES', 4096))
+RING_POLL_SECONDS = float(os.getenv('EVENTS_RING_POLL_SECONDS', 0.05))
+HISTORY_SIZE = int(os.getenv('EVENTS_HISTORY_SIZE', 500))
+RELAY_QUEUE_SIZE = int(os.getenv('EVENTS_RELAY_QUEUE_SIZE', 1000))
+REDIS_TIMEOUT = float(os.getenv('EVENTS_REDIS_TIMEOUT', 2))
+
+
+def _max_subscribers():
+    configured = os.getenv('EVENTS_MAX_SUBSCRIBERS')
+    if os.getenv('SERVE_WORKER_CLASS', 'threaded') == 'gevent':
+        return int(configured or 1000)
+    # Every open stream pins one of the worker's request threads
+    threads = int(os.getenv('SERVE_THREADS', 16))
+    limit = max(1, threads // 2)
+    if configured is None:
+        return max(1, threads // 4)
+    if int(configured) > limit:
+        logger.warning("EVENTS_MAX_SUBSCRIBERS=%s would starve the %d request threads; using %d",
+                       configured, threads, limit)
+    return min(int(configured), limit)
+
+
+MAX_SUBSCRIBERS = _max_subscribers()
+
+
+class Event:
+    __slots__ = ('id', 'type', 'data', 'users', 'roles', 'origin')
+
+    def __init__(self, id, type, data, users=None, roles=None, origin=None):
+        self.id = id
+        self.type = type
+        self.data = data
+        self.users = users
+        self.roles = roles
+        self.origin = origin
+
+    def to_dict(self):
+        return {'id': self.id, 'type': self.type, 'data': self.data,
+                'users': self.users, 'roles': self.roles, 'origin': self.origin}
+
+    def to_sse(self):
+        return f"id: {self.id}\nevent: {self.type}\ndata: {json_codec.dumps(self.data).decode('utf-8')}\n\n"
+
+
+class Subscriber:
+    def __init__(self, user_id, role):
+        self.user_id = user_id
+        self.role = role
+        self.queue = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+    def wants(self, event):
+        if event.users is None and event.roles is None:
+            return True
+        return (event.users is not None and self.user_id in event.users) or \
+               (event.roles is not None and self.role in event.roles)
+
+    def offer(self, event):
+        while True:
+            try:
+                self.queue.put_nowait(event)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    metrics.incr('events.dropped')
+                except queue.Empty:
+                    pass
+
+
+class Broker:
+    def __init__(self):
+        self._node = uuid.uuid4().hex
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._history = deque(maxlen=HISTORY_SIZE)
+        self._listeners = []
+        self._relay = None
+
+    @property
+    def instance_id(self):
+        # Includes the pid so workers forked from one master don't share an id
+        return f"{self._node}-{os.getpid()}"
+
+    def subscribe(self, user_id, role):
+        """Register a subscriber, or return None when this worker is full"""
+        with self._lock:
+            if len(self._subscribers) >= MAX_SUBSCRIBERS:
+                return None
+            subscriber = Subscriber(user_id, role)
+            self._subscribers.add(subscriber)
+            metrics.set_gauge('events.subscribers', len(self._subscribers))
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            metrics.set_gauge('events.subscribers', len(self._subscribers))
+
+    def add_listener(self, callback):
+        """Call ``callback(event)`` for every event published by this process"""
+        self._listeners.append(callback)
+
+    def set_relay(self, relay):
+        self._relay = relay
+
+    def publish(self, event_type, data, users=None, roles=None):
+        """Publish an event to matching subscribers; ``users``/``roles`` of None means everyone"""
+        event = Event(f"{time.time_ns()}", event_type, data, users=users, roles=roles, origin=self.instance_id)
+        self.deliver(event)
+        if self._relay is not None:
+            try:
+                self._relay.publish(event)
+            except Exception as e:
+                logger.error("Failed to relay event %s: %s", event_type, e)
+        for listener in self._listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.error("Event listener failed for %s: %s", event_type, e)
+        metrics.incr('events.published', type=event_type)
+        return event
+
+    def deliver(self, event):
+        """Fan an event out to this worker's subscribers"""
+        with self._lock:
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            if subscriber.wants(event):
+                subscriber.offer(event)
+
+    def replay(self, last_event_id, subscriber):
+        """Events after ``last_event_id`` still in history, for reconnecting clients"""
+        if not last_event_id or not last_event_id.isdigit():
+            return []
+        with self._lock:
+            history = list(self._history)
+        return [e for e in history if int(e.id) > int(last_event_id) and subscriber.wants(e)]
+
+
+class RingRelay:
+    """Carries events between the workers of one node through a shared-memory ring.
+
+    The map starts with the sequence number of the last event written; slot
+    ``seq % slots`` holds that event as (seq, length, JSON). Writers take the
+    lock; readers don't, and instead check the slot's seq before and after
+    copying it, retrying on a torn read.
+    """
+
+    HEADER = struct.Struct('<Q')
+    SLOT = struct.Struct('<QI')
+
+    def __init__(self, slots, slot_bytes):
+        self.slots = slots
+        self.slot_size = slot_bytes
+        self._map = mmap.mmap(-1, self.HEADER.size + slots * slot_bytes)
+        self._lock = multiprocessing.Lock()
+        self._broker = None
+
+    def _offset(self, seq):
+        return self.HEADER.size + (seq % self.slots) * self.slot_size
+
+    def last_seq(self):
+        return self.HEADER.unpack_from(self._map, 0)[0]
+
+    def publish(self, event):
+        payload = json.dumps(event.to_dict(), default=str).encode('utf-8')
+        if len(payload) > self.slot_size - self.SLOT.size:
+            metrics.incr('events.relay_dropped')
+            logger.warning("Event %s is %d bytes, too large to relay between workers", event.type, len(payload))
+            return
+        with self._lock:
+            seq = self.last_seq() + 1
+            offset = self._offset(seq)
+            # Invalidate the slot first so readers never take half-written data for a whole event
+            self.SLOT.pack_into(self._map, offset, 0, 0)
+            self._map[offset + self.SLOT.size:offset + self.SLOT.size + len(payload)] = payload
+            self.SLOT.pack_into(self._map, offset, seq, len(payload))
+            self.HEADER.pack_into(self._map, 0, seq)
+
+    def read(self, seq):
+        """The event written as ``seq``, or None once it has been overwritten"""
+        offset = self._offset(seq)
+        for _ in range(3):
+            stored, length = self.SLOT.unpack_from(self._map, offset)
+            if stored != seq:
+                return None
+            payload = self._map[offset + self.SLOT.size:offset + self.SLOT.size + length]
+            if self.SLOT.unpack_from(self._map, offset)[0] == seq:
+                return Event(**json.loads(payload))
+        return None
+
+    def attach(self, broker):
+        self._broker = broker
+
+    def start(self):
+        threading.Thread(target=self._listen, name='events-ring', daemon=True).start()
+
+    def _listen(self):
+        # Start from the oldest event still in the ring so a new worker can replay it
+        seen = max(0, self.last_seq() - self.slots)
+        while True:
+            try:
+                latest = self.last_seq()
+                if latest - seen > self.slots:
+                    metrics.incr('events.ring_skipped', value=latest - seen - self.slots)
+                    seen = latest - self.slots
+                while seen < latest:
+                    seen += 1
+                    event = self.read(seen)
+                    if event is None:
+                        metrics.incr('events.ring_skipped')
+                    elif event.origin != self._broker.instance_id:
+                        self._broker.deliver(event)
+            except Exception as e:
+                logger.error("Event ring reader failed: %s", e)
+            time.sleep(RING_POLL_SECONDS)
+
+
+class RedisRelay:
+    """Carries events between workers and nodes over a Redis pub/sub channel"""
+
+    def __init__(self, broker, url, channel='foodforall:events'):
+        import redis  # optional dependency, see requirements-redis.txt
+        self._broker = broker
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+        # The subscription sits idle between events, so only its connect is bounded
+        self._subscriber = redis.Redis.from_url(url, socket_connect_timeout=REDIS_TIMEOUT)
+        self._channel = channel
+        self._outbox = queue.Queue(maxsize=RELAY_QUEUE_SIZE)
+
+    def publish(self, event):
+        try:
+            self._outbox.put_nowait(event)
+        except queue.Full:
+            metrics.incr('events.relay_dropped')
+
+    def start(self):
+        threading.Thread(target=self._send, name='events-relay-send', daemon=True).start()
+        threading.Thread(target=self._listen, name='events-relay', daemon=True).start()
+
+    def _send(self):
+        while True:
+            event = self._outbox.get()
+            try:
+                self._client.publish(self._channel, json.dumps(event.to_dict(), default=str))
+            except Exception as e:
+                metrics.incr('events.relay_failures')
+                logger.error("Failed to relay event %s: %s", event.type, e)
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._subscriber.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self._channel)
+                for message in pubsub.listen():
+                    payload = json.loads(message['data'])
+                    if payload['origin'] != self._broker.instance_id:
+                        self._broker.deliver(Event(**payload))
+            except Exception as e:
+                logger.error("Event relay disconnected, retrying: %s", e)
+                time.sleep(1)
+
+
+broker = Broker()
+publish = broker.publish
+# Mapped at import so a master that imports this module shares it with its workers
+ring = RingRelay(RING_SLOTS, RING_SLOT_BYTES)
+
+
+def init_app(app):
+    """Connect the cross-process relay (once per worker)"""
+    if broker._relay is not None:
+        return
+    url = os.getenv('EVENTS_REDIS_URL')
+    if url:
+        relay = RedisRelay(broker, url)
+    else:
+        relay = ring
+        relay.attach(broker)
+    broker.set_relay(relay)
+    relay.start()
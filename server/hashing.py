@@ -0,0 +1,57 @@
+"""
+bcrypt hashing across a process pool for bulk work.
+
+A bcrypt hash is deliberately slow (tens to hundreds of milliseconds), so
+hashing thousands of passwords one after another in a request thread takes
+minutes. ``hash_many`` spreads them over HASH_WORKERS processes instead.
+
+The pool is started lazily on first use, in whichever worker process needs
+it, with the ``spawn`` start method: forking a threaded server would copy
+its locks mid-use. Children import only this module.
+"""
+
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', os.cpu_count() or 2))
+HASH_CHUNK_SIZE = int(os.getenv('HASH_CHUNK_SIZE', 16))
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def hash_password(password):
+    """Same output as utils.hash_password; importable by pool children"""
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(HASH_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def hash_many(passwords):
+    """Hash every password, in order, across the process pool"""
+    if len(passwords) < 2 or HASH_WORKERS < 2:
+        return [hash_password(p) for p in passwords]
+    return list(_get_pool().map(hash_password, passwords, chunksize=HASH_CHUNK_SIZE))
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+
+
+atexit.register(shutdown)
@@ -0,0 +1,285 @@
+"""
+Short-lived reservation holds on donation quantity.
+
+When a popular donation is posted, a crowd of consumers asks for it at
+once. A requester first claims quantity from this ledger, either
+explicitly with ``POST /api/requests/holds`` or implicitly when creating
+the request. The ledger grants claims only up to the donation's
+*capacity*: its quantity minus what pending requests already ask for.
+Everyone after that gets 409 from memory, with no query and no doomed
+request row. A request is persisted only while its hold is live.
+Committing the request moves the held quantity from the hold into the
+pending total. Holds nobody uses expire after HOLD_TTL_SECONDS.
+
+The ledger is a fixed table in an anonymous shared-memory map created at
+import, like the rate-limit buckets. Every worker forked from a preloaded
+master therefore sees the same holds. Each donation slot keeps its
+capacity, when that was loaded, and up to HOLDS_PER_DONATION live holds,
+at most one per user. A donation whose hold entries are all live answers
+"busy" until one expires. So that a few accounts cannot keep donations
+busy, one user may hold at most HOLDS_PER_USER donations at a time and
+HOLD_MAX_QUANTITY_PER_USER in total; the route is also rate limited. Capacities are reloaded from MySQL after
+HOLD_REFRESH_SECONDS, or right away after ``invalidate`` (accept, reject,
+donation edits). So holds on other hosts, or changes they make, only skew
+admission until the next reload. The final quantity check still happens
+in the accept transaction.
+"""
+
+import os
+import time
+import mmap
+import struct
+import multiprocessing
+import db
+import metrics
+
+TTL_SECONDS = float(os.getenv('HOLD_TTL_SECONDS', 120))
+REFRESH_SECONDS = float(os.getenv('HOLD_REFRESH_SECONDS', 30))
+HOLDS_PER_DONATION = int(os.getenv('HOLDS_PER_DONATION', 32))
+SLOTS = int(os.getenv('HOLD_SLOTS', 1024))
+HOLDS_PER_USER = int(os.getenv('HOLDS_PER_USER', 5))
+MAX_QUANTITY_PER_USER = int(os.getenv('HOLD_MAX_QUANTITY_PER_USER', 100))
+USER_SLOTS = int(os.getenv('HOLD_USER_SLOTS', 8192))
+
+# Outcomes of Ledger.claim
+HELD = 'held'
+UNAVAILABLE = 'unavailable'    # donation gone or no longer available
+INSUFFICIENT = 'insufficient'  # not enough unreserved quantity left
+BUSY = 'busy'                  # every hold entry of the donation is live
+LIMITED = 'limited'            # the user already holds as much as one account may
+UNTRACKED = 'untracked'        # ledger full; caller proceeds without a hold
+
+
+class HoldExpired(Exception):
+    """The requester's hold lapsed before their request was persisted"""
+
+
+CAPACITY_QUERY = """
+    SELECT d.quantity - COALESCE(SUM(r.quantity_requested), 0) AS capacity
+    FROM fooddonations d
+    LEFT JOIN requests r ON r.donation_id = d.donation_id AND r.status = 'pending'
+    WHERE d.donation_id = %s AND d.status = 'available'
+    GROUP BY d.donation_id, d.quantity
+"""
+
+
+class SlotTable:
+    """Fixed slots in an anonymous mmap shared across fork.
+
+    Each slot is a header entry (key, ...) followed by ``width`` entries whose
+    third field is an expiry time. Keys hash to a slot with a short linear
+    probe; a slot is recycled only when none of its entries is live.
+    """
+
+    ENTRY = struct.Struct('<Qqd')
+    PROBE = 4
+
+    def __init__(self, slots, width):
+        self.slots = slots
+        self.width = width
+        self.slot_size = self.ENTRY.size * (width + 1)
+        self._map = mmap.mmap(-1, slots * self.slot_size)
+
+    def header(self, offset):
+        return self.ENTRY.unpack_from(self._map, offset)
+
+    def set_header(self, offset, key, value, stamp):
+        self.ENTRY.pack_into(self._map, offset, key, value, stamp)
+
+    def entries(self, offset):
+        return [self.ENTRY.unpack_from(self._map, offset + self.ENTRY.size * (i + 1)) for i in range(self.width)]
+
+    def set_entry(self, offset, i, key, quantity, expires_at):
+        self.ENTRY.pack_into(self._map, offset + self.ENTRY.size * (i + 1), key, quantity, expires_at)
+
+    def clear_entry(self, offset, key):
+        """Drop the live entry for ``key``, if any; returns whether there was one"""
+        now = time.monotonic()
+        for i, (stored, _, expires) in enumerate(self.entries(offset)):
+            if stored == key and expires > now:
+                self.set_entry(offset, i, 0, 0, 0.0)
+                return True
+        return False
+
+    def find(self, key, now, create):
+        start = key % self.slots
+        reusable = None
+        for i in range(self.PROBE):
+            offset = ((start + i) % self.slots) * self.slot_size
+            stored_key = self.header(offset)[0]
+            if stored_key == key:
+                return offset
+            if create and reusable is None and (
+                    stored_key == 0 or all(expires <= now for _, _, expires in self.entries(offset))):
+                reusable = offset
+        if reusable is not None:
+            self._map[reusable:reusable + self.slot_size] = bytes(self.slot_size)
+            self.set_header(reusable, key, 0, 0.0)
+        return reusable
+
+
+class Ledger:
+    """Holds indexed both by donation and by user, in two shared slot tables.
+
+    A donation slot's header is (donation_id, capacity, loaded_at) and its
+    entries are (user_id, quantity, expires_at). A user slot's header is
+    (user_id, 0, 0) and its entries are (donation_id, quantity, expires_at);
+    it caps how much one account can hold at once. Times are
+    time.monotonic(), which is system-wide. Both tables change together under
+    one lock.
+    """
+
+    def __init__(self, slots=SLOTS, holds=HOLDS_PER_DONATION, user_slots=USER_SLOTS, per_user=HOLDS_PER_USER):
+        self._donations = SlotTable(slots, holds)
+        self._users = SlotTable(user_slots, per_user)
+        self._lock = multiprocessing.Lock()
+
+    def _capacity(self, donation_id, now):
+        """(offset, capacity); capacity is None when the slot is missing or due a reload"""
+        offset = self._donations.find(donation_id, now, create=False)
+        if offset is None:
+            return None, None
+        _, capacity, loaded_at = self._donations.header(offset)
+        if not loaded_at or now - loaded_at >= REFRESH_SECONDS:
+            return offset, None
+        return offset, capacity
+
+    def _user_room(self, user_offset, donation_id, quantity, now):
+        """Entry index the user's hold on the donation goes in, or None when over their cap"""
+        count, total, own, free = 0, 0, None, None
+        for i, (held_donation, held_quantity, expires) in enumerate(self._users.entries(user_offset)):
+            if expires <= now:
+                if free is None:
+                    free = i
+            elif held_donation == donation_id:
+                own = i
+            else:
+                count += 1
+                total += held_quantity
+        if count >= HOLDS_PER_USER or total + quantity > MAX_QUANTITY_PER_USER:
+            return None
+        return own if own is not None else free
+
+    # -- public API ------------------------------------------------------------
+
+    def claim(self, donation_id, user_id, quantity, load_capacity):
+        """Reserve ``quantity`` for ``user_id``, replacing any hold they had.
+
+        ``load_capacity(donation_id)`` is called (outside the lock) when the
+        slot is missing or stale; it returns the capacity, or None when the
+        donation is not available. Returns (outcome, seconds until expiry).
+        """
+        # A second pass covers a slot invalidated between loading and claiming
+        for _ in range(2):
+            now = time.monotonic()
+            with self._lock:
+                _, capacity = self._capacity(donation_id, now)
+            loaded = None
+            if capacity is None:
+                loaded = load_capacity(donation_id)
+                if loaded is None:
+                    self.invalidate(donation_id)
+                    return UNAVAILABLE, None
+                now = time.monotonic()
+
+            with self._lock:
+                user_offset = self._users.find(user_id, now, create=True)
+                offset = self._donations.find(donation_id, now, create=True)
+                if offset is None or user_offset is None:
+                    metrics.incr('holds.untracked')
+                    return UNTRACKED, None
+                stored_id, capacity, loaded_at = self._donations.header(offset)
+                if loaded is not None:
+                    capacity = loaded
+                    self._donations.set_header(offset, donation_id, capacity, now)
+                elif stored_id != donation_id or not loaded_at:
+                    continue
+
+                user_index = self._user_room(user_offset, donation_id, quantity, now)
+                if user_index is None:
+                    metrics.incr('holds.user_limited')
+                    return LIMITED, None
+                held, own, free = 0, None, None
+                for i, (holder, held_quantity, expires) in enumerate(self._donations.entries(offset)):
+                    if expires <= now:
+                        if free is None:
+                            free = i
+                    elif holder == user_id:
+                        own = i
+                    else:
+                        held += held_quantity
+                if quantity > capacity - held:
+                    metrics.incr('holds.insufficient')
+                    return INSUFFICIENT, None
+                index = own if own is not None else free
+                if index is None:
+                    break
+                self._donations.set_entry(offset, index, user_id, quantity, now + TTL_SECONDS)
+                self._users.set_entry(user_offset, user_index, donation_id, quantity, now + TTL_SECONDS)
+            metrics.incr('holds.granted')
+            return HELD, TTL_SECONDS
+        metrics.incr('holds.busy')
+        return BUSY, None
+
+    def live_hold(self, donation_id, user_id):
+        """Quantity ``user_id`` holds on the donation, or None"""
+        now = time.monotonic()
+        with self._lock:
+            offset = self._donations.find(donation_id, now, create=False)
+            if offset is None:
+                return None
+            for holder, quantity, expires in self._donations.entries(offset):
+                if holder == user_id and expires > now:
+                    return quantity
+        return None
+
+    def _drop_user_hold(self, user_id, donation_id, now):
+        user_offset = self._users.find(user_id, now, create=False)
+        if user_offset is not None:
+            self._users.clear_entry(user_offset, donation_id)
+
+    def commit(self, donation_id, user_id, quantity):
+        """Turn a live hold into a pending request for ``quantity`` of the capacity.
+
+        Returns False if the hold has expired (or was never taken), in which
+        case the request must not be persisted.
+        """
+        now = time.monotonic()
+        with self._lock:
+            offset = self._donations.find(donation_id, now, create=False)
+            if offset is not None and self._donations.clear_entry(offset, user_id):
+                stored_id, capacity, loaded_at = self._donations.header(offset)
+                self._donations.set_header(offset, stored_id, capacity - quantity, loaded_at)
+                self._drop_user_hold(user_id, donation_id, now)
+                return True
+        metrics.incr('holds.expired_on_commit')
+        return False
+
+    def release(self, donation_id, user_id):
+        """Drop the user's hold, if any"""
+        now = time.monotonic()
+        with self._lock:
+            offset = self._donations.find(donation_id, now, create=False)
+            if offset is None or not self._donations.clear_entry(offset, user_id):
+                return False
+            self._drop_user_hold(user_id, donation_id, now)
+            return True
+
+    def invalidate(self, donation_id):
+        """Reload the capacity on the next claim; live holds are kept"""
+        now = time.monotonic()
+        with self._lock:
+            offset = self._donations.find(donation_id, now, create=False)
+            if offset is not None:
+                stored_id, _, _ = self._donations.header(offset)
+                self._donations.set_header(offset, stored_id, 0, 0.0)
+
+
+def load_capacity(donation_id):
+    """Quantity not yet asked for by pending requests, or None if not available"""
+    row = db.fetch_one(CAPACITY_QUERY, (donation_id,), prepare=True)
+    return int(row['capacity']) if row else None
+
+
+# Created at import so a preloading master maps it before forking workers
+ledger = Ledger()
@@ -30,7 +30,8 @@ tables = {
         full_name VARCHAR(255) NOT NULL,
         phone_number VARCHAR(15) NOT NULL,
         address TEXT NOT NULL,
-        profile_picture VARCHAR(255)
+        profile_picture VARCHAR(255),
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
     );
     ''',
     'fooddonations': '''
@@ -83,11 +84,189 @@ tables = {
         FOREIGN KEY (donation_id) REFERENCES fooddonations(donation_id),
         FOREIGN KEY (requester_id) REFERENCES users(user_id)
     );
+    ''',
+    # Platform totals; each counter is spread over a few slots so writers rarely contend
+    'platform_stats': '''
+    CREATE TABLE IF NOT EXISTS platform_stats (
+        stat_name VARCHAR(64) NOT NULL,
+        slot TINYINT UNSIGNED NOT NULL,
+        value BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        PRIMARY KEY (stat_name, slot)
+    );
+    ''',
+    # Who already counts towards the distinct-user totals (active donors, active NGOs)
+    'platform_stat_members': '''
+    CREATE TABLE IF NOT EXISTS platform_stat_members (
+        stat_name VARCHAR(64) NOT NULL,
+        user_id INT NOT NULL,
+        PRIMARY KEY (stat_name, user_id)
+    );
+    ''',
+    # Per-day activity by dimension; keyed so one series over N days reads N rows
+    'daily_rollups': '''
+    CREATE TABLE IF NOT EXISTS daily_rollups (
+        day DATE NOT NULL,
+        dimension VARCHAR(32) NOT NULL,
+        dimension_value VARCHAR(255) NOT NULL DEFAULT '',
+        donations INT NOT NULL DEFAULT 0,
+        quantity_donated BIGINT NOT NULL DEFAULT 0,
+        requests_created INT NOT NULL DEFAULT 0,
+        quantity_requested BIGINT NOT NULL DEFAULT 0,
+        requests_approved INT NOT NULL DEFAULT 0,
+        quantity_approved BIGINT NOT NULL DEFAULT 0,
+        requests_rejected INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (dimension, dimension_value, day),
+        INDEX idx_daily_rollups_day (day)
+    );
+    ''',
+    # Append-only history of request and donation events, flushed in batches by audit.py
+    'audit_events': '''
+    CREATE TABLE IF NOT EXISTS audit_events (
+        event_id BIGINT AUTO_INCREMENT PRIMARY KEY,
+        event_type VARCHAR(50) NOT NULL,
+        donation_id INT NULL,
+        request_id INT NULL,
+        actor_id INT NULL,
+        payload JSON NOT NULL,
+        occurred_at DATETIME(6) NOT NULL,
+        INDEX idx_audit_donation (donation_id, event_id),
+        INDEX idx_audit_request (request_id, event_id)
+    );
+    ''',
+    # Finished donations and their requests, moved out of the hot tables by archive.py.
+    # Same columns as the originals (keep them in step), ids preserved, no auto-update.
+    'fooddonations_archive': '''
+    CREATE TABLE IF NOT EXISTS fooddonations_archive (
+        donation_id INT PRIMARY KEY,
+        food_item VARCHAR(255) NOT NULL,
+        quantity INT NOT NULL,
+        expiry_date DATE NOT NULL,
+        description TEXT,
+        status ENUM('available','reserved','claimed'),
+        donor_id INT NOT NULL,
+        donation_image VARCHAR(255),
+        created_at TIMESTAMP NULL,
+        updated_at TIMESTAMP NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_donations_archive_donor (donor_id, created_at),
+        FOREIGN KEY (donor_id) REFERENCES users(user_id)
+    );
+    ''',
+    'requests_archive': '''
+    CREATE TABLE IF NOT EXISTS requests_archive (
+        request_id INT PRIMARY KEY,
+        donation_id INT NOT NULL,
+        requester_id INT NOT NULL,
+        quantity_requested INT NOT NULL,
+        purpose TEXT,
+        status ENUM('pending','approved','rejected','completed'),
+        created_at TIMESTAMP NULL,
+        updated_at TIMESTAMP NULL,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_requests_archive_requester_status_updated (requester_id, status, updated_at),
+        FOREIGN KEY (donation_id) REFERENCES fooddonations_archive(donation_id),
+        FOREIGN KEY (requester_id) REFERENCES users(user_id)
+    );
+    ''',
+    # Each user's top food items by decayed request history, rewritten by recommendations.py
+    'user_preferences': '''
+    CREATE TABLE IF NOT EXISTS user_preferences (
+        user_id INT NOT NULL,
+        food_item VARCHAR(255) NOT NULL,
+        weight FLOAT NOT NULL,
+        computed_at DATETIME NOT NULL,
+        PRIMARY KEY (user_id, food_item),
+        INDEX idx_user_preferences_computed (computed_at)
+    );
+    ''',
+    # Rows removed from the hot tables, so delta-sync clients can drop them (see sync.py)
+    'sync_tombstones': '''
+    CREATE TABLE IF NOT EXISTS sync_tombstones (
+        entity VARCHAR(32) NOT NULL,
+        entity_id INT NOT NULL,
+        removed_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (entity, removed_at, entity_id)
+    );
+    ''',
+    # Background bulk registrations and their reports (see bulk_users.py)
+    'bulk_register_jobs': '''
+    CREATE TABLE IF NOT EXISTS bulk_register_jobs (
+        job_id CHAR(32) PRIMARY KEY,
+        user_id INT NOT NULL,
+        status ENUM('queued','running','done','failed') NOT NULL DEFAULT 'queued',
+        total INT NOT NULL,
+        processed INT NOT NULL DEFAULT 0,
+        report MEDIUMTEXT NULL,
+        error VARCHAR(255) NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+    );
+    ''',
+    # Whole history, hot and archived, for totals that must not drop when rows are archived
+    'all_fooddonations': '''
+    CREATE OR REPLACE VIEW all_fooddonations AS
+        SELECT donation_id, food_item, quantity, expiry_date, description, status,
+               donor_id, donation_image, created_at, updated_at FROM fooddonations
+        UNION ALL
+        SELECT donation_id, food_item, quantity, expiry_date, description, status,
+               donor_id, donation_image, created_at, updated_at FROM fooddonations_archive;
+    ''',
+    'all_requests': '''
+    CREATE OR REPLACE VIEW all_requests AS
+        SELECT request_id, donation_id, requester_id, quantity_requested, purpose, status,
+               created_at, updated_at FROM requests
+        UNION ALL
+        SELECT request_id, donation_id, requester_id, quantity_requested, purpose, status,
+               created_at, updated_at FROM requests_archive;
     '''
 }
 
-def init_database():
-    """Initialize the database with required tables"""
+# Columns and indexes added after the first release. Applied on every start;
+# "already exists" errors (duplicate column 1060, duplicate key 1061) are ignored.
+# A unique key that existing duplicates (1062) prevent fails the migration: the
+# code relies on these keys, so duplicates are removed first where that is safe.
+schema_updates = [
+    "ALTER TABLE users ADD COLUMN updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP",
+    # Conditional GET validators: COUNT(*)/MAX(updated_at) per filter
+    "ALTER TABLE fooddonations ADD INDEX idx_donations_updated (updated_at)",
+    "ALTER TABLE fooddonations ADD INDEX idx_donations_status_updated (status, updated_at)",
+    "ALTER TABLE fooddonations ADD INDEX idx_donations_donor_updated (donor_id, updated_at)",
+    "ALTER TABLE requests ADD INDEX idx_requests_requester_status_updated (requester_id, status, updated_at)",
+    # Referral uniqueness is enforced by the table instead of read-then-write checks;
+    # repeats from before the key keep their first referral
+    """DELETE r FROM referrals r
+       JOIN referrals kept ON kept.referrer_id = r.referrer_id AND kept.referred_email = r.referred_email
+                          AND kept.referral_id < r.referral_id""",
+    "ALTER TABLE referrals ADD UNIQUE KEY uq_referrals_referrer_email (referrer_id, referred_email)",
+    # Client-visible ids for rows accepted by the write-behind queues
+    "ALTER TABLE feedback ADD COLUMN client_ref CHAR(32) NULL",
+    "ALTER TABLE feedback ADD UNIQUE KEY uq_feedback_client_ref (client_ref)",
+    "ALTER TABLE referrals ADD COLUMN client_ref CHAR(32) NULL",
+    "ALTER TABLE referrals ADD UNIQUE KEY uq_referrals_client_ref (client_ref)",
+    # Archival candidates: expired donations (claimed ones use idx_donations_status_updated)
+    "ALTER TABLE fooddonations ADD INDEX idx_donations_expiry (expiry_date)",
+    "ALTER TABLE requests ADD INDEX idx_requests_donation_status (donation_id, status)",
+    # Delta sync keysets on (updated_at, id); InnoDB appends the primary key to idx_donations_updated
+    "ALTER TABLE requests ADD INDEX idx_requests_requester_updated (requester_id, updated_at, request_id)",
+    "ALTER TABLE requests_archive ADD INDEX idx_requests_archive_requester_updated (requester_id, updated_at, request_id)",
+]
+
+def apply_schema_updates(cursor):
+    """Apply schema_updates, skipping the ones that are already in place"""
+    for statement in schema_updates:
+        try:
+            cursor.execute(statement)
+        except mysql.connector.Error as e:
+            if e.errno == 1062:
+                logger.error(f"Schema update failed, existing rows violate it: {statement}")
+                raise
+            if e.errno not in (1060, 1061):
+                raise
+
+def init_database(strict=False):
+    """Initialize the database with required tables; ``strict`` re-raises failures"""
     try:
         # Connect to MySQL server
         conn = mysql.connector.connect(
@@ -107,6 +286,9 @@ def init_database():
             cursor.execute(table_sql)
             logger.info(f"Table {table_name} is ready.")
         
+        apply_schema_updates(cursor)
+        conn.commit()
+        
         # Create admin user if it doesn't exist
         cursor.execute("SELECT * FROM users WHERE email = 'admin@foodforall.com'")
         admin = cursor.fetchone()
@@ -127,6 +309,8 @@ def init_database():
         
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
+        if strict:
+            raise
     finally:
         if 'conn' in locals() and conn.is_connected():
             cursor.close()
@@ -0,0 +1,145 @@
+"""
+Pluggable JSON encoders for API responses.
+
+``format_response`` and the ASGI app serialize through ``dumps`` instead of
+``jsonify``. The default backend is orjson when it is installed, with the
+stdlib encoder as the fallback; set ``JSON_ENCODER`` to force one.
+
+Keys are sorted and dates, datetimes, Decimals and UUIDs are encoded the
+way Flask's default provider does it (HTTP dates and strings), so the wire
+format matches ``jsonify``. Set ``JSON_DATETIME_FORMAT=iso`` to let orjson emit ISO 8601
+datetimes natively, which skips the Python fallback for every timestamp.
+"""
+
+import os
+import json
+import decimal
+import uuid
+from datetime import date, datetime, timezone
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+JSON_ENCODER = os.getenv('JSON_ENCODER', 'auto')
+JSON_DATETIME_FORMAT = os.getenv('JSON_DATETIME_FORMAT', 'http')
+
+
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+def http_date(d):
+    """Same output as werkzeug.http.http_date (naive values are UTC), without
+    going through email.utils for every timestamp."""
+    if isinstance(d, datetime):
+        if d.tzinfo is not None:
+            d = d.astimezone(timezone.utc)
+        return (f"{_WEEKDAYS[d.weekday()]}, {d.day:02d} {_MONTHS[d.month - 1]} {d.year:04d} "
+                f"{d.hour:02d}:{d.minute:02d}:{d.second:02d} GMT")
+    return f"{_WEEKDAYS[d.weekday()]}, {d.day:02d} {_MONTHS[d.month - 1]} {d.year:04d} 00:00:00 GMT"
+
+
+def _default_http(o):
+    """Flask-compatible fallback for types JSON doesn't know"""
+    if isinstance(o, date):
+        return http_date(o)
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _default_iso(o):
+    if isinstance(o, date):
+        return o.isoformat()
+    if isinstance(o, (decimal.Decimal, uuid.UUID)):
+        return str(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+class StdlibEncoder:
+    """Compact encoder on top of the json module"""
+
+    name = 'stdlib'
+
+    def __init__(self, datetime_format='http'):
+        self._encoder = json.JSONEncoder(
+            separators=(',', ':'),
+            sort_keys=True,
+            default=_default_iso if datetime_format == 'iso' else _default_http
+        )
+
+    def dumps(self, obj):
+        return self._encoder.encode(obj).encode('utf-8')
+
+
+class OrjsonEncoder:
+    """orjson-backed encoder; datetimes are native in iso mode"""
+
+    name = 'orjson'
+
+    def __init__(self, datetime_format='http'):
+        if orjson is None:
+            raise RuntimeError("orjson is not installed")
+        if datetime_format == 'iso':
+            self._default = _default_iso
+            self._option = orjson.OPT_NAIVE_UTC | orjson.OPT_SORT_KEYS
+        else:
+            # Route datetimes through the fallback to keep HTTP-date output
+            self._default = _default_http
+            self._option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SORT_KEYS
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default=self._default, option=self._option)
+
+
+ENCODERS = {
+    'stdlib': StdlibEncoder,
+    'orjson': OrjsonEncoder,
+}
+
+_encoder = None
+
+
+def register_encoder(name, cls):
+    """Register an encoder class; it needs a ``dumps(obj) -> bytes`` method"""
+    ENCODERS[name] = cls
+
+
+def create_encoder(name=None, datetime_format=None):
+    name = name or JSON_ENCODER
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    return ENCODERS[name](datetime_format or JSON_DATETIME_FORMAT)
+
+
+def get_encoder():
+    global _encoder
+    if _encoder is None:
+        _encoder = create_encoder()
+    return _encoder
+
+
+def set_encoder(encoder):
+    """Swap the process-wide encoder (an instance, or a registered name)"""
+    global _encoder
+    _encoder = create_encoder(encoder) if isinstance(encoder, str) else encoder
+
+
+def dumps(obj):
+    """Serialize ``obj`` to compact JSON bytes with the active encoder"""
+    return get_encoder().dumps(obj)
+
+
+def dumps_envelope(envelope, raw_data=None):
+    """Serialize a response envelope, splicing in pre-serialized ``data`` bytes.
+
+    Cached payloads can be stored already encoded and reused without being
+    decoded and encoded again on every hit.
+    """
+    body = dumps(envelope)
+    if raw_data is None:
+        return body
+    # "data" sorts before every other envelope key (error, message, status)
+    return b'{"data":' + raw_data + (b',' + body[1:] if len(body) > 2 else b'}')
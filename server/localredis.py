@@ -0,0 +1,202 @@
+"""
+A small Redis-compatible server for nodes without a Redis install.
+
+Speaks enough of RESP for the app's own clients: PING, ECHO, SELECT,
+CLIENT, SCRIPT LOAD/EXISTS, EVALSHA/EVAL and PUBLISH/SUBSCRIBE. It cannot
+run Lua; instead it recognises the app's scripts by their first line
+(``-- foodforall:<name>``) and runs a Python copy of them. Anything else
+gets an error reply.
+
+State is in memory only, so restarting it hands every client fresh rate
+limit buckets and drops subscriptions (the events relay resubscribes). Run
+one per deployment and point RATE_LIMIT_REDIS_URL and EVENTS_REDIS_URL at
+it:
+
+    python localredis.py --host 0.0.0.0 --port 6379
+"""
+
+import time
+import asyncio
+import hashlib
+import logging
+import argparse
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_TAG = b'-- foodforall:'
+MAX_SUBSCRIBER_BUFFER = 4 * 1024 * 1024
+
+
+class Error(Exception):
+    """Sent to the client as a RESP error reply"""
+
+
+def token_bucket(store, keys, args):
+    """Python copy of rate_limit.RedisBackend.SCRIPT"""
+    now = time.time()
+    rate, burst, cost = (float(a) for a in args[:3])
+    levels, allowed, retry = [], 1, 0.0
+    for key in keys:
+        tokens, updated, _ = store.get(key, (burst, now, None))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        levels.append(tokens)
+        if tokens < cost:
+            allowed = 0
+            retry = max(retry, (cost - tokens) / rate)
+    expires = now + int(-(-burst // rate)) + 1
+    for key, tokens in zip(keys, levels):
+        store[key] = (tokens - cost if allowed else tokens, now, expires)
+    return [allowed, repr(retry).encode()]
+
+
+SCRIPTS = {
+    'token_bucket': token_bucket,
+}
+
+
+class Server:
+    def __init__(self):
+        self.store = {}
+        self.scripts = {}
+        self.channels = {}  # channel -> set of subscribed writers
+
+    async def handle(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                command = await read_command(reader)
+                if command is None:
+                    break
+                name = command[0].upper()
+                if name == b'SUBSCRIBE':
+                    for channel in command[1:]:
+                        subscribed.add(channel)
+                        self.channels.setdefault(channel, set()).add(writer)
+                        writer.write(encode([b'subscribe', channel, len(subscribed)]))
+                elif name == b'UNSUBSCRIBE':
+                    for channel in command[1:] or list(subscribed):
+                        subscribed.discard(channel)
+                        self.channels.get(channel, set()).discard(writer)
+                        writer.write(encode([b'unsubscribe', channel, len(subscribed)]))
+                else:
+                    try:
+                        reply = self.dispatch(command)
+                    except Error as e:
+                        reply = e
+                    writer.write(encode(reply))
+                await writer.drain()
+                if name == b'QUIT':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self.channels.get(channel, set()).discard(writer)
+            writer.close()
+
+    def dispatch(self, command):
+        name, args = command[0].upper(), command[1:]
+        if name == b'PING':
+            return args[0] if args else 'PONG'
+        if name == b'ECHO':
+            return args[0]
+        if name in (b'SELECT', b'CLIENT', b'QUIT'):
+            return 'OK'
+        if name == b'SCRIPT' and args:
+            sub = args[0].upper()
+            if sub == b'LOAD':
+                return self.load(args[1]).encode()
+            if sub == b'EXISTS':
+                return [int(sha.decode().lower() in self.scripts) for sha in args[1:]]
+            if sub == b'FLUSH':
+                self.scripts.clear()
+                return 'OK'
+        if name == b'PUBLISH':
+            channel, message = args
+            delivered = 0
+            for writer in list(self.channels.get(channel, ())):
+                # A subscriber that stops reading is dropped rather than buffered without bound
+                if writer.transport.get_write_buffer_size() > MAX_SUBSCRIBER_BUFFER:
+                    writer.close()
+                    continue
+                writer.write(encode([b'message', channel, message]))
+                delivered += 1
+            return delivered
+        if name == b'EVALSHA':
+            return self.evaluate(args[0].decode().lower(), args[1:])
+        if name == b'EVAL':
+            return self.evaluate(self.load(args[0]), args[1:])
+        raise Error(f"ERR unknown command '{name.decode(errors='replace')}'")
+
+    def load(self, body):
+        first_line = body.lstrip().split(b'\n', 1)[0]
+        if not first_line.startswith(SCRIPT_TAG):
+            raise Error('ERR localredis only runs scripts tagged -- foodforall:<name>')
+        handler = SCRIPTS.get(first_line[len(SCRIPT_TAG):].strip().decode())
+        if handler is None:
+            raise Error(f'ERR unknown script {first_line.decode(errors="replace")}')
+        sha = hashlib.sha1(body).hexdigest()
+        self.scripts[sha] = handler
+        return sha
+
+    def evaluate(self, sha, args):
+        handler = self.scripts.get(sha)
+        if handler is None:
+            raise Error('NOSCRIPT No matching script. Please use EVAL.')
+        num_keys = int(args[0])
+        keys = [k.decode() for k in args[1:1 + num_keys]]
+        self.expire()
+        return handler(self.store, keys, args[1 + num_keys:])
+
+    def expire(self):
+        now = time.time()
+        for key in [k for k, (_, _, expires) in self.store.items() if expires and expires < now]:
+            del self.store[key]
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        # Inline command, as typed into telnet or redis-cli --no-raw
+        return line.split() or [b'PING']
+    command = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        if not header.startswith(b'$'):
+            raise ConnectionError('malformed request')
+        size = int(header[1:])
+        command.append((await reader.readexactly(size + 2))[:-2])
+    return command
+
+
+def encode(reply):
+    if isinstance(reply, Error):
+        return f'-{reply}\r\n'.encode()
+    if isinstance(reply, str):
+        return f'+{reply}\r\n'.encode()
+    if isinstance(reply, int):
+        return f':{reply}\r\n'.encode()
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bytes):
+        return b'$%d\r\n%s\r\n' % (len(reply), reply)
+    return b'*%d\r\n' % len(reply) + b''.join(encode(item) for item in reply)
+
+
+async def serve(host, port):
+    server = Server()
+    listener = await asyncio.start_server(server.handle, host, port)
+    logger.info("localredis listening on %s:%s", host, port)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    options = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    asyncio.run(serve(options.host, options.port))
@@ -0,0 +1,192 @@
+"""
+Non-blocking, structured logging.
+
+``configure()`` puts one handler on the root logger. That handler hands
+records to a bounded in-memory queue, and a listener thread formats and
+writes them to stderr. Formatting happens on the listener thread: a
+request thread only checks sampling and enqueues a record with its
+unformatted ``msg`` and ``args``. If the queue is full, the record is
+dropped and counted in ``logging.dropped``, so a stalled collector never
+holds up a request.
+
+Lines are JSON objects (``LOG_FORMAT=text`` gives plain text for local use)
+with ts, level, logger, message and pid, plus whatever the call passes as
+``extra={'fields': {...}}``:
+
+    logger.info("Slow query", extra={'fields': {'ms': 412, 'query': fp}})
+
+``init_app`` adds an ``access`` log line per request with method, path,
+endpoint, status and duration. The werkzeug servers log their own request
+lines too; ``LOG_SAMPLING=werkzeug=0`` drops those.
+
+LOG_SAMPLING keeps only a fraction of the records below WARNING for noisy
+loggers, e.g. ``"access=0.05,db=0.2"``. A logger's rate also covers its
+children. Sampled lines carry ``sample_rate`` so they can be re-weighted
+downstream. Warnings and errors are always kept.
+
+Threads don't survive fork, so a worker calls ``configure()`` again after
+forking. It starts a fresh queue and listener for that process. ``stop()``
+drains the queue and must run before ``os._exit``.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import request
+import json_codec
+import metrics
+
+LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+FORMAT = os.getenv('LOG_FORMAT', 'json')
+QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+TEXT_FORMAT = '[%(process)d] %(levelname)s %(name)s: %(message)s'
+
+access_logger = logging.getLogger('access')
+
+
+def _parse_rates(value):
+    rates = {}
+    for entry in value.split(','):
+        name, _, rate = entry.partition('=')
+        if name.strip() and rate.strip():
+            rates[name.strip()] = float(rate)
+    return rates
+
+
+SAMPLING = _parse_rates(os.getenv('LOG_SAMPLING', ''))
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process,
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        sample_rate = getattr(record, 'sample_rate', None)
+        if sample_rate is not None:
+            entry['sample_rate'] = sample_rate
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        try:
+            return json_codec.dumps(entry).decode('utf-8')
+        except TypeError:
+            return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a fraction of the sub-WARNING records of the loggers in ``rates``"""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+        self._resolved = {}
+
+    def _rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            # Nearest configured ancestor: "db" covers "db.pool"
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Leave msg % args to the listener thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.incr('logging.dropped')
+
+
+_listener = None
+_pid = None
+
+
+def configure():
+    """Route all logging through the queue for this process (idempotent)"""
+    global _listener, _pid
+    if _pid == os.getpid():
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    records = queue.Queue(QUEUE_SIZE)
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if FORMAT == 'json' else logging.Formatter(TEXT_FORMAT))
+    handler = NonBlockingQueueHandler(records)
+    handler.addFilter(SamplingFilter(SAMPLING))
+    root.addHandler(handler)
+    root.setLevel(LEVEL)
+
+    # An inherited listener's thread did not survive fork; just replace it
+    _listener = QueueListener(records, output)
+    _listener.start()
+    if _pid is None:
+        atexit.register(stop)
+    _pid = os.getpid()
+
+
+def stop():
+    """Write out everything still queued and stop the listener"""
+    global _listener
+    if _listener is not None and _pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+def _start_timer():
+    # environ rather than g: batch sub-requests share g but have their own environ
+    request.environ['app.started'] = time.perf_counter()
+
+
+def _log_access(response):
+    started = request.environ.get('app.started')
+    access_logger.info("%s %s %s", request.method, request.path, response.status_code, extra={'fields': {
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'ms': round((time.perf_counter() - started) * 1000, 2) if started else None,
+        'remote': request.remote_addr,
+    }})
+    return response
+
+
+def init_app(app):
+    configure()
+    app.before_request(_start_timer)
+    app.after_request(_log_access)
@@ -0,0 +1,85 @@
+"""
+In-process metrics: counters, gauges and timings.
+
+Modules record with ``incr``/``set_gauge``/``observe`` and can register a
+collector for derived values (ratios, queue depths) that are computed when a
+snapshot is taken. ``snapshot()`` is served at ``GET /api/metrics``.
+
+Values are per worker process.
+"""
+
+import threading
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_timings = {}
+_collectors = []
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    return name + '{' + ','.join(f'{k}={v}' for k, v in sorted(labels.items())) + '}'
+
+
+def incr(name, value=1, **labels):
+    """Add ``value`` to a counter"""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name, value, **labels):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name, seconds, **labels):
+    """Record one timing sample"""
+    key = _key(name, labels)
+    with _lock:
+        timing = _timings.get(key)
+        if timing is None:
+            _timings[key] = [1, seconds, seconds]
+        else:
+            timing[0] += 1
+            timing[1] += seconds
+            if seconds > timing[2]:
+                timing[2] = seconds
+
+
+def get_counter(name, **labels):
+    return _counters.get(_key(name, labels), 0)
+
+
+def register_collector(fn):
+    """Register ``fn() -> dict`` whose values are added to each snapshot as gauges"""
+    _collectors.append(fn)
+    return fn
+
+
+def ratio(numerator, denominator):
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def snapshot():
+    """Return all metrics as a JSON-serializable dict"""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {
+            key: {'count': count, 'avg_ms': round(total / count * 1000, 3), 'max_ms': round(peak * 1000, 3)}
+            for key, (count, total, peak) in _timings.items()
+        }
+    for collector in _collectors:
+        gauges.update(collector())
+    return {'counters': counters, 'gauges': gauges, 'timings': timings}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
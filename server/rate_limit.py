@@ -0,0 +1,235 @@
+"""
+Token-bucket rate limiting for expensive routes.
+
+Each limited route has a bucket per client IP and per user (or, for login,
+per client IP and submitted email, so nobody can lock a victim out by
+spraying their address). A request is let through only if every one of its
+buckets has a token, and only then is a token taken from each, so a refused
+request does not drain the buckets that would have allowed it.
+
+Buckets live in an anonymous shared-memory segment mapped when this module
+is imported, so every worker forked from a preloaded master draws from the
+same buckets. For several nodes set RATE_LIMIT_BACKEND=redis and point
+RATE_LIMIT_REDIS_URL at Redis or any Redis-compatible server, such as
+``python localredis.py`` (see requirements-redis.txt for the client). Redis
+calls time out after RATE_LIMIT_REDIS_TIMEOUT seconds; while Redis is
+unreachable each node falls back to its shared-memory buckets.
+
+Limits are ``count/seconds`` strings, overridable per route with
+RATE_LIMIT_<NAME> (e.g. RATE_LIMIT_LOGIN=10/60). A refused request gets 429
+with Retry-After.
+
+Routes marked ``expensive`` also share a per-process concurrency gate. When
+bcrypt or upload work saturates it, further expensive calls get 503 right
+away, and the worker threads stay free for the cheap endpoints.
+"""
+
+import os
+import math
+import mmap
+import time
+import struct
+import hashlib
+import threading
+import logging
+import multiprocessing
+from functools import wraps
+from flask import request
+import metrics
+from utils import format_response
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'login': '10/60',
+    'register': '5/300',
+    'upload': '30/60',
+    'bulk_register': '10/3600',
+    'holds': '30/60',
+}
+
+REDIS_TIMEOUT = float(os.getenv('RATE_LIMIT_REDIS_TIMEOUT', 0.25))
+EXPENSIVE_CONCURRENCY = int(os.getenv('RATE_LIMIT_EXPENSIVE_CONCURRENCY', os.cpu_count() or 2))
+TRUST_FORWARDED = os.getenv('RATE_LIMIT_TRUST_FORWARDED', 'false').lower() == 'true'
+
+
+def parse_limit(value):
+    """'10/60' -> (refill rate per second, burst size)"""
+    count, _, seconds = value.partition('/')
+    count, seconds = float(count), float(seconds or 1)
+    return count / seconds, count
+
+
+def get_limit(name):
+    return parse_limit(os.getenv(f'RATE_LIMIT_{name.upper()}', DEFAULT_LIMITS[name]))
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    tokens = min(burst, tokens + (now - updated) * rate)
+    if tokens >= cost:
+        return True, tokens - cost, 0.0
+    return False, tokens, (cost - tokens) / rate
+
+
+class SharedMemoryBackend:
+    """Fixed table of buckets in an anonymous mmap shared across fork.
+
+    Keys hash to a slot with a short linear probe; when all probed slots are
+    taken by other keys the least recently touched one is recycled, which at
+    worst hands a client a fresh bucket.
+    """
+
+    SLOT = struct.Struct('<Qdd')  # key hash, tokens, last update (monotonic)
+    PROBE = 4
+
+    def __init__(self, slots=8192):
+        self.slots = slots
+        self._map = mmap.mmap(-1, slots * self.SLOT.size)
+        self._lock = multiprocessing.Lock()
+
+    def take(self, keys, rate, burst, cost=1):
+        """Take ``cost`` from every bucket in ``keys``, or from none; returns (allowed, retry after)"""
+        now = time.monotonic()
+        with self._lock:
+            buckets = []
+            for key in keys:
+                key_hash = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little') or 1
+                offset = self._find_slot(key_hash)
+                stored_hash, tokens, updated = self.SLOT.unpack_from(self._map, offset)
+                if stored_hash != key_hash:
+                    tokens, updated = burst, now
+                buckets.append((offset, key_hash, _refill(tokens, updated, now, rate, burst, cost)))
+            allowed = all(refill[0] for _, _, refill in buckets)
+            retry_after = max((refill[2] for _, _, refill in buckets), default=0.0)
+            for offset, key_hash, (ok, tokens, _) in buckets:
+                # _refill already took the cost from buckets that had it; put it back if another refused
+                if ok and not allowed:
+                    tokens += cost
+                self.SLOT.pack_into(self._map, offset, key_hash, tokens, now)
+        return allowed, retry_after
+
+    def _find_slot(self, key_hash):
+        start = key_hash % self.slots
+        oldest_offset, oldest_time = None, None
+        for i in range(self.PROBE):
+            offset = ((start + i) % self.slots) * self.SLOT.size
+            stored_hash, _, updated = self.SLOT.unpack_from(self._map, offset)
+            if stored_hash in (key_hash, 0):
+                return offset
+            if oldest_time is None or updated < oldest_time:
+                oldest_offset, oldest_time = offset, updated
+        return oldest_offset
+
+
+class RedisBackend:
+    """Buckets in Redis (or a Redis-compatible server) for multi-node deployments"""
+
+    # The first line names the script for localredis.py, which runs its own copy of it
+    SCRIPT = """-- foodforall:token_bucket
+    local now_parts = redis.call('TIME')
+    local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+    local rate, burst, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    local levels, allowed, retry = {}, 1, 0
+    for i, key in ipairs(KEYS) do
+        local tokens = tonumber(redis.call('HGET', key, 't'))
+        local updated = tonumber(redis.call('HGET', key, 'u'))
+        if tokens == nil then tokens = burst; updated = now end
+        tokens = math.min(burst, tokens + (now - updated) * rate)
+        levels[i] = tokens
+        if tokens < cost then
+            allowed = 0
+            retry = math.max(retry, (cost - tokens) / rate)
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        local tokens = levels[i]
+        if allowed == 1 then tokens = tokens - cost end
+        redis.call('HSET', key, 't', tokens, 'u', now)
+        redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+    end
+    return {allowed, tostring(retry)}
+    """
+
+    def __init__(self, url, fallback):
+        import redis  # optional dependency, see requirements-redis.txt
+        self._client = redis.Redis.from_url(url, socket_connect_timeout=REDIS_TIMEOUT, socket_timeout=REDIS_TIMEOUT)
+        self._script = self._client.register_script(self.SCRIPT)
+        self._fallback = fallback
+
+    def take(self, keys, rate, burst, cost=1):
+        try:
+            allowed, retry_after = self._script(keys=[f'ratelimit:{key}' for key in keys], args=[rate, burst, cost])
+        except Exception as e:
+            # A stalled Redis must not stall logins; limit per node until it is back
+            metrics.incr('rate_limit.backend_errors')
+            logger.warning("Rate limit backend unavailable, using local buckets: %s", e)
+            return self._fallback.take(keys, rate, burst, cost)
+        return bool(allowed), float(retry_after)
+
+
+def create_backend():
+    local = SharedMemoryBackend(int(os.getenv('RATE_LIMIT_SLOTS', 8192)))
+    if os.getenv('RATE_LIMIT_BACKEND', 'shm') == 'redis':
+        return RedisBackend(os.getenv('RATE_LIMIT_REDIS_URL', 'redis://localhost:6379/0'), fallback=local)
+    return local
+
+
+# Created at import so a preloading master maps it before forking workers
+backend = create_backend()
+_expensive_gate = threading.BoundedSemaphore(EXPENSIVE_CONCURRENCY)
+
+
+def client_ip():
+    if TRUST_FORWARDED and request.headers.get('X-Forwarded-For'):
+        return request.headers['X-Forwarded-For'].split(',')[0].strip()
+    return request.remote_addr or 'unknown'
+
+
+def _bucket_keys(name, per):
+    keys = []
+    if 'ip' in per:
+        keys.append(f'{name}:ip:{client_ip()}')
+    if 'user' in per and getattr(request, 'user', None):
+        keys.append(f"{name}:user:{request.user['user_id']}")
+    if 'email' in per:
+        # Paired with the IP: a bucket per email alone lets anyone lock its owner out
+        data = request.get_json(silent=True) or {}
+        if isinstance(data.get('email'), str):
+            keys.append(f"{name}:email:{client_ip()}:{data['email'].strip().lower()}")
+    return keys
+
+
+def _too_many(retry_after, status=429, message='Too many requests', error='Rate limit exceeded'):
+    response = format_response('error', message, error=error)
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response, status
+
+
+def rate_limit(name, per=('ip', 'user'), expensive=False):
+    """Decorator to apply the named token-bucket limit to a route.
+
+    Place it below token_required so per-user buckets can see request.user.
+    """
+    rate, burst = get_limit(name)
+
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            allowed, retry_after = backend.take(_bucket_keys(name, per), rate, burst)
+            if not allowed:
+                metrics.incr('rate_limit.limited', route=name)
+                return _too_many(retry_after)
+            metrics.incr('rate_limit.allowed', route=name)
+
+            if not expensive:
+                return f(*args, **kwargs)
+
+            if not _expensive_gate.acquire(blocking=False):
+                metrics.incr('rate_limit.shed', route=name)
+                return _too_many(1, status=503, message='Server busy, try again shortly', error='Service unavailable')
+            try:
+                return f(*args, **kwargs)
+            finally:
+                _expensive_gate.release()
+        return decorated
+    return decorator
@@ -0,0 +1,263 @@
+"""
+Ranked "recommended donations" for consumers and NGOs.
+
+A donation's score is a weighted sum of four features:
+
+    urgency    exp(-days to expiry / RECOMMEND_URGENCY_DAYS); expired ones are dropped
+    quantity   log(1 + quantity), scaled so the largest donation scores 1
+    freshness  exp(-days since posting / RECOMMEND_FRESHNESS_DAYS)
+    affinity   the requester's preference for the donation's food item, 0..1
+
+RECOMMEND_WEIGHTS sets the weights, e.g. ``"urgency=1,affinity=2"``. The
+first three features depend only on the donation. They are computed once
+per feed snapshot and day, over the whole ``donation_feed`` snapshot. A
+request adds the user's affinity column and takes the top K with
+``argpartition``. That makes a request O(donations) vectorized work with no
+query beyond the user's preferences. Until the feed is built, the most
+urgent donations are served from SQL instead.
+
+Preferences come from a batch job. ``refresh_preferences`` sums each user's
+past requests per food item over RECOMMEND_HISTORY_DAYS. Each request is
+decayed with a RECOMMEND_HALF_LIFE_DAYS half-life, and the job keeps every
+user's top RECOMMEND_TOP_ITEMS items, scaled so the favourite is 1. It
+writes them to ``user_preferences``. Every worker runs it every
+RECOMMEND_REFRESH_SECONDS, but a MySQL named lock lets only one through at
+a time. ``python recommendations.py refresh`` runs it by hand. Users with no
+history rank on the donation features alone.
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from datetime import date, datetime
+import numpy as np
+import db
+import metrics
+import donation_feed
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('RECOMMEND_ENABLED', 'true').lower() == 'true'
+HISTORY_DAYS = int(os.getenv('RECOMMEND_HISTORY_DAYS', 180))
+HALF_LIFE_DAYS = float(os.getenv('RECOMMEND_HALF_LIFE_DAYS', 30))
+TOP_ITEMS = int(os.getenv('RECOMMEND_TOP_ITEMS', 16))
+URGENCY_DAYS = float(os.getenv('RECOMMEND_URGENCY_DAYS', 3))
+FRESHNESS_DAYS = float(os.getenv('RECOMMEND_FRESHNESS_DAYS', 7))
+REFRESH_SECONDS = float(os.getenv('RECOMMEND_REFRESH_SECONDS', 3600))
+WRITE_BATCH = int(os.getenv('RECOMMEND_WRITE_BATCH', 1000))
+MAX_LIMIT = 100
+
+LOCK_NAME = 'foodforall.recommendations'
+
+
+def _parse_weights(value):
+    weights = {'urgency': 1.0, 'quantity': 0.3, 'freshness': 0.5, 'affinity': 2.0}
+    for entry in value.split(','):
+        name, _, weight = entry.partition('=')
+        if name.strip() in weights and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+WEIGHTS = _parse_weights(os.getenv('RECOMMEND_WEIGHTS', ''))
+
+
+def normalize_item(name):
+    return name.strip().lower()
+
+
+# -- ranking ---------------------------------------------------------------
+
+class Ranker:
+    """Scores snapshots; caches the donation-only part per (snapshot version, day)"""
+
+    def __init__(self):
+        self._cached = (None, None)  # (key, base scores), swapped as one
+        self._codes = {}  # normalized food item -> vocabulary codes spelling it
+        self._indexed = 0
+        self._lock = threading.Lock()
+
+    def base_scores(self, snapshot, today=None):
+        today = today or date.today()
+        key = (snapshot.version, today)
+        cached_key, cached = self._cached
+        if cached_key == key:
+            return cached
+        day = np.datetime64(today, 'D')
+        days_left = (snapshot.expiry - day).astype(np.float32)
+        age_days = (day.astype('datetime64[s]') - snapshot.created).astype(np.float32) / 86400
+        quantity = np.log1p(snapshot.quantity.astype(np.float32))
+        if len(quantity) and quantity.max() > 0:
+            quantity /= quantity.max()
+        base = (WEIGHTS['urgency'] * np.exp(-np.clip(days_left, 0, None) / URGENCY_DAYS)
+                + WEIGHTS['quantity'] * quantity
+                + WEIGHTS['freshness'] * np.exp(-np.clip(age_days, 0, None) / FRESHNESS_DAYS))
+        base[days_left < 0] = -np.inf
+        self._cached = (key, base)
+        return base
+
+    def _affinity(self, vocabulary, preferences):
+        """Preference weight per vocabulary code"""
+        with self._lock:
+            names = vocabulary.names
+            for code in range(self._indexed, len(names)):
+                self._codes.setdefault(normalize_item(names[code]), []).append(code)
+            self._indexed = len(names)
+            affinity = np.zeros(self._indexed, dtype=np.float32)
+            for item, weight in preferences.items():
+                affinity[self._codes.get(item, [])] = weight
+        return affinity
+
+    def top(self, snapshot, vocabulary, preferences, limit, today=None):
+        """(positions, scores) of the ``limit`` best donations, best first"""
+        scores = self.base_scores(snapshot, today)
+        if preferences:
+            scores = scores + WEIGHTS['affinity'] * self._affinity(vocabulary, preferences)[snapshot.item]
+        k = min(limit, len(scores))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        best = np.argpartition(-scores, k - 1)[:k]
+        # Ties go to the newer donation, like the default feed order
+        best = best[np.lexsort((-snapshot.ids[best], -scores[best]))]
+        best = best[np.isfinite(scores[best])]
+        return best, scores[best]
+
+
+ranker = Ranker()
+
+FALLBACK_QUERY = """
+    SELECT d.*, u.full_name as donor_name
+    FROM fooddonations d JOIN users u ON d.donor_id = u.user_id
+    WHERE d.status = 'available' AND d.expiry_date >= CURRENT_DATE()
+    ORDER BY d.expiry_date, d.created_at DESC
+    LIMIT %s
+"""
+
+
+def preferences(user_id):
+    rows = db.fetch_all("SELECT food_item, weight FROM user_preferences WHERE user_id = %s", (user_id,), prepare=True)
+    return {row['food_item']: row['weight'] for row in rows}
+
+
+def recommend(user_id, limit):
+    """The user's top ``limit`` available donations, each with its ``score``"""
+    snapshot = donation_feed.feed.current
+    if snapshot is None:
+        metrics.incr('recommendations.fallback')
+        donations = db.fetch_all(FALLBACK_QUERY, (limit,))
+        for donation in donations:
+            if donation['donation_image']:
+                donation['donation_image'] = f"/uploads/donation_images/{donation['donation_image']}"
+        return donations
+    prefs = preferences(user_id)
+    started = time.perf_counter()
+    positions, scores = ranker.top(snapshot, donation_feed.feed.vocabulary, prefs, limit)
+    metrics.observe('recommendations.rank', time.perf_counter() - started)
+    return [dict(row, score=round(float(score), 4))
+            for row, score in zip(snapshot.rows[positions].tolist(), scores.tolist())]
+
+
+# -- preference batch job ---------------------------------------------------
+
+PREFERENCE_QUERY = """
+    SELECT r.requester_id, LOWER(TRIM(d.food_item)) AS item,
+           SUM(POW(0.5, TIMESTAMPDIFF(SECOND, r.created_at, NOW()) / 86400 / %s)) AS weight
+    FROM all_requests r JOIN all_fooddonations d ON d.donation_id = r.donation_id
+    WHERE r.created_at >= NOW() - INTERVAL %s DAY
+    GROUP BY r.requester_id, item
+"""
+
+UPSERT_QUERY = """
+    INSERT INTO user_preferences (user_id, food_item, weight, computed_at)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE weight = VALUES(weight), computed_at = VALUES(computed_at)
+"""
+
+
+def top_items(users, weights, limit=TOP_ITEMS):
+    """Indexes of each user's ``limit`` heaviest rows, and those weights scaled to the user's max.
+
+    ``users`` and ``weights`` are aligned arrays with one row per (user, item).
+    """
+    order = np.lexsort((-weights, users))
+    users, weights = users[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    group = np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    keep = np.arange(len(users)) - group < limit
+    scaled = weights / weights[group]
+    return order[keep], scaled[keep]
+
+
+def refresh_preferences():
+    """Recompute user_preferences; returns how many users have one, or None if another run holds the lock"""
+    acquired = db.execute_query("SELECT GET_LOCK(%s, 0) AS acquired", (LOCK_NAME,)).fetchone()['acquired']
+    if not acquired:
+        return None
+    started = time.monotonic()
+    computed_at = datetime.now().replace(microsecond=0)
+    try:
+        _, rows = db.fetch_columns(PREFERENCE_QUERY, (HALF_LIFE_DAYS, HISTORY_DAYS))
+        if rows:
+            users = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+            weights = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+            keep, scaled = top_items(users, weights)
+            batch = [(int(users[i]), rows[i][1], round(float(w), 6), computed_at)
+                     for i, w in zip(keep.tolist(), scaled.tolist())]
+            for i in range(0, len(batch), WRITE_BATCH):
+                db.insert_many(UPSERT_QUERY, batch[i:i + WRITE_BATCH])
+        # Whatever this run didn't write is stale (items dropped out of the top, quiet users)
+        while db.delete("DELETE FROM user_preferences WHERE computed_at < %s LIMIT %s", (computed_at, WRITE_BATCH)):
+            pass
+    finally:
+        db.execute_query("SELECT RELEASE_LOCK(%s) AS released", (LOCK_NAME,))
+    count = len(np.unique(users)) if rows else 0
+    metrics.observe('recommendations.refresh', time.monotonic() - started)
+    metrics.set_gauge('recommendations.users', count)
+    logger.info("Refreshed preferences for %d users", count)
+    return count
+
+
+def _loop(app):
+    # Spread workers out so they don't all race for the lock at once
+    time.sleep(random.uniform(0, REFRESH_SECONDS))
+    while True:
+        try:
+            with app.app_context():
+                refresh_preferences()
+        except Exception as e:
+            metrics.incr('recommendations.refresh_failures')
+            logger.error("Preference refresh failed: %s", e)
+        time.sleep(REFRESH_SECONDS)
+
+
+_thread = None
+
+
+def init_app(app):
+    """Refresh preferences in the background from this worker"""
+    global _thread
+    if not ENABLED or _thread is not None:
+        return
+    _thread = threading.Thread(target=_loop, args=(app,), name='recommendations', daemon=True)
+    _thread.start()
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Recompute per-user donation preferences")
+    parser.add_argument('command', choices=['refresh'])
+    parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    with app.app_context():
+        count = refresh_preferences()
+    print("Another refresh is running" if count is None else f"Refreshed preferences for {count} users")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+"""
+Manual check of read-replica routing in db.py against two local MySQL instances.
+
+The two servers do not need to replicate: the script writes only to the
+primary and uses the missing row on the "replica" to see where each read went.
+
+Usage:
+    MYSQL_PORT=3306 MYSQL_REPLICAS=127.0.0.1:3307 READ_YOUR_WRITES_SECONDS=1 python replica_test.py
+
+Both instances need the MYSQL_DB database and the same credentials.
+"""
+
+import time
+from flask import Flask, request
+import db
+
+TABLE = "replica_check"
+
+
+def where_did_it_go(marker):
+    row = db.fetch_one(f"SELECT marker FROM {TABLE} WHERE marker = %s", (marker,))
+    return 'primary' if row else 'replica'
+
+
+def main():
+    app = Flask(__name__)
+    db.init_app(app)
+    app.teardown_appcontext(db.close_db)
+    assert db._replicas, "Set MYSQL_REPLICAS to at least one host:port"
+
+    # Create the scratch table on both servers
+    with app.app_context():
+        db.execute_query(f"CREATE TABLE IF NOT EXISTS {TABLE} (marker VARCHAR(64) PRIMARY KEY)")
+        replica_conn = db._replicas[0].connect(app.config)
+        replica_conn.cursor().execute(f"CREATE TABLE IF NOT EXISTS {TABLE} (marker VARCHAR(64) PRIMARY KEY)")
+        replica_conn.close()
+
+    marker = f"m{time.time_ns()}"
+
+    # 1. A write pins the writer's reads to the primary
+    with app.test_request_context('/'):
+        request.user = {'user_id': 42, 'role': 'donor'}
+        db.insert(f"INSERT INTO {TABLE} (marker) VALUES (%s)", (marker,))
+        print("same request after write  ->", where_did_it_go(marker))
+    with app.test_request_context('/'):
+        request.user = {'user_id': 42, 'role': 'donor'}
+        print("next request, same user   ->", where_did_it_go(marker))
+
+    # 2. Other users read from the replica
+    with app.test_request_context('/'):
+        request.user = {'user_id': 7, 'role': 'consumer'}
+        print("other user                ->", where_did_it_go(marker))
+
+    # 3. The pin expires
+    time.sleep(db.READ_YOUR_WRITES_SECONDS + 0.1)
+    with app.test_request_context('/'):
+        request.user = {'user_id': 42, 'role': 'donor'}
+        print("same user after window    ->", where_did_it_go(marker))
+
+    # 4. Explicit transactions stay on the primary
+    with app.test_request_context('/'):
+        request.user = {'user_id': 7, 'role': 'consumer'}
+        with db.transaction():
+            print("inside transaction        ->", where_did_it_go(marker))
+
+    # 5. An unreachable replica falls back to the primary and is skipped afterwards
+    dead = db.Replica('127.0.0.1', 1)
+    dead.pool = db.ConnectionPool(lambda: dead.connect(app.config), 1)
+    db._replicas.append(dead)
+    for r in db._replicas[:-1]:
+        r.down_until = time.monotonic() + 60
+    with app.test_request_context('/'):
+        request.user = {'user_id': 7, 'role': 'consumer'}
+        print("dead replica              ->", where_did_it_go(marker))
+    print("dead replica marked down  ->", not db._replicas[-1].healthy)
+
+    with app.app_context():
+        db.delete(f"DELETE FROM {TABLE} WHERE marker = %s", (marker,))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""
+Daily rollups of donation and request activity.
+
+``daily_rollups`` holds one row per (day, dimension, dimension_value). The
+'all' dimension covers the whole platform; the 'food_item' dimension has one
+row per item. Write paths call ``record`` in their transaction to add to
+today's rows, so charts never touch the raw tables.
+
+``series`` answers a date window by reading at most one row per day. It
+builds prefix sums over the days, so each day, week or month bucket is the
+difference of two prefix entries.
+
+Backfill (or rebuild) a date range from the raw tables with:
+
+    python rollups.py backfill --start 2024-01-01 [--end 2024-12-31]
+
+Days are taken from created_at, and for approvals and rejections from the
+request's updated_at.
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+import db
+
+logger = logging.getLogger(__name__)
+
+METRICS = (
+    'donations',
+    'quantity_donated',
+    'requests_created',
+    'quantity_requested',
+    'requests_approved',
+    'quantity_approved',
+    'requests_rejected',
+)
+
+DIMENSIONS = ('all', 'food_item')
+BUCKETS = ('day', 'week', 'month')
+MAX_DAYS = 3660
+BACKFILL_CHUNK_DAYS = 31
+
+_RECORD_QUERY = (
+    f"INSERT INTO daily_rollups (day, dimension, dimension_value, {', '.join(METRICS)}) VALUES "
+    + ', '.join([f"(CURDATE(), %s, %s, {', '.join(['%s'] * len(METRICS))})"] * 2)
+    + " ON DUPLICATE KEY UPDATE "
+    + ', '.join(f"{m} = {m} + VALUES({m})" for m in METRICS)
+)
+
+
+def record(food_item, **counts):
+    """Add ``counts`` (metric=amount) to today's platform and food-item rows.
+
+    Call inside the writer's transaction so the rollup commits with the change.
+    """
+    values = tuple(counts.get(m, 0) for m in METRICS)
+    db.execute_query(
+        _RECORD_QUERY,
+        ('all', '') + values + ('food_item', _item_key(food_item)) + values,
+        commit=True,
+        prepare=True
+    )
+
+
+def _item_key(food_item):
+    return (food_item or '').strip().lower()[:255]
+
+
+# -- range queries ---------------------------------------------------------
+
+def series(start, end, dimension='all', value='', bucket='day'):
+    """Per-bucket totals and approval rates for ``start``..``end`` inclusive"""
+    days = (end - start).days + 1
+    rows = db.fetch_all(
+        f"""SELECT day, {', '.join(METRICS)} FROM daily_rollups
+            WHERE dimension = %s AND dimension_value = %s AND day BETWEEN %s AND %s
+            ORDER BY day""",
+        (dimension, _item_key(value) if dimension == 'food_item' else '', start, end),
+        prepare=True
+    )
+    by_day = {row['day']: row for row in rows}
+
+    # prefix[m][i] = total of metric m over the first i days of the window
+    prefix = {m: [0] * (days + 1) for m in METRICS}
+    for i in range(days):
+        row = by_day.get(start + timedelta(days=i))
+        for m in METRICS:
+            prefix[m][i + 1] = prefix[m][i] + (int(row[m]) if row else 0)
+
+    points = []
+    for first, last in _buckets(start, end, bucket):
+        lo, hi = (first - start).days, (last - start).days + 1
+        point = {'start': first.isoformat(), 'end': last.isoformat()}
+        point.update({m: prefix[m][hi] - prefix[m][lo] for m in METRICS})
+        decided = point['requests_approved'] + point['requests_rejected']
+        point['approval_rate'] = round(point['requests_approved'] / decided, 4) if decided else None
+        points.append(point)
+    totals = {m: prefix[m][days] for m in METRICS}
+    return points, totals
+
+
+def _buckets(start, end, bucket):
+    first = start
+    while first <= end:
+        if bucket == 'week':
+            last = first + timedelta(days=6 - first.weekday())
+        elif bucket == 'month':
+            next_month = (first.replace(day=1) + timedelta(days=32)).replace(day=1)
+            last = next_month - timedelta(days=1)
+        else:
+            last = first
+        last = min(last, end)
+        yield first, last
+        first = last + timedelta(days=1)
+
+
+# -- backfill --------------------------------------------------------------
+
+# Each source yields (day, dimension_value, amount...) for the 'food_item' dimension
+_SOURCES = [
+    (('donations', 'quantity_donated'),
+     """SELECT DATE(d.created_at) AS day, LOWER(TRIM(d.food_item)) AS item, COUNT(*), SUM(d.quantity)
+        FROM all_fooddonations d WHERE d.created_at >= %s AND d.created_at < %s
+        GROUP BY day, item"""),
+    (('requests_created', 'quantity_requested'),
+     """SELECT DATE(r.created_at) AS day, LOWER(TRIM(d.food_item)) AS item, COUNT(*), SUM(r.quantity_requested)
+        FROM all_requests r JOIN all_fooddonations d ON d.donation_id = r.donation_id
+        WHERE r.created_at >= %s AND r.created_at < %s
+        GROUP BY day, item"""),
+    (('requests_approved', 'quantity_approved'),
+     """SELECT DATE(r.updated_at) AS day, LOWER(TRIM(d.food_item)) AS item, COUNT(*), SUM(r.quantity_requested)
+        FROM all_requests r JOIN all_fooddonations d ON d.donation_id = r.donation_id
+        WHERE r.status = 'approved' AND r.updated_at >= %s AND r.updated_at < %s
+        GROUP BY day, item"""),
+    (('requests_rejected',),
+     """SELECT DATE(r.updated_at) AS day, LOWER(TRIM(d.food_item)) AS item, COUNT(*)
+        FROM all_requests r JOIN all_fooddonations d ON d.donation_id = r.donation_id
+        WHERE r.status = 'rejected' AND r.updated_at >= %s AND r.updated_at < %s
+        GROUP BY day, item"""),
+]
+
+
+def backfill(start, end):
+    """Rebuild the rollups for ``start``..``end`` inclusive from the raw tables"""
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + timedelta(days=BACKFILL_CHUNK_DAYS - 1))
+        with db.transaction():
+            # The DELETE locks the range, so live writers for these days wait and add on top
+            db.delete("DELETE FROM daily_rollups WHERE day BETWEEN %s AND %s", (chunk_start, chunk_end))
+            rows = _aggregate(chunk_start, chunk_end + timedelta(days=1))
+            if rows:
+                db.insert_many(
+                    f"""INSERT INTO daily_rollups (day, dimension, dimension_value, {', '.join(METRICS)})
+                        VALUES (%s, %s, %s, {', '.join(['%s'] * len(METRICS))})""",
+                    rows
+                )
+        logger.info("Backfilled %s..%s (%d rows)", chunk_start, chunk_end, len(rows))
+        chunk_start = chunk_end + timedelta(days=1)
+
+
+def _aggregate(start, end_exclusive):
+    totals = {}  # (day, dimension, value) -> {metric: amount}
+    for metrics, query in _SOURCES:
+        for row in db.fetch_all(query, (start, end_exclusive)):
+            values = list(row.values())
+            day, item, amounts = values[0], _item_key(values[1]), values[2:]
+            for key in ((day, 'all', ''), (day, 'food_item', item)):
+                bucket = totals.setdefault(key, dict.fromkeys(METRICS, 0))
+                for metric, amount in zip(metrics, amounts):
+                    bucket[metric] += int(amount or 0)
+    return [key + tuple(counts[m] for m in METRICS) for key, counts in sorted(totals.items())]
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Rebuild daily rollups from the raw tables")
+    parser.add_argument('command', choices=['backfill'])
+    parser.add_argument('--start', required=True, type=lambda s: datetime.strptime(s, '%Y-%m-%d').date())
+    parser.add_argument('--end', type=lambda s: datetime.strptime(s, '%Y-%m-%d').date(), default=date.today())
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    with app.app_context():
+        backfill(args.start, args.end)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+from datetime import date, datetime, timedelta
+from flask import Blueprint, request
+import rollups
+from deadlines import stale_on_timeout
+from utils import token_required, format_response
+
+# Create blueprint
+analytics_bp = Blueprint('analytics', __name__)
+
+@analytics_bp.route('/daily', methods=['GET'])
+@token_required
+@stale_on_timeout
+def get_daily_series():
+    """Get donation and request activity per day, week or month from the daily rollups"""
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if 'end' in request.args else date.today()
+        start = datetime.strptime(request.args['start'], '%Y-%m-%d').date() if 'start' in request.args else end - timedelta(days=29)
+    except ValueError:
+        return format_response('error', 'Invalid date format (YYYY-MM-DD)', error='Validation error'), 400
+    
+    if start > end:
+        return format_response('error', 'start must not be after end', error='Validation error'), 400
+    if (end - start).days + 1 > rollups.MAX_DAYS:
+        return format_response('error', f'Range cannot exceed {rollups.MAX_DAYS} days', error='Validation error'), 400
+    
+    dimension = request.args.get('dimension', 'all')
+    if dimension not in rollups.DIMENSIONS:
+        return format_response('error', f'Dimension must be one of: {list(rollups.DIMENSIONS)}', error='Validation error'), 400
+    value = request.args.get('value', '')
+    if dimension == 'food_item' and not value:
+        return format_response('error', 'value is required for the food_item dimension', error='Validation error'), 400
+    
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in rollups.BUCKETS:
+        return format_response('error', f'Bucket must be one of: {list(rollups.BUCKETS)}', error='Validation error'), 400
+    
+    try:
+        points, totals = rollups.series(start, end, dimension, value, bucket)
+        return format_response('success', 'Daily series retrieved successfully', data={
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'dimension': dimension,
+            'value': value,
+            'bucket': bucket,
+            'points': points,
+            'totals': totals
+        }), 200
+    except Exception as e:
+        return format_response('error', 'Failed to retrieve daily series', error=str(e)), 500
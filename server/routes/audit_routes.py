@@ -0,0 +1,63 @@
+from flask import Blueprint, request, current_app
+import db
+import audit
+from utils import token_required, format_response
+
+# Create blueprint
+audit_bp = Blueprint('audit', __name__)
+
+MAX_LIMIT = 200
+
+# The parties to a donation or request, hot or archived
+PARTIES_QUERIES = {
+    'donation_id': "SELECT donor_id FROM all_fooddonations WHERE donation_id = %s",
+    'request_id': """
+        SELECT r.requester_id, d.donor_id
+        FROM all_requests r JOIN all_fooddonations d ON r.donation_id = d.donation_id
+        WHERE r.request_id = %s
+    """,
+}
+
+def _forbidden(subject, subject_id):
+    """An error response unless the caller is an admin or a party to the subject"""
+    if request.user['role'] == 'admin':
+        return None
+    try:
+        parties = db.fetch_one(PARTIES_QUERIES[subject], (subject_id,))
+    except Exception as e:
+        current_app.logger.error("Error checking audit access: %s", e)
+        return format_response('error', 'Failed to retrieve history', error=str(e)), 500
+    if not parties:
+        return format_response('error', 'Not found', error='Not found'), 404
+    if request.user['user_id'] not in parties.values():
+        return format_response('error', 'You can only view the history of your own donations and requests', error='Forbidden'), 403
+    return None
+
+def _history(subject, subject_id):
+    forbidden = _forbidden(subject, subject_id)
+    if forbidden:
+        return forbidden
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_LIMIT)
+    before = request.args.get('before', type=int)
+    try:
+        entries = audit.log.history(subject, subject_id, limit=limit, before=before)
+    except Exception as e:
+        current_app.logger.error("Error reading audit history: %s", e)
+        return format_response('error', 'Failed to retrieve history', error=str(e)), 500
+    return format_response('success', 'History retrieved successfully', data={
+        'events': entries,
+        # Pass back as ?before= for the next (older) page
+        'next_before': entries[-1]['event_id'] if len(entries) == limit else None
+    }), 200
+
+@audit_bp.route('/donations/<int:donation_id>', methods=['GET'])
+@token_required
+def get_donation_history(donation_id):
+    """Get the recorded events for a donation, newest first (admin or its donor)"""
+    return _history('donation_id', donation_id)
+
+@audit_bp.route('/requests/<int:request_id>', methods=['GET'])
+@token_required
+def get_request_history(request_id):
+    """Get the recorded events for a request, newest first (admin, its requester or the donor)"""
+    return _history('request_id', request_id)
@@ -0,0 +1,111 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, current_app, g
+import json_codec
+import metrics
+from utils import token_required, format_response
+
+# Create blueprint
+batch_bp = Blueprint('batch', __name__)
+
+MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 10))
+CONCURRENCY = int(os.getenv('BATCH_CONCURRENCY', 4))
+
+ALLOWED_METHODS = {'GET', 'POST', 'PUT'}
+# Streams never finish, and batches don't nest
+EXCLUDED_PREFIXES = ('/api/batch', '/api/events')
+# Per-sub-request headers the client may set; Authorization always comes from the batch
+FORWARDED_HEADERS = ('If-None-Match', 'If-Modified-Since')
+
+_executor = ThreadPoolExecutor(CONCURRENCY, thread_name_prefix='batch')
+
+def _validate(sub):
+    if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+        return 'Each request needs a path'
+    if not sub['path'].startswith('/api/') or sub['path'].startswith(EXCLUDED_PREFIXES):
+        return f"Path not allowed in a batch: {sub['path']}"
+    if sub.get('method', 'GET').upper() not in ALLOWED_METHODS:
+        return f"Method must be one of: {sorted(ALLOWED_METHODS)}"
+    return None
+
+def _dispatch(app, sub):
+    """Run one sub-request through the full Flask pipeline in a nested request context.
+
+    The nested context reuses the current app context, so the sub-request
+    shares ``g``: the decoded token and the pooled DB connection.
+    """
+    headers = {'Authorization': request.headers.get('Authorization', '')}
+    headers.update({k: v for k, v in (sub.get('headers') or {}).items() if k in FORWARDED_HEADERS})
+    with app.test_request_context(
+        sub['path'],
+        method=sub.get('method', 'GET').upper(),
+        headers=headers,
+        json=sub.get('body'),
+        environ_base={'REMOTE_ADDR': request.remote_addr}
+    ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            current_app.logger.error("Batch sub-request %s failed: %s", sub['path'], e)
+            response = format_response('error', 'Sub-request failed', error=str(e))
+            response.status_code = 500
+        return _encode(response)
+
+def _dispatch_isolated(app, sub, outer_headers, remote_addr, decoded_tokens):
+    """_dispatch for a worker thread: its own app context and connection, same decoded token"""
+    with app.app_context():
+        g.decoded_tokens = dict(decoded_tokens)
+        with app.test_request_context('/', headers=outer_headers, environ_base={'REMOTE_ADDR': remote_addr}):
+            return _dispatch(app, sub)
+
+def _encode(response):
+    body = response.get_data()
+    if response.mimetype != 'application/json' or not body:
+        body = json_codec.dumps(body.decode('utf-8', 'replace') or None)
+    headers = {k: response.headers[k] for k in ('ETag', 'Last-Modified', 'Retry-After') if k in response.headers}
+    return (b'{"status":' + str(response.status_code).encode('ascii')
+            + b',"headers":' + json_codec.dumps(headers)
+            + b',"body":' + body + b'}')
+
+@batch_bp.route('', methods=['POST'])
+@token_required
+def batch():
+    """Run several API calls in one round trip; responses come back in request order"""
+    data = request.get_json(silent=True) or {}
+    subs = data.get('requests')
+    if not isinstance(subs, list) or not subs:
+        return format_response('error', 'requests must be a non-empty list', error='Validation error'), 400
+    if len(subs) > MAX_REQUESTS:
+        return format_response('error', f'At most {MAX_REQUESTS} requests per batch', error='Validation error'), 400
+    for sub in subs:
+        problem = _validate(sub)
+        if problem:
+            return format_response('error', problem, error='Validation error'), 400
+
+    app = current_app._get_current_object()
+    parallel = bool(data.get('parallel'))
+    results = [None] * len(subs)
+
+    # Runs of consecutive GETs may go concurrently; writes run alone, in order
+    i = 0
+    while i < len(subs):
+        j = i
+        while parallel and j < len(subs) and subs[j].get('method', 'GET').upper() == 'GET':
+            j += 1
+        if j - i > 1:
+            outer_headers = {'Authorization': request.headers.get('Authorization', '')}
+            futures = [
+                _executor.submit(_dispatch_isolated, app, subs[k], outer_headers,
+                                 request.remote_addr, g.get('decoded_tokens', {}))
+                for k in range(i, j)
+            ]
+            for k, future in zip(range(i, j), futures):
+                results[k] = future.result()
+            i = j
+        else:
+            results[i] = _dispatch(app, subs[i])
+            i += 1
+
+    metrics.incr('batch.requests')
+    metrics.incr('batch.sub_requests', len(subs))
+    return format_response('success', 'Batch completed', raw_data=b'[' + b','.join(results) + b']'), 200
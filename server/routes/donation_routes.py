@@ -3,14 +3,32 @@ from datetime import datetime
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 import db
-from utils import token_required, role_required, save_file, format_response
+import events
+import stats
+import rollups
+import donation_feed
+import holds
+import recommendations
+import sync
+from rate_limit import rate_limit
+from deadlines import stale_on_timeout
+from utils import (
+    token_required, role_required, save_file, format_response,
+    make_validators, conditional_response, set_validators,
+    list_format, to_columnar, fetch_list, fingerprint
+)
 
 # Create blueprint
 donation_bp = Blueprint('donation', __name__)
 
+# What a listed donation shows, including its donor's name
+LIST_FINGERPRINT = ('d.donation_id', 'd.food_item', 'd.quantity', 'd.expiry_date', 'd.description',
+                    'd.status', 'd.donation_image', 'd.updated_at', 'u.full_name')
+
 @donation_bp.route('', methods=['POST'])
 @token_required
 @role_required(['donor'])
+@rate_limit('upload', expensive=True)
 def create_donation():
     """Create a new food donation"""
     # Get form data
@@ -48,13 +66,18 @@ def create_donation():
     
     # Insert donation into database
     try:
-        donation_id = db.insert(
-            "INSERT INTO fooddonations (food_item, quantity, expiry_date, description, donor_id, donation_image) VALUES (%s, %s, %s, %s, %s, %s)",
-            (food_item, quantity, expiry_date, description, request.user['user_id'], donation_image)
-        )
+        with db.transaction():
+            # Counters first: the row's updated_at must be stamped by the last statement before COMMIT (see sync.py)
+            stats.record_donation_created(request.user['user_id'], quantity)
+            rollups.record(food_item, donations=1, quantity_donated=quantity)
+            donation_id = db.insert(
+                "INSERT INTO fooddonations (food_item, quantity, expiry_date, description, donor_id, donation_image) VALUES (%s, %s, %s, %s, %s, %s)",
+                (food_item, quantity, expiry_date, description, request.user['user_id'], donation_image)
+            )
+        donation_feed.feed.notify()
         
         # Get the created donation
-        donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,))
+        donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,), prepare=True)
         
         # Format donation image URL if it exists
         if donation['donation_image']:
@@ -66,11 +89,46 @@ def create_donation():
 
 @donation_bp.route('', methods=['GET'])
 @token_required
+@stale_on_timeout
 def get_donations():
     """Get all donations with optional filtering"""
     # Get query parameters
     status = request.args.get('status')
-    donor_id = request.args.get('donor_id')
+    donor_id = request.args.get('donor_id', type=int)
+    food_item = request.args.get('food_item', '').strip()
+    sort = request.args.get('sort', 'newest')
+    limit = request.args.get('limit', type=int)
+    page = max(request.args.get('page', 1, type=int), 1)
+    offset = (page - 1) * limit if limit else 0
+    
+    if sort not in donation_feed.SORTS:
+        return format_response('error', f'Sort must be one of: {list(donation_feed.SORTS)}', error='Validation error'), 400
+    # type=int turns a malformed value into None, which would drop the filter (or the limit) entirely
+    for name, value in (('donor_id', donor_id), ('limit', limit)):
+        if value is None and request.args.get(name):
+            return format_response('error', f'{name} must be an integer', error='Validation error'), 400
+    
+    # The home feed is served from this worker's in-memory snapshot
+    snapshot = donation_feed.feed.current
+    if status == 'available' and snapshot is not None:
+        etag, last_modified = make_validators(
+            {'row_count': snapshot.version, 'last_modified': snapshot.changed_at},
+            'feed', donor_id, food_item, sort, page, limit, list_format(), request.args.get('orient')
+        )
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
+        
+        total, donations = snapshot.query(
+            donation_feed.feed.vocabulary, donor_id=donor_id, food_item=food_item,
+            sort=sort, offset=offset, limit=limit
+        )
+        if list_format() == 'columnar':
+            columns = list(donations[0]) if donations else []
+            donations = to_columnar(columns, [tuple(row.values()) for row in donations])
+        response = format_response('success', 'Donations retrieved successfully', data=donations)
+        response.headers['X-Total-Count'] = str(total)
+        return set_validators(response, etag, last_modified), 200
     
     # Build query
     query = "SELECT d.*, u.full_name as donor_name FROM fooddonations d JOIN users u ON d.donor_id = u.user_id"
@@ -87,35 +145,115 @@ def get_donations():
         where_clauses.append("d.donor_id = %s")
         params.append(donor_id)
     
+    if food_item:
+        where_clauses.append("d.food_item LIKE %s")
+        params.append(f"%{food_item}%")
+    
     # Add WHERE clause if filters exist
-    if where_clauses:
-        query += " WHERE " + " AND ".join(where_clauses)
+    where_sql = " WHERE " + " AND ".join(where_clauses) if where_clauses else ""
+    query += where_sql
     
     # Add ordering
-    query += " ORDER BY d.created_at DESC"
+    query += {
+        'newest': " ORDER BY d.created_at DESC, d.donation_id DESC",
+        'expiry': " ORDER BY d.expiry_date ASC, d.donation_id ASC",
+        'quantity': " ORDER BY d.quantity DESC, d.donation_id DESC",
+    }[sort]
     
     # Execute query
     try:
-        donations = db.fetch_all(query, params)
+        # Revalidate with one aggregate over the same rows and donors before fetching any
+        validators = db.fetch_one(
+            f"""SELECT COUNT(*) AS row_count, MAX(GREATEST(d.updated_at, u.updated_at)) AS last_modified,
+                       {fingerprint(*LIST_FINGERPRINT)}
+                FROM fooddonations d JOIN users u ON d.donor_id = u.user_id""" + where_sql,
+            params
+        )
+        etag, last_modified = make_validators(
+            validators, status, donor_id, food_item, sort, page, limit, list_format(), request.args.get('orient')
+        )
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
         
-        # Format donation image URLs
-        for donation in donations:
-            if donation['donation_image']:
-                donation['donation_image'] = f"/uploads/donation_images/{donation['donation_image']}"
+        if limit:
+            query += " LIMIT %s OFFSET %s"
+            params = params + [limit, offset]
+        donations = fetch_list(query, params, urls={'donation_image': '/uploads/donation_images/'})
         
-        return format_response('success', 'Donations retrieved successfully', data=donations), 200
+        response = format_response('success', 'Donations retrieved successfully', data=donations)
+        response.headers['X-Total-Count'] = str(validators['row_count'])
+        return set_validators(response, etag, last_modified), 200
     except Exception as e:
         return format_response('error', 'Failed to retrieve donations', error=str(e)), 500
 
+@donation_bp.route('/changes', methods=['GET'])
+@token_required
+def get_donation_changes():
+    """Donations changed since the ``since`` watermark (see sync.py)"""
+    status = request.args.get('status')
+    limit = request.args.get('limit', sync.DEFAULT_LIMIT, type=int)
+    valid_statuses = ['available', 'reserved', 'claimed']
+    if status and status not in valid_statuses:
+        return format_response('error', f'Status must be one of: {valid_statuses}', error='Validation error'), 400
+    if not 1 <= limit <= sync.MAX_LIMIT:
+        return format_response('error', f'Limit must be between 1 and {sync.MAX_LIMIT}', error='Validation error'), 400
+    try:
+        changes = sync.donation_changes(request.args.get('since'), status, limit)
+        return format_response('success', 'Donation changes retrieved successfully', data=changes), 200
+    except sync.WatermarkExpired:
+        return format_response('error', 'Watermark too old, reload the full list', error='Gone'), 410
+    except ValueError as e:
+        return format_response('error', str(e), error='Validation error'), 400
+    except Exception as e:
+        return format_response('error', 'Failed to retrieve donation changes', error=str(e)), 500
+
+@donation_bp.route('/recommended', methods=['GET'])
+@token_required
+@role_required(['consumer', 'ngo', 'admin'])
+def get_recommended_donations():
+    """Available donations ranked for the current user (see recommendations.py)"""
+    limit = request.args.get('limit', 20, type=int)
+    if not 1 <= limit <= recommendations.MAX_LIMIT:
+        return format_response('error', f'Limit must be between 1 and {recommendations.MAX_LIMIT}', error='Validation error'), 400
+    try:
+        donations = recommendations.recommend(request.user['user_id'], limit)
+        return format_response('success', 'Recommendations retrieved successfully', data=donations), 200
+    except Exception as e:
+        return format_response('error', 'Failed to retrieve recommendations', error=str(e)), 500
+
 @donation_bp.route('/<int:donation_id>', methods=['GET'])
 @token_required
 def get_donation(donation_id):
     """Get a single donation by ID"""
     try:
+        # Revalidate against the row's updated_at before fetching the join
+        validators = db.fetch_one(
+            "SELECT COUNT(*) AS row_count, MAX(updated_at) AS last_modified FROM fooddonations WHERE donation_id = %s",
+            (donation_id,),
+            prepare=True
+        )
+        table = 'fooddonations'
+        if not validators['row_count']:
+            # Finished donations are moved out by archive.py; archived rows never change again
+            archived = db.fetch_one(
+                "SELECT COUNT(*) AS row_count, MAX(updated_at) AS last_modified FROM fooddonations_archive WHERE donation_id = %s",
+                (donation_id,),
+                prepare=True
+            )
+            if archived['row_count']:
+                validators, table = archived, 'fooddonations_archive'
+        etag, last_modified = make_validators(validators, donation_id)
+        if validators['row_count']:
+            not_modified = conditional_response(etag, last_modified)
+            if not_modified:
+                return not_modified
+        
         # Get donation with donor information
         donation = db.fetch_one(
-            "SELECT d.*, u.full_name as donor_name FROM fooddonations d JOIN users u ON d.donor_id = u.user_id WHERE d.donation_id = %s",
-            (donation_id,)
+            f"SELECT d.*, u.full_name as donor_name FROM {table} d JOIN users u ON d.donor_id = u.user_id WHERE d.donation_id = %s",
+            (donation_id,),
+            prepare=True
         )
         
         if not donation:
@@ -125,7 +263,8 @@ def get_donation(donation_id):
         if donation['donation_image']:
             donation['donation_image'] = f"/uploads/donation_images/{donation['donation_image']}"
         
-        return format_response('success', 'Donation retrieved successfully', data=donation), 200
+        response = format_response('success', 'Donation retrieved successfully', data=donation)
+        return set_validators(response, etag, last_modified), 200
     except Exception as e:
         return format_response('error', 'Failed to retrieve donation', error=str(e)), 500
 
@@ -148,19 +287,33 @@ def update_donation_status(donation_id):
         return format_response('error', f'Status must be one of: {valid_statuses}', error='Validation error'), 400
     
     # Check if donation exists
-    donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,))
+    donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,), prepare=True)
     if not donation:
         return format_response('error', 'Donation not found', error='Not found'), 404
     
     # Update donation status
     try:
-        db.update(
-            "UPDATE fooddonations SET status = %s, updated_at = NOW() WHERE donation_id = %s",
-            (data['status'], donation_id)
-        )
+        with db.transaction():
+            # Re-read under lock so the status counters move from the real previous status
+            previous = db.fetch_one("SELECT status FROM fooddonations WHERE donation_id = %s FOR UPDATE", (donation_id,))
+            stats.record_status_change(previous['status'], data['status'])
+            # Last before COMMIT, so updated_at is stamped after any wait on the counters (see sync.py)
+            db.update(
+                "UPDATE fooddonations SET status = %s, updated_at = NOW() WHERE donation_id = %s",
+                (data['status'], donation_id)
+            )
+        donation_feed.feed.notify()
+        holds.ledger.invalidate(donation_id)
+        
+        events.publish('donation_status', {
+            'donation_id': donation_id,
+            'status': data['status'],
+            'previous_status': previous['status'],
+            'actor_id': request.user['user_id']
+        })
         
         # Get updated donation
-        updated_donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,))
+        updated_donation = db.fetch_one("SELECT * FROM fooddonations WHERE donation_id = %s", (donation_id,), prepare=True)
         
         # Format donation image URL if it exists
         if updated_donation['donation_image']:
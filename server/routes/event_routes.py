@@ -0,0 +1,54 @@
+import os
+import queue
+from functools import wraps
+from flask import Blueprint, Response, request, stream_with_context
+from events import broker
+from utils import token_required, format_response
+
+# Create blueprint
+event_bp = Blueprint('event', __name__)
+
+HEARTBEAT_SECONDS = int(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+
+def token_from_query(f):
+    """EventSource can't set headers, so accept ?token= for this stream"""
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.args.get('token')
+        if token and 'Authorization' not in request.headers:
+            request.environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        return f(*args, **kwargs)
+    return decorated
+
+@event_bp.route('/stream', methods=['GET'])
+@token_from_query
+@token_required
+def stream():
+    """Server-Sent Events stream of request and donation updates for the current user"""
+    subscriber = broker.subscribe(request.user['user_id'], request.user['role'])
+    if subscriber is None:
+        return format_response('error', 'Too many open streams, fall back to polling', error='Service unavailable'), 503
+    
+    missed = broker.replay(request.headers.get('Last-Event-ID'), subscriber)
+    
+    @stream_with_context
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            for event in missed:
+                yield event.to_sse()
+            while True:
+                try:
+                    event = subscriber.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event.to_sse()
+        finally:
+            broker.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
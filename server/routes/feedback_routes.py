@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 import db
-from utils import token_required, role_required, format_response
+import write_behind
+from utils import token_required, role_required, format_response, fetch_list
 
 # Create blueprint
 feedback_bp = Blueprint('feedback', __name__)
@@ -25,6 +26,15 @@ def submit_feedback():
         except ValueError:
             return format_response('error', 'Rating must be a number', error='Validation error'), 400
     
+    # Queue for a batched insert when write-behind is on
+    if write_behind.ENABLED:
+        client_ref = write_behind.feedback_queue.enqueue({
+            'user_id': request.user['user_id'],
+            'feedback_text': data['feedback_text'],
+            'rating': rating
+        })
+        return format_response('success', 'Feedback accepted', data={'client_ref': client_ref, 'status': 'queued'}), 202
+    
     # Insert feedback
     try:
         feedback_id = db.insert(
@@ -46,7 +56,7 @@ def get_all_feedback():
     """Get all feedback (admin only)"""
     try:
         # Get all feedback with user information
-        feedback = db.fetch_all(
+        feedback = fetch_list(
             """SELECT f.*, u.full_name, u.email, u.role 
                FROM feedback f 
                JOIN users u ON f.user_id = u.user_id 
@@ -63,7 +73,7 @@ def get_my_feedback():
     """Get feedback submitted by the current user"""
     try:
         # Get user's feedback
-        feedback = db.fetch_all(
+        feedback = fetch_list(
             "SELECT * FROM feedback WHERE user_id = %s ORDER BY created_at DESC",
             (request.user['user_id'],)
         )
@@ -1,23 +1,63 @@
 from flask import Blueprint, request, jsonify
 import db
-from utils import token_required, format_response
+import json_codec
+from deadlines import stale_on_timeout
+from utils import (
+    token_required, format_response,
+    make_validators, conditional_response, set_validators, fingerprint
+)
 
 # Create blueprint
 leaderboard_bp = Blueprint('leaderboard', __name__)
 
+# Serialized leaderboards keyed by ETag; a new validator means new data, so entries never go stale
+_cache = {}
+CACHE_SIZE = 64
+
+# Every donation and donor field a leaderboard row is built from
+VALIDATORS_QUERY = f"""
+    SELECT COUNT(*) AS row_count, MAX(GREATEST(d.updated_at, u.updated_at)) AS last_modified,
+           {fingerprint('d.donation_id', 'd.donor_id', 'd.quantity', 'd.created_at', 'd.updated_at',
+                        'u.full_name', 'u.profile_picture')}
+    FROM fooddonations d JOIN users u ON d.donor_id = u.user_id
+    {{where}}
+"""
+
+def _cached_payload(etag):
+    return _cache.get(etag)
+
+def _store_payload(etag, donors):
+    if len(_cache) >= CACHE_SIZE:
+        _cache.clear()
+    _cache[etag] = payload = json_codec.dumps(donors)
+    return payload
+
 @leaderboard_bp.route('', methods=['GET'])
+@stale_on_timeout
 def get_leaderboard():
     """Get top donors by donation count"""
     try:
         # Get query parameters
         limit = request.args.get('limit', 10, type=int)
         
+        # Revalidate against donation churn before running the GROUP BY
+        validators = db.fetch_one(VALIDATORS_QUERY.format(where=''))
+        etag, last_modified = make_validators(validators, 'all', limit)
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
+        
+        payload = _cached_payload(etag)
+        if payload is not None:
+            response = format_response('success', 'Leaderboard retrieved successfully', raw_data=payload)
+            return set_validators(response, etag, last_modified), 200
+        
         # Get top donors by donation count
         donors = db.fetch_all(
             """SELECT u.user_id, u.full_name, u.profile_picture, COUNT(d.donation_id) as donation_count, 
                   SUM(d.quantity) as total_quantity
                FROM users u 
-               JOIN fooddonations d ON u.user_id = d.donor_id 
+               JOIN all_fooddonations d ON u.user_id = d.donor_id 
                GROUP BY u.user_id, u.full_name, u.profile_picture 
                ORDER BY donation_count DESC, total_quantity DESC 
                LIMIT %s""",
@@ -29,23 +69,39 @@ def get_leaderboard():
             if donor['profile_picture']:
                 donor['profile_picture'] = f"/uploads/profile_pictures/{donor['profile_picture']}"
         
-        return format_response('success', 'Leaderboard retrieved successfully', data=donors), 200
+        response = format_response('success', 'Leaderboard retrieved successfully', raw_data=_store_payload(etag, donors))
+        return set_validators(response, etag, last_modified), 200
     except Exception as e:
         return format_response('error', 'Failed to retrieve leaderboard', error=str(e)), 500
 
 @leaderboard_bp.route('/monthly', methods=['GET'])
+@stale_on_timeout
 def get_monthly_leaderboard():
     """Get top donors for the current month"""
     try:
         # Get query parameters
         limit = request.args.get('limit', 10, type=int)
         
+        # Revalidate against this month's donation churn before running the GROUP BY
+        validators = db.fetch_one(VALIDATORS_QUERY.format(
+            where="WHERE d.created_at >= CURRENT_DATE() - INTERVAL (DAYOFMONTH(CURRENT_DATE()) - 1) DAY"
+        ))
+        etag, last_modified = make_validators(validators, 'monthly', limit)
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
+        
+        payload = _cached_payload(etag)
+        if payload is not None:
+            response = format_response('success', 'Monthly leaderboard retrieved successfully', raw_data=payload)
+            return set_validators(response, etag, last_modified), 200
+        
         # Get top donors for the current month
         donors = db.fetch_all(
             """SELECT u.user_id, u.full_name, u.profile_picture, COUNT(d.donation_id) as donation_count, 
                   SUM(d.quantity) as total_quantity
                FROM users u 
-               JOIN fooddonations d ON u.user_id = d.donor_id 
+               JOIN all_fooddonations d ON u.user_id = d.donor_id 
                WHERE MONTH(d.created_at) = MONTH(CURRENT_DATE()) AND YEAR(d.created_at) = YEAR(CURRENT_DATE())
                GROUP BY u.user_id, u.full_name, u.profile_picture 
                ORDER BY donation_count DESC, total_quantity DESC 
@@ -58,6 +114,14 @@ def get_monthly_leaderboard():
             if donor['profile_picture']:
                 donor['profile_picture'] = f"/uploads/profile_pictures/{donor['profile_picture']}"
         
-        return format_response('success', 'Monthly leaderboard retrieved successfully', data=donors), 200
+        response = format_response('success', 'Monthly leaderboard retrieved successfully', raw_data=_store_payload(etag, donors))
+        return set_validators(response, etag, last_modified), 200
     except Exception as e:
-        return format_response('error', 'Failed to retrieve monthly leaderboard', error=str(e)), 500
\ No newline at end of file
+        return format_response('error', 'Failed to retrieve monthly leaderboard', error=str(e)), 500
+
+def warm_cache(app, limits=(10,)):
+    """Fill the cache for the common limits, e.g. in a pre-fork master so workers share it"""
+    for limit in limits:
+        for view in (get_leaderboard, get_monthly_leaderboard):
+            with app.test_request_context(f'/?limit={limit}'):
+                view()
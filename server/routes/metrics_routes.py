@@ -0,0 +1,12 @@
+from flask import Blueprint
+import metrics
+from utils import role_required, format_response
+
+# Create blueprint
+metrics_bp = Blueprint('metrics', __name__)
+
+@metrics_bp.route('', methods=['GET'])
+@role_required(['admin'])
+def get_metrics():
+    """Get this worker's counters, gauges and timings (admin only)"""
+    return format_response('success', 'Metrics retrieved successfully', data=metrics.snapshot()), 200
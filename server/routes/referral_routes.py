@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
+import MySQLdb
 import db
-from utils import token_required, validate_email, format_response
+import write_behind
+from email_filter import referred_emails
+from utils import token_required, validate_email, format_response, fetch_list
 
 # Create blueprint
 referral_bp = Blueprint('referral', __name__)
@@ -19,18 +22,31 @@ def create_referral():
     if not validate_email(data['referred_email']):
         return format_response('error', 'Invalid email format', error='Validation error'), 400
     
-    # Check if email already exists in users
-    existing_user = db.fetch_one("SELECT * FROM users WHERE email = %s", (data['referred_email'],))
+    # Check if email already exists in users; always queried, as no unique key backs this check
+    existing_user = db.fetch_one("SELECT user_id FROM users WHERE email = %s", (data['referred_email'],), prepare=True)
     if existing_user:
         return format_response('error', 'This email is already registered', error='Duplicate entry'), 409
     
-    # Check if email already exists in referrals
-    existing_referral = db.fetch_one(
-        "SELECT * FROM referrals WHERE referred_email = %s AND referrer_id = %s", 
-        (data['referred_email'], request.user['user_id'])
-    )
-    if existing_referral:
-        return format_response('error', 'You have already referred this email', error='Duplicate entry'), 409
+    # Check if email already exists in referrals; the unique key still guards the insert
+    if referred_emails.might_contain(request.user['user_id'], data['referred_email']):
+        existing_referral = db.fetch_one(
+            "SELECT referral_id FROM referrals WHERE referred_email = %s AND referrer_id = %s", 
+            (data['referred_email'], request.user['user_id']),
+            prepare=True
+        )
+        if existing_referral:
+            return format_response('error', 'You have already referred this email', error='Duplicate entry'), 409
+    
+    # Queue for a batched insert when write-behind is on
+    if write_behind.ENABLED:
+        client_ref = write_behind.referral_queue.enqueue({
+            'referrer_id': request.user['user_id'],
+            'referred_email': data['referred_email'],
+            'referred_name': data.get('referred_name', ''),
+            'message': data.get('message', '')
+        })
+        referred_emails.add(request.user['user_id'], data['referred_email'])
+        return format_response('success', 'Referral accepted', data={'client_ref': client_ref, 'status': 'queued'}), 202
     
     # Insert referral
     try:
@@ -44,10 +60,16 @@ def create_referral():
             )
         )
         
+        referred_emails.add(request.user['user_id'], data['referred_email'])
+        
         # Get the created referral
         referral = db.fetch_one("SELECT * FROM referrals WHERE referral_id = %s", (referral_id,))
         
         return format_response('success', 'Referral created successfully', data=referral), 201
+    except MySQLdb.IntegrityError as e:
+        if not db.is_duplicate(e):
+            return format_response('error', 'Failed to create referral', error=str(e)), 500
+        return format_response('error', 'You have already referred this email', error='Duplicate entry'), 409
     except Exception as e:
         return format_response('error', 'Failed to create referral', error=str(e)), 500
 
@@ -57,7 +79,7 @@ def get_my_referrals():
     """Get referrals made by the current user"""
     try:
         # Get user's referrals
-        referrals = db.fetch_all(
+        referrals = fetch_list(
             "SELECT * FROM referrals WHERE referrer_id = %s ORDER BY created_at DESC",
             (request.user['user_id'],)
         )
@@ -76,7 +98,7 @@ def get_all_referrals():
     
     try:
         # Get all referrals with referrer information
-        referrals = db.fetch_all(
+        referrals = fetch_list(
             """SELECT r.*, u.full_name as referrer_name, u.email as referrer_email 
                FROM referrals r 
                JOIN users u ON r.referrer_id = u.user_id 
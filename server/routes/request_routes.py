@@ -1,11 +1,82 @@
 from flask import Blueprint, request, jsonify, current_app
 import db
-from utils import token_required, role_required, format_response
+import events
+import stats
+import rollups
+import donation_feed
+import holds
+import archive
+import sync
+from rate_limit import rate_limit
+from utils import (
+    token_required, role_required, format_response,
+    make_validators, conditional_response, set_validators,
+    list_format, fetch_list, fingerprint
+)
 from datetime import datetime
 
 # Create blueprint
 request_bp = Blueprint('request', __name__)
 
+# What a my-requests row shows: the request, its donation and the donor's name
+MY_REQUESTS_FINGERPRINT = fingerprint(
+    'r.request_id', 'r.quantity_requested', 'r.purpose', 'r.status', 'r.updated_at',
+    'd.food_item', 'd.donation_image', 'u.full_name'
+)
+
+def _hold_refused(outcome):
+    """The error response for a claim the ledger refused, or None"""
+    if outcome == holds.UNAVAILABLE:
+        return format_response('error', 'Donation not found or not available', error='Not found'), 404
+    if outcome == holds.INSUFFICIENT:
+        return format_response('error', 'Requested quantity is no longer available', error='Conflict'), 409
+    if outcome == holds.BUSY:
+        response = format_response('error', 'Too many open claims on this donation, try again shortly', error='Conflict')
+        response.headers['Retry-After'] = str(int(holds.TTL_SECONDS))
+        return response, 409
+    if outcome == holds.LIMITED:
+        response = format_response('error', 'You already hold as much as one account may; release a hold or wait for one to expire', error='Conflict')
+        response.headers['Retry-After'] = str(int(holds.TTL_SECONDS))
+        return response, 409
+    return None
+
+@request_bp.route('/holds', methods=['POST'])
+@token_required
+@role_required(['consumer', 'ngo'])
+@rate_limit('holds')
+def create_hold():
+    """Reserve quantity on a donation for a short time before requesting it"""
+    data = request.get_json(silent=True) or {}
+    quantity = data.get('quantity')
+    if not isinstance(quantity, int) or quantity <= 0:
+        return format_response('error', 'Quantity must be a positive number', error='Validation error'), 400
+    try:
+        donation_id = int(data.get('donation_id'))
+    except (TypeError, ValueError):
+        return format_response('error', 'donation_id must be an integer', error='Validation error'), 400
+    
+    try:
+        outcome, expires_in = holds.ledger.claim(donation_id, request.user['user_id'], quantity, holds.load_capacity)
+    except Exception as e:
+        current_app.logger.error("Error creating hold: %s", e)
+        return format_response('error', 'Failed to create hold', error=str(e)), 500
+    refused = _hold_refused(outcome)
+    if refused:
+        return refused
+    return format_response('success', 'Hold created successfully', data={'hold': {
+        'donation_id': donation_id,
+        'quantity': quantity,
+        'expires_in': expires_in,
+    }}), 201
+
+@request_bp.route('/holds/<int:donation_id>', methods=['DELETE'])
+@token_required
+def release_hold(donation_id):
+    """Give up a hold before it expires"""
+    if not holds.ledger.release(donation_id, request.user['user_id']):
+        return format_response('error', 'No live hold on this donation', error='Not found'), 404
+    return format_response('success', 'Hold released successfully'), 200
+
 @request_bp.route('', methods=['POST'])
 @token_required
 @role_required(['consumer', 'ngo'])
@@ -23,37 +94,73 @@ def create_request():
     if not isinstance(data['quantity_requested'], int) or data['quantity_requested'] <= 0:
         return format_response('error', 'Quantity must be a positive number', error='Validation error'), 400
     
-    # Check if donation exists and is available
-    donation = db.fetch_one(
+    try:
+        donation_id = int(data['donation_id'])
+    except (TypeError, ValueError):
+        return format_response('error', 'donation_id must be an integer', error='Validation error'), 400
+    
+    # Claim the quantity (unless an earlier hold covers it) before touching MySQL
+    user_id = request.user['user_id']
+    tracked = True
+    if (holds.ledger.live_hold(donation_id, user_id) or 0) < data['quantity_requested']:
+        outcome, _ = holds.ledger.claim(donation_id, user_id, data['quantity_requested'], holds.load_capacity)
+        refused = _hold_refused(outcome)
+        if refused:
+            return refused
+        tracked = outcome != holds.UNTRACKED
+    
+    # Check if donation exists and is available (the feed snapshot spares the read)
+    donation = donation_feed.feed.lookup(donation_id) or db.fetch_one(
         "SELECT * FROM fooddonations WHERE donation_id = %s AND status = 'available'",
-        (data['donation_id'],)
+        (donation_id,),
+        prepare=True
     )
     
     if not donation:
+        holds.ledger.release(donation_id, user_id)
         return format_response('error', 'Donation not found or not available', error='Not found'), 404
     
     # Check if requested quantity is available
     if data['quantity_requested'] > donation['quantity']:
+        holds.ledger.release(donation_id, user_id)
         return format_response('error', 'Requested quantity exceeds available quantity', error='Validation error'), 400
     
     # Get optional fields
     purpose = data.get('purpose', '')
     
     try:
-        # Insert request
-        request_id = db.insert(
-            """INSERT INTO requests 
-               (donation_id, requester_id, quantity_requested, purpose, status) 
-               VALUES (%s, %s, %s, %s, 'pending')""",
-            (data['donation_id'], request.user['user_id'], data['quantity_requested'], purpose)
-        )
+        # Insert request; it is only persisted while the hold is still live
+        with db.transaction():
+            # Rollup first: the row's updated_at must be stamped by the last statement before COMMIT (see sync.py)
+            rollups.record(donation['food_item'], requests_created=1, quantity_requested=data['quantity_requested'])
+            request_id = db.insert(
+                """INSERT INTO requests 
+                   (donation_id, requester_id, quantity_requested, purpose, status) 
+                   VALUES (%s, %s, %s, %s, 'pending')""",
+                (donation_id, user_id, data['quantity_requested'], purpose)
+            )
+            if tracked and not holds.ledger.commit(donation_id, user_id, data['quantity_requested']):
+                raise holds.HoldExpired()
         
         # Get the created request
-        new_request = db.fetch_one("SELECT * FROM requests WHERE request_id = %s", (request_id,))
+        new_request = db.fetch_one("SELECT * FROM requests WHERE request_id = %s", (request_id,), prepare=True)
+        
+        # Notify the donor
+        events.publish('request_created', {
+            'request_id': request_id,
+            'donation_id': donation_id,
+            'requester_id': user_id,
+            'quantity_requested': data['quantity_requested'],
+            'actor_id': user_id
+        }, users=[donation['donor_id']])
         
         return format_response('success', 'Request created successfully', data={'request': new_request}), 201
+    except holds.HoldExpired:
+        return format_response('error', 'Your hold on this donation expired, please try again', error='Conflict'), 409
     except Exception as e:
-        current_app.logger.error(f"Error creating request: {str(e)}")
+        # The hold may have been committed before the transaction failed
+        holds.ledger.invalidate(donation_id)
+        current_app.logger.error("Error creating request: %s", e)
         return format_response('error', 'Failed to create request', error=str(e)), 500
 
 @request_bp.route('/pending', methods=['GET'])
@@ -99,7 +206,7 @@ def list_pending_requests():
         params.extend([limit, offset])
         
         # Execute query
-        requests_list = db.fetch_all(query, tuple(params))
+        requests_list = fetch_list(query, tuple(params))
         
         # Format response with pagination info
         return format_response('success', 'Requests retrieved successfully', data={
@@ -112,7 +219,7 @@ def list_pending_requests():
             }
         }), 200
     except Exception as e:
-        current_app.logger.error(f"Error listing requests: {str(e)}")
+        current_app.logger.error("Error listing requests: %s", e)
         return format_response('error', 'Failed to retrieve requests', error=str(e)), 500
 
 @request_bp.route('/<int:request_id>/accept', methods=['POST'])
@@ -123,11 +230,13 @@ def accept_request(request_id):
     try:
         # Get the request
         req = db.fetch_one(
-            """SELECT r.*, d.donor_id, d.quantity as available_quantity 
+            """SELECT r.*, d.donor_id, d.food_item, d.quantity as available_quantity, u.role as requester_role 
                FROM requests r 
                JOIN fooddonations d ON r.donation_id = d.donation_id 
+               JOIN users u ON r.requester_id = u.user_id 
                WHERE r.request_id = %s""", 
-            (request_id,)
+            (request_id,),
+            prepare=True
         )
         
         if not req:
@@ -149,6 +258,31 @@ def accept_request(request_id):
         db.execute_query("START TRANSACTION")
         
         try:
+            # The read above may come from a lagging replica; recheck both rows under lock on the primary
+            donation = db.fetch_one(
+                "SELECT status, quantity FROM fooddonations WHERE donation_id = %s FOR UPDATE",
+                (req['donation_id'],)
+            )
+            current = db.fetch_one(
+                "SELECT status FROM requests WHERE request_id = %s FOR UPDATE",
+                (request_id,)
+            )
+            if current['status'] != 'pending':
+                db.execute_query("ROLLBACK")
+                return format_response('error', f'Request is already {current["status"]}', error='Invalid status'), 400
+            if req['quantity_requested'] > donation['quantity']:
+                db.execute_query("ROLLBACK")
+                return format_response('error', 'Requested quantity exceeds available quantity', error='Validation error'), 400
+            
+            new_quantity = donation['quantity'] - req['quantity_requested']
+            
+            # Counters first, so the stamps below are the last statements before COMMIT (see sync.py);
+            # both rows are already locked, so nothing between the stamps and COMMIT can wait
+            if new_quantity <= 0:
+                stats.record_status_change(donation['status'], 'claimed')
+            stats.record_request_fulfilled(req['requester_id'], req['requester_role'], req['quantity_requested'])
+            rollups.record(req['food_item'], requests_approved=1, quantity_approved=req['quantity_requested'])
+            
             # Update request status
             db.update(
                 "UPDATE requests SET status = 'approved', updated_at = NOW() WHERE request_id = %s",
@@ -156,8 +290,6 @@ def accept_request(request_id):
             )
             
             # Update donation quantity
-            new_quantity = req['available_quantity'] - req['quantity_requested']
-            
             if new_quantity > 0:
                 # Update quantity
                 db.update(
@@ -173,6 +305,23 @@ def accept_request(request_id):
             
             # Commit transaction
             db.execute_query("COMMIT")
+            donation_feed.feed.notify()
+            holds.ledger.invalidate(req['donation_id'])
+            
+            # Notify the requester, and everyone watching the donation
+            events.publish('request_approved', {
+                'request_id': request_id,
+                'donation_id': req['donation_id'],
+                'status': 'approved',
+                'previous_status': req['status'],
+                'actor_id': request.user['user_id']
+            }, users=[req['requester_id']])
+            events.publish('donation_updated', {
+                'donation_id': req['donation_id'],
+                'quantity': max(new_quantity, 0),
+                'status': 'available' if new_quantity > 0 else 'claimed',
+                'actor_id': request.user['user_id']
+            })
             
             return format_response('success', 'Request accepted successfully'), 200
         except Exception as e:
@@ -180,7 +329,7 @@ def accept_request(request_id):
             db.execute_query("ROLLBACK")
             raise e
     except Exception as e:
-        current_app.logger.error(f"Error accepting request: {str(e)}")
+        current_app.logger.error("Error accepting request: %s", e)
         return format_response('error', 'Failed to accept request', error=str(e)), 500
 
 @request_bp.route('/<int:request_id>/reject', methods=['POST'])
@@ -191,11 +340,12 @@ def reject_request(request_id):
     try:
         # Get the request
         req = db.fetch_one(
-            """SELECT r.*, d.donor_id 
+            """SELECT r.*, d.donor_id, d.food_item 
                FROM requests r 
                JOIN fooddonations d ON r.donation_id = d.donation_id 
                WHERE r.request_id = %s""", 
-            (request_id,)
+            (request_id,),
+            prepare=True
         )
         
         if not req:
@@ -209,17 +359,55 @@ def reject_request(request_id):
         if req['status'] != 'pending':
             return format_response('error', f'Request is already {req["status"]}', error='Invalid status'), 400
         
-        # Update request status
-        db.update(
-            "UPDATE requests SET status = 'rejected', updated_at = NOW() WHERE request_id = %s",
-            (request_id,)
-        )
+        # Recheck under lock to catch a concurrent accept or reject the read above missed
+        with db.transaction():
+            current = db.fetch_one("SELECT status FROM requests WHERE request_id = %s FOR UPDATE", (request_id,))
+            rejected = current is not None and current['status'] == 'pending'
+            if rejected:
+                rollups.record(req['food_item'], requests_rejected=1)
+                # Last before COMMIT, so updated_at is stamped after any wait on the rollup row (see sync.py)
+                db.update(
+                    "UPDATE requests SET status = 'rejected', updated_at = NOW() WHERE request_id = %s",
+                    (request_id,)
+                )
+        if not rejected:
+            return format_response('error', 'Request is no longer pending', error='Invalid status'), 400
+        holds.ledger.invalidate(req['donation_id'])
+        
+        # Notify the requester
+        events.publish('request_rejected', {
+            'request_id': request_id,
+            'donation_id': req['donation_id'],
+            'status': 'rejected',
+            'previous_status': req['status'],
+            'actor_id': request.user['user_id']
+        }, users=[req['requester_id']])
         
         return format_response('success', 'Request rejected successfully'), 200
     except Exception as e:
-        current_app.logger.error(f"Error rejecting request: {str(e)}")
+        current_app.logger.error("Error rejecting request: %s", e)
         return format_response('error', 'Failed to reject request', error=str(e)), 500
 
+@request_bp.route('/my-requests/changes', methods=['GET'])
+@token_required
+def get_my_request_changes():
+    """The current user's requests changed since the ``since`` watermark (see sync.py)"""
+    status = request.args.get('status')
+    limit = request.args.get('limit', sync.DEFAULT_LIMIT, type=int)
+    valid_statuses = ['pending', 'approved', 'rejected', 'completed']
+    if status and status not in valid_statuses:
+        return format_response('error', f'Status must be one of: {valid_statuses}', error='Validation error'), 400
+    if not 1 <= limit <= sync.MAX_LIMIT:
+        return format_response('error', f'Limit must be between 1 and {sync.MAX_LIMIT}', error='Validation error'), 400
+    try:
+        changes = sync.request_changes(request.user['user_id'], request.args.get('since'), status, limit)
+        return format_response('success', 'Request changes retrieved successfully', data=changes), 200
+    except ValueError as e:
+        return format_response('error', str(e), error='Validation error'), 400
+    except Exception as e:
+        current_app.logger.error("Error retrieving request changes: %s", e)
+        return format_response('error', 'Failed to retrieve request changes', error=str(e)), 500
+
 @request_bp.route('/my-requests', methods=['GET'])
 @token_required
 def get_my_requests():
@@ -231,35 +419,63 @@ def get_my_requests():
         limit = int(request.args.get('limit', 10))
         offset = (page - 1) * limit
         
-        # Base query
-        query = """
-            SELECT r.*, d.food_item, d.donation_image, u.full_name as donor_name
-            FROM requests r
-            JOIN fooddonations d ON r.donation_id = d.donation_id
-            JOIN users u ON d.donor_id = u.user_id
-            WHERE r.requester_id = %s
-        """
-        params = [request.user['user_id']]
+        # Finished requests may have moved to requests_archive with their donation; pending ones never do
+        sources = [('requests', 'fooddonations')]
+        if status != 'pending':
+            sources.append(('requests_archive', 'fooddonations_archive'))
         
-        # Add status filter if provided
+        # Status filter if provided
+        status_sql = ""
+        filter_params = [request.user['user_id']]
         if status:
-            query += " AND r.status = %s"
-            params.append(status)
+            status_sql = " AND r.status = %s"
+            filter_params.append(status)
+        params = filter_params * len(sources)
         
-        # Count total matching requests
-        count_query = f"SELECT COUNT(*) as count FROM ({query}) as filtered_requests"
-        count_result = db.fetch_one(count_query, tuple(params))
-        total = count_result['count'] if count_result else 0
+        columns = ', '.join(f'r.{column}' for column in archive.REQUEST_COLUMNS)
+        query = " UNION ALL ".join(
+            f"""
+            SELECT {columns}, d.food_item, d.donation_image, u.full_name as donor_name
+            FROM {requests_table} r
+            JOIN {donations_table} d ON r.donation_id = d.donation_id
+            JOIN users u ON d.donor_id = u.user_id
+            WHERE r.requester_id = %s{status_sql}
+            """
+            for requests_table, donations_table in sources
+        )
+        
+        # Revalidate with one aggregate over the same rows before fetching a page
+        validators = db.fetch_one(
+            "SELECT SUM(row_count) AS row_count, MAX(last_modified) AS last_modified, SUM(fingerprint) AS fingerprint FROM (" + " UNION ALL ".join(
+                f"""SELECT COUNT(*) AS row_count, MAX(GREATEST(r.updated_at, d.updated_at, u.updated_at)) AS last_modified,
+                           {MY_REQUESTS_FINGERPRINT}
+                    FROM {requests_table} r
+                    JOIN {donations_table} d ON r.donation_id = d.donation_id
+                    JOIN users u ON d.donor_id = u.user_id
+                    WHERE r.requester_id = %s{status_sql}"""
+                for requests_table, donations_table in sources
+            ) + ") AS counts",
+            tuple(params)
+        )
+        etag, last_modified = make_validators(
+            validators, request.user['user_id'], status, page, limit, list_format(), request.args.get('orient')
+        )
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
+        
+        # Every request row joins exactly one donation, so the validator count is the total
+        total = int(validators['row_count'] or 0) if validators else 0
         
         # Add pagination
-        query += " ORDER BY r.created_at DESC LIMIT %s OFFSET %s"
+        query += " ORDER BY created_at DESC LIMIT %s OFFSET %s"
         params.extend([limit, offset])
         
         # Execute query
-        requests_list = db.fetch_all(query, tuple(params))
+        requests_list = fetch_list(query, tuple(params))
         
         # Format response with pagination info
-        return format_response('success', 'Requests retrieved successfully', data={
+        response = format_response('success', 'Requests retrieved successfully', data={
             'requests': requests_list,
             'pagination': {
                 'total': total,
@@ -267,7 +483,8 @@ def get_my_requests():
                 'limit': limit,
                 'pages': (total + limit - 1) // limit
             }
-        }), 200
+        })
+        return set_validators(response, etag, last_modified), 200
     except Exception as e:
-        current_app.logger.error(f"Error retrieving requests: {str(e)}")
+        current_app.logger.error("Error retrieving requests: %s", e)
         return format_response('error', 'Failed to retrieve requests', error=str(e)), 500
\ No newline at end of file
@@ -0,0 +1,16 @@
+from flask import Blueprint
+import stats
+from deadlines import stale_on_timeout
+from utils import format_response
+
+# Create blueprint
+stats_bp = Blueprint('stats', __name__)
+
+@stats_bp.route('', methods=['GET'])
+@stale_on_timeout
+def get_platform_stats():
+    """Get platform-wide totals from the precomputed counters"""
+    try:
+        return format_response('success', 'Platform stats retrieved successfully', data=stats.get_stats()), 200
+    except Exception as e:
+        return format_response('error', 'Failed to retrieve platform stats', error=str(e)), 500
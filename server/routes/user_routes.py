@@ -1,16 +1,22 @@
 import os
+import json
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
+import MySQLdb
 import db
+import bulk_users
+from email_filter import registered_emails
+from rate_limit import rate_limit
 from utils import (
-    hash_password, check_password, generate_token, token_required,
+    hash_password, check_password, generate_token, token_required, role_required,
     validate_email, validate_password, validate_phone, save_file,
-    format_response
+    format_response, make_validators, conditional_response, set_validators, fingerprint
 )
 
 user_bp = Blueprint('user', __name__, url_prefix='/api/user')
 
 @user_bp.route('/register', methods=['POST'])
+@rate_limit('register', per=('ip',), expensive=True)
 def register():
     data = request.get_json()
     required = ['email', 'password', 'full_name', 'phone_number', 'address', 'role']
@@ -23,14 +29,66 @@ def register():
             INSERT INTO users (email, password, full_name, phone_number, address, role)
             VALUES (%s, %s, %s, %s, %s, %s)
         """, (data['email'], hashed, data['full_name'], data['phone_number'], data['address'], data['role']))
+        registered_emails.add(data['email'])
         return format_response('success', 'Registered successfully'), 201
+    except MySQLdb.IntegrityError as e:
+        if not db.is_duplicate(e):
+            return format_response('error', 'Registration failed', error=str(e)), 500
+        return format_response('error', 'Email already registered', error='Duplicate entry'), 409
     except Exception as e:
         return format_response('error', 'Registration failed', error=str(e)), 500
 
+def _bulk_rows():
+    """Rows from a CSV or JSON file upload, a text/csv body or {"users": [...]}"""
+    upload = request.files.get('file')
+    if upload is not None:
+        text = upload.read().decode('utf-8-sig')
+        if upload.filename.lower().endswith('.json'):
+            data = json.loads(text)
+            return data.get('users') if isinstance(data, dict) else data
+        return bulk_users.parse_csv(text)
+    if request.mimetype == 'text/csv':
+        return bulk_users.parse_csv(request.get_data(as_text=True))
+    data = request.get_json(silent=True)
+    return data.get('users') if isinstance(data, dict) else data
+
+@user_bp.route('/bulk-register', methods=['POST'])
+@role_required(['ngo', 'admin'])
+@rate_limit('bulk_register')
+def bulk_register():
+    """Queue many volunteers or beneficiaries from one upload for registration in the background"""
+    try:
+        rows = _bulk_rows()
+        job_id = bulk_users.submit(current_app._get_current_object(), request.user['user_id'], rows)
+    except ValueError as e:
+        # UploadError, malformed JSON or a file that isn't UTF-8
+        return format_response('error', 'Could not read the upload', error=str(e)), 400
+    except Exception as e:
+        current_app.logger.error("Bulk registration failed: %s", e)
+        return format_response('error', 'Bulk registration failed', error=str(e)), 500
+    response = format_response('success', f'Queued {len(rows)} users for registration',
+                               data={'job_id': job_id, 'status': 'queued', 'total': len(rows)})
+    response.headers['Location'] = f'/api/user/bulk-register/{job_id}'
+    return response, 202
+
+@user_bp.route('/bulk-register/<job_id>', methods=['GET'])
+@role_required(['ngo', 'admin'])
+def bulk_register_status(job_id):
+    """Progress of a bulk registration, with the per-row report once it is done"""
+    try:
+        job = bulk_users.get_job(job_id)
+    except Exception as e:
+        current_app.logger.error("Error fetching bulk registration job: %s", e)
+        return format_response('error', 'Failed to fetch job', error=str(e)), 500
+    if not job or (job['user_id'] != request.user['user_id'] and request.user['role'] != 'admin'):
+        return format_response('error', 'Job not found', error='Not found'), 404
+    return format_response('success', 'Job retrieved successfully', data=job), 200
+
 @user_bp.route('/login', methods=['POST'])
+@rate_limit('login', per=('ip', 'email'), expensive=True)
 def login():
     data = request.get_json()
-    user = db.fetch_one("SELECT * FROM users WHERE email = %s", (data['email'],))
+    user = db.fetch_one("SELECT * FROM users WHERE email = %s", (data['email'],), prepare=True)
     if not user or not check_password(data['password'], user['password']):
         return format_response('error', 'Invalid credentials', error='Unauthorized'), 401
     token = generate_token(user['user_id'], user['role'])
@@ -40,14 +98,27 @@ def login():
         'token': token
     }), 200
 
+PROFILE_VALIDATORS_QUERY = f"""
+    SELECT COUNT(*) AS row_count, MAX(updated_at) AS last_modified,
+           {fingerprint('email', 'full_name', 'phone_number', 'address', 'role', 'profile_picture', 'updated_at')}
+    FROM users WHERE user_id = %s
+"""
+
 @user_bp.route('/profile/<int:user_id>', methods=['GET'])
 @token_required
 def get_profile(user_id):
     if request.user['user_id'] != user_id and request.user['role'] != 'admin':
         return format_response('error', 'Unauthorized', error='Forbidden'), 403
-    user = db.fetch_one("SELECT user_id, email, full_name, phone_number, address, role, profile_picture, created_at FROM users WHERE user_id = %s", (user_id,))
+    validators = db.fetch_one(PROFILE_VALIDATORS_QUERY, (user_id,), prepare=True)
+    etag, last_modified = make_validators(validators, user_id)
+    if validators['row_count']:
+        not_modified = conditional_response(etag, last_modified)
+        if not_modified:
+            return not_modified
+    user = db.fetch_one("SELECT user_id, email, full_name, phone_number, address, role, profile_picture, created_at FROM users WHERE user_id = %s", (user_id,), prepare=True)
     if not user:
         return format_response('error', 'User not found'), 404
     if user['profile_picture']:
         user['profile_picture'] = f"/uploads/profile_pictures/{user['profile_picture']}"
-    return format_response('success', 'Profile loaded', data=user), 200
+    response = format_response('success', 'Profile loaded', data=user)
+    return set_validators(response, etag, last_modified), 200
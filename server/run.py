@@ -7,30 +7,40 @@ This script initializes the database if needed and starts the Flask server.
 
 Usage:
     python run.py
+
+This runs the app from app.create_app() on the single-process development
+server. For production use serve.py, which pre-forks workers over the
+same app.
 """
 
 import os
-import sys
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-# Initialize database
-print("Initializing database...")
-from init_db import init_database
-init_database()
+# Everything runs under the guard: process pools started with "spawn"
+# (bulk password hashing) re-import this module in their children
+if __name__ == '__main__':
+    # Initialize database
+    print("Initializing database...")
+    from init_db import init_database
+    init_database()
 
-# Start the Flask server
-print("Starting Flask server...")
-from server import app
+    # Start the Flask server
+    print("Starting Flask server...")
+    from app import create_app, start_background
+    app = create_app()
 
-if __name__ == '__main__':
     port = int(os.getenv('PORT', 5001))
     debug = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
     
     print(f"Server running on http://localhost:{port}")
     print(f"Debug mode: {debug}")
+
+    # With the reloader on, only the child that serves requests runs them
+    if not debug or os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        start_background(app)
     
     app.run(
         host='0.0.0.0',
@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+
+"""
+Production entry point: a pre-forking master serving the Flask app.
+
+The master first brings the schema up to date (init_db.init_database, so
+tables, views and schema_updates exist before any worker's background jobs
+touch them; SERVE_MIGRATE=false skips it when migrations run separately).
+It then binds the listening socket and imports the modules whose
+shared-memory tables must be common to all workers (db read-your-writes
+pins, rate-limit buckets, the holds ledger and the events ring). That
+happens even with SERVE_PRELOAD=false, since tables mapped after fork
+would be private to each worker; code changes to those modules therefore
+need a full restart rather than a HUP. With SERVE_PRELOAD=true (the
+default) the master also builds the app and its read-only state before
+forking: compiled validation patterns, the signing key and warm
+leaderboard payloads. The heap is then frozen with
+gc.freeze() so workers share those pages copy-on-write. Each worker drops
+the inherited database connections, starts its own background threads and
+serves the shared socket with either:
+
+    threaded  a bounded pool of SERVE_THREADS request threads (default).
+              Each SSE stream pins a thread, so open streams are capped
+              well below SERVE_THREADS (see events.py)
+    gevent    SERVE_CONNECTIONS greenlets; suits SSE streams and long polls.
+              MySQLdb calls still block the worker, so keep DB-heavy traffic
+              on threaded workers
+
+Signals to the master:
+    HUP        rolling restart: start a replacement worker, wait until it
+               is ready, then gracefully stop an old one. Warm state is
+               rebuilt first; with SERVE_PRELOAD=false the workers also load
+               new code, except for the shared-memory modules above
+    TERM/INT   graceful shutdown: workers stop accepting, finish in-flight
+               requests (up to SERVE_GRACEFUL_TIMEOUT) and flush write-behind
+               queues
+
+Usage:
+    SERVE_WORKERS=4 SERVE_WORKER_CLASS=threaded python serve.py
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import signal
+import socket
+import logging
+
+HOST = os.getenv('SERVE_HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', 5001))
+WORKERS = int(os.getenv('SERVE_WORKERS', os.cpu_count() or 2))
+WORKER_CLASS = os.getenv('SERVE_WORKER_CLASS', 'threaded')
+THREADS = int(os.getenv('SERVE_THREADS', 16))
+CONNECTIONS = int(os.getenv('SERVE_CONNECTIONS', 1000))
+BACKLOG = int(os.getenv('SERVE_BACKLOG', 2048))
+PRELOAD = os.getenv('SERVE_PRELOAD', 'true').lower() == 'true'
+MIGRATE = os.getenv('SERVE_MIGRATE', 'true').lower() == 'true'
+GRACEFUL_TIMEOUT = float(os.getenv('SERVE_GRACEFUL_TIMEOUT', 30))
+READY_TIMEOUT = float(os.getenv('SERVE_READY_TIMEOUT', 30))
+
+logger = logging.getLogger('serve')
+
+
+def load_app(warm=True):
+    """Build the app and the state workers should share"""
+    from app import create_app
+    import db
+    app = create_app()
+    if warm:
+        from routes.leaderboard_routes import warm_cache
+        try:
+            warm_cache(app)
+        except Exception as e:
+            logger.warning("Could not warm leaderboard cache: %s", e)
+        # Connections must not be shared across fork
+        db.close_all()
+    return app
+
+
+# -- workers --------------------------------------------------------------
+
+def make_threaded_server(sock, app):
+    from concurrent.futures import ThreadPoolExecutor, wait
+    from werkzeug.serving import BaseWSGIServer
+
+    class PooledWSGIServer(BaseWSGIServer):
+        """werkzeug's server on an inherited socket, handing requests to a fixed thread pool"""
+
+        def __init__(self):
+            super().__init__(HOST, PORT, app, fd=sock.fileno())
+            self._executor = ThreadPoolExecutor(THREADS, thread_name_prefix='request')
+            self._pending = set()
+
+        def process_request(self, request, client_address):
+            future = self._executor.submit(self._handle, request, client_address)
+            self._pending.add(future)
+            future.add_done_callback(self._pending.discard)
+
+        def _handle(self, request, client_address):
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+        def drain(self, timeout):
+            wait(list(self._pending), timeout=timeout)
+
+    return PooledWSGIServer()
+
+
+def run_threaded_worker(sock, app, ready):
+    import threading
+    server = make_threaded_server(sock, app)
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever returns, so not from this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    ready()
+    server.serve_forever()
+    server.drain(GRACEFUL_TIMEOUT)
+
+
+def run_gevent_worker(sock, app, ready):
+    import gevent
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    server = WSGIServer(sock, app, spawn=Pool(CONNECTIONS))
+
+    def stop():
+        gevent.spawn(server.stop, timeout=GRACEFUL_TIMEOUT)
+
+    gevent.signal_handler(signal.SIGTERM, stop)
+    gevent.signal_handler(signal.SIGINT, stop)
+    ready()
+    server.serve_forever()
+
+
+WORKER_CLASSES = {
+    'threaded': run_threaded_worker,
+    'gevent': run_gevent_worker,
+}
+
+
+def worker_main(sock, app, ready_fd):
+    import log_pipeline
+    log_pipeline.configure()
+    import db
+    import metrics
+    import audit
+    import write_behind
+    from app import start_background
+
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    if app is None:
+        app = load_app(warm=False)
+    else:
+        db.reset_after_fork()
+        metrics.reset()
+    start_background(app)
+
+    def ready():
+        os.write(ready_fd, b'1')
+        os.close(ready_fd)
+
+    try:
+        WORKER_CLASSES[WORKER_CLASS](sock, app, ready)
+    finally:
+        write_behind.flush_all()
+        audit.flush_all()
+
+
+# -- master ---------------------------------------------------------------
+
+class Master:
+    def __init__(self):
+        self.sock = None
+        self.app = None
+        self.workers = {}  # pid -> ready pipe read end (None once ready)
+        self._stopping = False
+        self._reloading = False
+
+    def migrate(self):
+        if MIGRATE:
+            from init_db import init_database
+            # Once, before forking: workers must not race each other's ALTERs
+            init_database(strict=True)
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((HOST, PORT))
+        sock.listen(BACKLOG)
+        sock.set_inheritable(True)
+        self.sock = sock
+
+    def preload(self):
+        import gc
+        # Their shared-memory tables are mapped at import and only shared if that happens before fork
+        import db  # noqa: F401
+        import rate_limit  # noqa: F401
+        import holds  # noqa: F401
+        import events  # noqa: F401
+        if PRELOAD:
+            self.app = load_app()
+        # Keep the collector from touching (and so copying) the preloaded heap
+        gc.freeze()
+
+    def spawn(self):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+                signal.signal(sig, signal.SIG_DFL)
+            code = 0
+            try:
+                worker_main(self.sock, self.app, write_fd)
+            except Exception:
+                logger.exception("Worker %d crashed", os.getpid())
+                code = 1
+            finally:
+                import log_pipeline
+                # os._exit skips atexit; write out queued log lines first
+                log_pipeline.stop()
+                os._exit(code)
+        os.close(write_fd)
+        self.workers[pid] = read_fd
+        logger.info("Started worker %d", pid)
+        return pid
+
+    def wait_ready(self, pid):
+        read_fd = self.workers.get(pid)
+        if read_fd is None:
+            return pid in self.workers
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                readable, _, _ = select.select([read_fd], [], [], 0.5)
+            except InterruptedError:
+                continue
+            if readable:
+                ok = os.read(read_fd, 1) == b'1'
+                os.close(read_fd)
+                if pid in self.workers:
+                    self.workers[pid] = None
+                return ok
+            self.reap()
+            if pid not in self.workers:
+                return False
+        return False
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            read_fd = self.workers.pop(pid, None)
+            if read_fd is not None:
+                os.close(read_fd)
+            logger.info("Worker %d exited with status %d", pid, os.waitstatus_to_exitcode(status))
+
+    def kill(self, pid, sig=signal.SIGTERM):
+        try:
+            os.kill(pid, sig)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def rolling_restart(self):
+        logger.info("Rolling restart of %d workers", len(self.workers))
+        if PRELOAD:
+            import gc
+            gc.unfreeze()
+            self.app = load_app()
+            gc.freeze()
+        for old in list(self.workers):
+            new = self.spawn()
+            if not self.wait_ready(new):
+                logger.error("Replacement worker %d did not start; keeping worker %d", new, old)
+                continue
+            self.kill(old)
+
+    def stop(self):
+        for pid in list(self.workers):
+            self.kill(pid)
+        deadline = time.monotonic() + GRACEFUL_TIMEOUT
+        while self.workers and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(0.1)
+        for pid in list(self.workers):
+            logger.warning("Worker %d did not stop in time; killing it", pid)
+            self.kill(pid, signal.SIGKILL)
+        while self.workers:
+            self.reap()
+            time.sleep(0.05)
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reloading = True
+
+    def run(self):
+        self.migrate()
+        self.bind()
+        self.preload()
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+
+        logger.info("Serving on http://%s:%d with %d %s workers (pid %d)",
+                    HOST, PORT, WORKERS, WORKER_CLASS, os.getpid())
+        for _ in range(WORKERS):
+            self.spawn()
+
+        while not self._stopping:
+            self.reap()
+            if self._reloading:
+                self._reloading = False
+                self.rolling_restart()
+            while len(self.workers) < WORKERS and not self._stopping:
+                self.spawn()
+            time.sleep(1)
+
+        logger.info("Shutting down")
+        self.stop()
+        self.sock.close()
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+    if WORKER_CLASS not in WORKER_CLASSES:
+        sys.exit(f"Unknown SERVE_WORKER_CLASS {WORKER_CLASS!r}; expected one of {', '.join(WORKER_CLASSES)}")
+    if WORKER_CLASS == 'gevent':
+        # Must happen before the app (and its threading/socket users) is imported
+        from gevent import monkey
+        monkey.patch_all()
+    import log_pipeline
+    log_pipeline.configure()
+    Master().run()
+
+
+if __name__ == '__main__':
+    main()
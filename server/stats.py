@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+"""
+Precomputed platform-wide totals.
+
+Write paths call the ``record_*`` helpers inside the same transaction as the
+change they count, so a counter can never run ahead of, or fall behind, a
+committed write. Each counter is spread over STATS_SLOTS rows that writers
+pick at random, which keeps concurrent donations from queueing on a single
+row lock. Reading all totals sums a fixed number of rows, whatever the size
+of the source tables.
+
+Counters can still drift, for example after manual SQL or a restore. The
+reconciliation job recomputes every total from the source tables and, with
+--repair, overwrites the drifted ones:
+
+    python stats.py reconcile [--repair]
+
+Run it with --repair once after deploying, to seed an existing database.
+"""
+
+import os
+import random
+import logging
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SLOTS = int(os.getenv('STATS_SLOTS', 8))
+
+# name -> query computing the true value from the source tables, archived rows included
+SOURCES = {
+    'donations_total': "SELECT COUNT(*) AS value FROM all_fooddonations",
+    'donations_available': "SELECT COUNT(*) AS value FROM all_fooddonations WHERE status = 'available'",
+    'donations_reserved': "SELECT COUNT(*) AS value FROM all_fooddonations WHERE status = 'reserved'",
+    'donations_claimed': "SELECT COUNT(*) AS value FROM all_fooddonations WHERE status = 'claimed'",
+    # Accepted requests are deducted from fooddonations.quantity, so add them back
+    'quantity_donated': """SELECT (SELECT COALESCE(SUM(quantity), 0) FROM all_fooddonations)
+                                + (SELECT COALESCE(SUM(quantity_requested), 0) FROM all_requests WHERE status = 'approved') AS value""",
+    'quantity_moved': "SELECT COALESCE(SUM(quantity_requested), 0) AS value FROM all_requests WHERE status = 'approved'",
+    'requests_fulfilled': "SELECT COUNT(*) AS value FROM all_requests WHERE status = 'approved'",
+    'active_donors': "SELECT COUNT(DISTINCT donor_id) AS value FROM all_fooddonations",
+    'active_ngos': """SELECT COUNT(DISTINCT r.requester_id) AS value
+                      FROM all_requests r JOIN users u ON u.user_id = r.requester_id
+                      WHERE r.status = 'approved' AND u.role = 'ngo'""",
+}
+
+# Distinct-user counters and the rows of platform_stat_members that back them
+MEMBER_SOURCES = {
+    'active_donors': "SELECT DISTINCT donor_id AS user_id FROM all_fooddonations",
+    'active_ngos': """SELECT DISTINCT r.requester_id AS user_id
+                      FROM all_requests r JOIN users u ON u.user_id = r.requester_id
+                      WHERE r.status = 'approved' AND u.role = 'ngo'""",
+}
+
+STATUS_COUNTERS = {
+    'available': 'donations_available',
+    'reserved': 'donations_reserved',
+    'claimed': 'donations_claimed',
+}
+
+
+# -- write side (call inside the writer's transaction) ---------------------
+
+def incr(name, amount=1):
+    if not amount:
+        return
+    db.execute_query(
+        """INSERT INTO platform_stats (stat_name, slot, value) VALUES (%s, %s, %s)
+           ON DUPLICATE KEY UPDATE value = value + VALUES(value)""",
+        (name, random.randrange(SLOTS), amount),
+        commit=True,
+        prepare=True
+    )
+
+def add_member(name, user_id):
+    """Count ``user_id`` towards a distinct-user counter the first time it qualifies"""
+    added = db.execute_query(
+        "INSERT IGNORE INTO platform_stat_members (stat_name, user_id) VALUES (%s, %s)",
+        (name, user_id),
+        commit=True,
+        prepare=True
+    ).rowcount
+    if added:
+        incr(name)
+
+def record_donation_created(donor_id, quantity, status='available'):
+    incr('donations_total')
+    incr(STATUS_COUNTERS[status])
+    incr('quantity_donated', quantity)
+    add_member('active_donors', donor_id)
+
+def record_status_change(previous, status):
+    if previous == status:
+        return
+    incr(STATUS_COUNTERS[previous], -1)
+    incr(STATUS_COUNTERS[status])
+
+def record_request_fulfilled(requester_id, requester_role, quantity):
+    incr('requests_fulfilled')
+    incr('quantity_moved', quantity)
+    if requester_role == 'ngo':
+        add_member('active_ngos', requester_id)
+
+
+# -- read side -------------------------------------------------------------
+
+def get_stats():
+    """Every counter, zero for ones that were never written"""
+    rows = db.fetch_all(
+        "SELECT stat_name, SUM(value) AS value FROM platform_stats GROUP BY stat_name",
+        prepare=True
+    )
+    totals = dict.fromkeys(SOURCES, 0)
+    totals.update({row['stat_name']: int(row['value']) for row in rows})
+    return totals
+
+
+# -- reconciliation --------------------------------------------------------
+
+def reconcile(repair=False):
+    """Compare each counter with its source tables; returns {name: (counted, actual)} for drifted ones"""
+    drift = {}
+    for name, source in SOURCES.items():
+        with db.transaction():
+            # Lock the counter first: writers that have already counted finish,
+            # later ones wait, and the source snapshot below starts after both
+            counted = db.fetch_one(
+                "SELECT COALESCE(SUM(value), 0) AS value FROM platform_stats WHERE stat_name = %s FOR UPDATE",
+                (name,)
+            )['value']
+            actual = db.fetch_one(source)['value']
+            if int(counted) == int(actual):
+                continue
+            drift[name] = (int(counted), int(actual))
+            metrics.incr('stats.drift', stat=name)
+            logger.warning("Counter %s drifted: counted %s, actual %s", name, counted, actual)
+            if repair:
+                _overwrite(name, int(actual))
+    return drift
+
+def _overwrite(name, value):
+    db.update("UPDATE platform_stats SET value = 0 WHERE stat_name = %s", (name,))
+    db.execute_query(
+        """INSERT INTO platform_stats (stat_name, slot, value) VALUES (%s, 0, %s)
+           ON DUPLICATE KEY UPDATE value = VALUES(value)""",
+        (name, value),
+        commit=True
+    )
+    if name in MEMBER_SOURCES:
+        db.delete("DELETE FROM platform_stat_members WHERE stat_name = %s", (name,))
+        db.execute_query(
+            f"INSERT INTO platform_stat_members (stat_name, user_id) SELECT %s, user_id FROM ({MEMBER_SOURCES[name]}) AS members",
+            (name,),
+            commit=True
+        )
+
+
+def main():
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description="Check platform counters against the source tables")
+    parser.add_argument('command', choices=['reconcile'])
+    parser.add_argument('--repair', action='store_true', help="overwrite counters that drifted")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    app = create_app()
+    with app.app_context():
+        drift = reconcile(repair=args.repair)
+    if not drift:
+        print("All counters match")
+    for name, (counted, actual) in drift.items():
+        print(f"{name}: counted {counted}, actual {actual}{' (repaired)' if args.repair else ''}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Delta sync: what changed in a list since the client last fetched it.
+
+``/api/donations/changes`` and ``/api/requests/my-requests/changes`` return
+the rows changed after a watermark, in (updated_at, id) order, and a new
+watermark to pass next time. Omitting ``since`` starts from scratch and
+pages through the whole list the same way. Each page is a range scan on an
+(updated_at, id) index, so a refresh costs what changed, not the table
+size.
+
+With a ``status`` filter, the load from scratch returns only matching
+rows, on every page, up to where it started (the horizon of its first
+page, carried in the watermark as a third part). Rows changed after that
+point are scanned whatever their status. So a row that stops matching
+after it was handed out still comes back as removed.
+
+Rows that left the result set come back as ids in ``removed``:
+
+    * rows that no longer match the ``status`` filter;
+    * donations moved out by archive.py, which leaves a tombstone in
+      ``sync_tombstones``. Tombstones are kept SYNC_TOMBSTONE_DAYS; an
+      older watermark gets 410 and the client reloads the list.
+
+Archived requests stay in the caller's list (my-requests reads the archive
+too), so the request feed scans both tables and needs no tombstones.
+
+``updated_at`` has one-second resolution and is stamped before commit. A
+page therefore stops SYNC_SETTLE_SECONDS short of the database clock, so a
+row whose transaction commits late cannot land behind a watermark already
+handed out. The window only has to cover the time from the stamp to
+COMMIT, so every writer of a synced row keeps that time free of waits: it
+takes its row locks and updates counters and rollups (hot rows other
+transactions lock) first, and stamps updated_at in the last statements
+before COMMIT. archive.py does the same with its tombstones. What is left
+is a statement on rows already locked plus the commit itself, well inside
+the window. When a page reaches that horizon, the watermark moves up to it.
+For the same reason these reads go to the primary, never a replica.
+"""
+
+import os
+from datetime import datetime
+import db
+import metrics
+import archive
+
+SETTLE_SECONDS = int(os.getenv('SYNC_SETTLE_SECONDS', 2))
+TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', 30))
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 1000
+PURGE_BATCH = 1000
+
+START = (datetime(1970, 1, 2), 0)
+_FORMAT = '%Y%m%d%H%M%S'
+
+
+class WatermarkExpired(Exception):
+    """The watermark predates the tombstones still kept; reload the full list"""
+
+
+def parse_watermark(token):
+    """((changed_at, id), filtered until) from a ``since`` token; (START, None) when absent"""
+    if not token:
+        return START, None
+    parts = token.split('-')
+    try:
+        if len(parts) not in (2, 3):
+            raise ValueError()
+        filtered_until = datetime.strptime(parts[2], _FORMAT) if len(parts) == 3 else None
+        return (datetime.strptime(parts[0], _FORMAT), int(parts[1])), filtered_until
+    except ValueError:
+        raise ValueError('Invalid watermark') from None
+
+
+def format_watermark(position, filtered_until=None):
+    changed_at, key = position
+    token = f"{changed_at.strftime(_FORMAT)}-{key}"
+    if filtered_until is not None and changed_at < filtered_until:
+        token += f"-{filtered_until.strftime(_FORMAT)}"
+    return token
+
+
+def _after(column, key):
+    # Leading on the timestamp keeps it a range scan of the (updated_at, id) index
+    return f"{column} >= %s AND ({column} > %s OR {key} > %s) AND {column} < %s"
+
+
+def _read(query, params):
+    # Always the primary: a lagging replica would hand out a watermark past rows it hasn't applied
+    return db.execute_query(query, params).fetchall()
+
+
+def _horizon():
+    return _read("SELECT NOW() - INTERVAL %s SECOND AS horizon", (SETTLE_SECONDS,))[0]['horizon']
+
+
+def _status_filter(status, since, filtered_until, horizon, status_column, changed_column):
+    """(sql, params, filtered until) restricting an initial load to ``status``"""
+    if since == START:
+        filtered_until = horizon
+    if not status or filtered_until is None or since[0] >= filtered_until:
+        return "", (), None
+    # Past where the load started, every change is scanned so leaving the filter shows up as a removal
+    return f" AND ({status_column} = %s OR {changed_column} >= %s)", (status, filtered_until), filtered_until
+
+
+def _page(sources, limit):
+    """Merge (changed_at, id, row) streams, each already in key order; returns (page, has_more)"""
+    merged = sorted((entry for source in sources for entry in source), key=lambda e: (e[0], e[1]))
+    return merged[:limit], len(merged) > limit
+
+
+def _result(page, has_more, horizon, matches, filtered_until=None):
+    changes, removed = [], []
+    for _, row_id, row in page:
+        if row is None or not matches(row):
+            removed.append(row_id)
+        else:
+            changes.append(row)
+    # A short page has seen everything up to the horizon
+    position = (page[-1][0], page[-1][1]) if has_more else (horizon, 0)
+    metrics.incr('sync.rows', len(page))
+    return {'changes': changes, 'removed': removed, 'watermark': format_watermark(position, filtered_until),
+            'has_more': has_more}
+
+
+def _image_url(row):
+    if row['donation_image']:
+        row['donation_image'] = f"/uploads/donation_images/{row['donation_image']}"
+    return row
+
+
+# -- donations -------------------------------------------------------------
+
+DONATION_CHANGES = f"""
+    SELECT d.*, u.full_name as donor_name
+    FROM fooddonations d JOIN users u ON d.donor_id = u.user_id
+    WHERE {_after('d.updated_at', 'd.donation_id')}{{status_sql}}
+    ORDER BY d.updated_at, d.donation_id
+    LIMIT %s
+"""
+
+TOMBSTONES = f"""
+    SELECT entity_id, removed_at FROM sync_tombstones
+    WHERE entity = %s AND {_after('removed_at', 'entity_id')}
+    ORDER BY removed_at, entity_id
+    LIMIT %s
+"""
+
+
+def donation_changes(since_token, status=None, limit=DEFAULT_LIMIT):
+    since, filtered_until = parse_watermark(since_token)
+    horizon = _horizon()
+    if since != START and (horizon - since[0]).days >= TOMBSTONE_DAYS:
+        raise WatermarkExpired()
+    window = (since[0], since[0], since[1], horizon)
+
+    status_sql, status_params, filtered_until = _status_filter(
+        status, since, filtered_until, horizon, 'd.status', 'd.updated_at')
+    rows = _read(DONATION_CHANGES.format(status_sql=status_sql), window + status_params + (limit + 1,))
+    sources = [[(row['updated_at'], row['donation_id'], _image_url(row)) for row in rows]]
+    if since != START:
+        tombstones = _read(TOMBSTONES, ('donation',) + window + (limit + 1,))
+        sources.append([(t['removed_at'], t['entity_id'], None) for t in tombstones])
+
+    page, has_more = _page(sources, limit)
+    return _result(page, has_more, horizon, lambda row: not status or row['status'] == status, filtered_until)
+
+
+# -- the caller's requests ---------------------------------------------------
+
+REQUEST_CHANGES = f"""
+    SELECT {', '.join(f'r.{column}' for column in archive.REQUEST_COLUMNS)}, d.food_item, d.donation_image, u.full_name as donor_name
+    FROM {{requests}} r
+    JOIN {{donations}} d ON r.donation_id = d.donation_id
+    JOIN users u ON d.donor_id = u.user_id
+    WHERE r.requester_id = %s AND {_after('r.updated_at', 'r.request_id')}{{status_sql}}
+    ORDER BY r.updated_at, r.request_id
+    LIMIT %s
+"""
+
+
+def request_changes(user_id, since_token, status=None, limit=DEFAULT_LIMIT):
+    since, filtered_until = parse_watermark(since_token)
+    horizon = _horizon()
+    status_sql, status_params, filtered_until = _status_filter(
+        status, since, filtered_until, horizon, 'r.status', 'r.updated_at')
+    params = (user_id, since[0], since[0], since[1], horizon) + status_params
+
+    sources = []
+    for requests_table, donations_table in (('requests', 'fooddonations'), ('requests_archive', 'fooddonations_archive')):
+        rows = _read(
+            REQUEST_CHANGES.format(requests=requests_table, donations=donations_table, status_sql=status_sql),
+            params + (limit + 1,)
+        )
+        sources.append([(row['updated_at'], row['request_id'], row) for row in rows])
+
+    page, has_more = _page(sources, limit)
+    return _result(page, has_more, horizon, lambda row: not status or row['status'] == status, filtered_until)
+
+
+# -- tombstones ------------------------------------------------------------
+
+def purge_tombstones():
+    """Drop tombstones older than any watermark still accepted; returns how many"""
+    purged = 0
+    while True:
+        count = db.delete(
+            "DELETE FROM sync_tombstones WHERE removed_at < NOW() - INTERVAL %s DAY LIMIT %s",
+            (TOMBSTONE_DAYS, PURGE_BATCH)
+        )
+        purged += count
+        if count < PURGE_BATCH:
+            return purged
@@ -1,18 +1,27 @@
 import os
 import re
 import uuid
+import hashlib
 import bcrypt
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, make_response, g
 from werkzeug.utils import secure_filename
+import json_codec
+import db
+from envelope import build_envelope, verify_token
 
 # Password validation regex
 PASSWORD_PATTERN = r'^.{4,}$'
 EMAIL_PATTERN = r'^[\w.-]+@[\w.-]+\.[a-zA-Z]{2,}$'
 PHONE_PATTERN = r'^\+?[0-9]{10,15}$'
 
+# Compiled once at import (before a pre-forking server forks)
+_PASSWORD_RE = re.compile(PASSWORD_PATTERN)
+_EMAIL_RE = re.compile(EMAIL_PATTERN)
+_PHONE_RE = re.compile(PHONE_PATTERN)
+
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -50,15 +59,15 @@ def check_password(password, hashed_password):
 
 def validate_password(password):
     """Validate a password against the password pattern"""
-    return re.match(PASSWORD_PATTERN, password) is not None
+    return _PASSWORD_RE.match(password) is not None
 
 def validate_email(email):
     """Validate an email address"""
-    return re.match(EMAIL_PATTERN, email) is not None
+    return _EMAIL_RE.match(email) is not None
 
 def validate_phone(phone):
     """Validate a phone number"""
-    return re.match(PHONE_PATTERN, phone) is not None
+    return _PHONE_RE.match(phone) is not None
 
 def generate_token(user_id, role, expiry=24):
     """Generate a JWT token for authentication"""
@@ -70,14 +79,16 @@ def generate_token(user_id, role, expiry=24):
     }
     return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
-def decode_token(token):
+def decode_token(token, secret_key=None):
     """Decode a JWT token"""
-    try:
-        return jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-    except jwt.ExpiredSignatureError:
-        return None
-    except jwt.InvalidTokenError:
-        return None
+    return verify_token(token, secret_key or current_app.config['SECRET_KEY'])
+
+def decode_request_token(token):
+    """decode_token, remembered for the app context so a /api/batch call decodes once"""
+    cache = g.setdefault('decoded_tokens', {})
+    if token not in cache:
+        cache[token] = decode_token(token)
+    return cache[token]
 
 def token_required(f):
     """Decorator to require a valid token for a route"""
@@ -98,7 +109,7 @@ def token_required(f):
             }), 401
         
         # Decode token
-        data = decode_token(token)
+        data = decode_request_token(token)
         if not data:
             return jsonify({
                 'status': 'error',
@@ -129,17 +140,94 @@ def role_required(roles):
         return decorated_function
     return decorator
 
-def format_response(status, message, data=None, error=None):
-    """Format a standard API response"""
-    response = {
-        'status': status,
-        'message': message
-    }
-    
-    if data is not None:
-        response['data'] = data
-    
-    if error is not None:
-        response['error'] = error
-    
-    return jsonify(response)
\ No newline at end of file
+def format_response(status, message, data=None, error=None, raw_data=None):
+    """Format a standard API response
+
+    ``raw_data`` is an already-serialized ``data`` payload (bytes), e.g. from a
+    cache, and is spliced into the envelope without re-encoding.
+    """
+    envelope = build_envelope(status, message, data=data, error=error)
+    body = json_codec.dumps_envelope(envelope, raw_data=raw_data)
+    return current_app.response_class(body, mimetype='application/json')
+
+def list_format():
+    """'columnar' when the client opted into the keys-once list format, else 'objects'"""
+    return 'columnar' if request.args.get('format') == 'columnar' else 'objects'
+
+def to_columnar(columns, rows, urls=None):
+    """Row tuples as {"columns", "rows"}, or per-column {"columns", "values"} with ?orient=columns"""
+    url_columns = [(columns.index(c), prefix) for c, prefix in (urls or {}).items() if c in columns]
+    if url_columns:
+        rows = [list(row) for row in rows]
+        for row in rows:
+            for i, prefix in url_columns:
+                if row[i]:
+                    row[i] = prefix + row[i]
+    if request.args.get('orient') == 'columns':
+        values = [list(column) for column in zip(*rows)] if rows else [[] for _ in columns]
+        return {'columns': columns, 'values': values}
+    return {'columns': columns, 'rows': rows}
+
+def fetch_list(query, params=None, prepare=False, urls=None):
+    """Fetch a list endpoint's rows in the wire format the client asked for.
+
+    By default a list of row objects. With ?format=columnar the rows come from
+    a tuple cursor and each column name is sent once (see to_columnar).
+    ``urls`` maps a column holding a stored file name to its URL prefix.
+    """
+    if list_format() == 'columnar':
+        columns, rows = db.fetch_columns(query, params, prepare)
+        return to_columnar(columns, rows, urls)
+    rows = db.fetch_all(query, params, prepare)
+    for column, prefix in (urls or {}).items():
+        for row in rows:
+            if row[column]:
+                row[column] = prefix + row[column]
+    return rows
+
+def fingerprint(*columns):
+    """SQL for a checksum over ``columns`` of every row, selected as ``fingerprint``.
+
+    updated_at has one-second resolution, so COUNT and MAX(updated_at) stay
+    the same when rows change twice in one second. Summing a CRC of the
+    columns a response shows does not.
+    """
+    return f"COALESCE(SUM(CRC32(CONCAT_WS('|', {', '.join(columns)}))), 0) AS fingerprint"
+
+def make_validators(row, *scope):
+    """Build an (etag, last_modified) pair from a COUNT/MAX(updated_at) row.
+
+    ``row`` carries ``row_count``, ``last_modified`` and usually a
+    ``fingerprint``; ``scope`` adds anything else that changes the body for
+    the same rows (filters, page, caller).
+    """
+    last_modified = row['last_modified'] if row else None
+    parts = [row['row_count'] if row else 0, last_modified.isoformat() if last_modified else '',
+             row.get('fingerprint', '') if row else '']
+    parts.extend(scope)
+    etag = hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+    return etag, last_modified
+
+def conditional_response(etag, last_modified):
+    """Return a 304 response if the client's validators still match, else None"""
+    if request.if_none_match:
+        # Weak comparison: compressed representations carry W/ ETags
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        matched = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        matched = False
+
+    if not matched:
+        return None
+
+    response = make_response('', 304)
+    return set_validators(response, etag, last_modified)
+
+def set_validators(response, etag, last_modified):
+    """Attach ETag/Last-Modified so clients can revalidate instead of refetching"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
\ No newline at end of file
@@ -0,0 +1,235 @@
+"""
+Write-behind queues for low-value, high-volume inserts (feedback, referrals).
+
+With WRITE_BEHIND_ENABLED=true the routes hand rows to a queue and answer
+202 with a ``client_ref``. A background thread inserts them in multi-row
+batches of WRITE_BEHIND_BATCH_SIZE, or every WRITE_BEHIND_FLUSH_SECONDS.
+
+Every accepted row is first appended to a per-process spool file. A
+checkpoint file records how far the spool has been flushed. On start-up a
+worker adopts spools left by dead processes (they are no longer flock'ed)
+and replays whatever was not flushed. Inserts use ON DUPLICATE KEY UPDATE
+on the unique ``client_ref``, so replaying rows that were already written is
+harmless.
+
+Rows have already been acknowledged, so one the table refuses is not
+retried forever. A batch that fails on a constraint or bad data is replayed
+row by row, and each refused row is logged and counted in
+``write_behind.rows_rejected``, like a row that turns out to duplicate
+another unique key (e.g. a referral already made). Connection errors leave
+the batch queued for the next try.
+"""
+
+import os
+import json
+import glob
+import time
+import uuid
+import fcntl
+import atexit
+import logging
+import threading
+import MySQLdb
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('WRITE_BEHIND_ENABLED', 'false').lower() == 'true'
+BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', 200))
+FLUSH_SECONDS = float(os.getenv('WRITE_BEHIND_FLUSH_SECONDS', 1.0))
+SPOOL_DIR = os.getenv('WRITE_BEHIND_SPOOL_DIR', 'spool/')
+FSYNC = os.getenv('WRITE_BEHIND_FSYNC', 'true').lower() == 'true'
+
+
+class WriteBehindQueue:
+    """Spooled, batched INSERTs into one table"""
+
+    def __init__(self, name, table, columns):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self._buffer = []  # (record, spool offset after its line)
+        self._cond = threading.Condition()
+        self._spool = None
+        self._spool_path = None
+        self._flushed_offset = 0
+        self._thread = None
+        self._app = None
+        self._flush_lock = threading.Lock()
+
+    # -- producer side ----------------------------------------------------
+
+    def enqueue(self, row):
+        """Durably accept a row and return its client-visible reference"""
+        record = {'client_ref': uuid.uuid4().hex}
+        record.update({column: row.get(column) for column in self.columns})
+        line = (json.dumps(record, default=str) + '\n').encode('utf-8')
+        with self._cond:
+            self._spool.write(line)
+            self._spool.flush()
+            if FSYNC:
+                os.fsync(self._spool.fileno())
+            self._buffer.append((record, self._spool.tell()))
+            depth = len(self._buffer)
+            if depth >= BATCH_SIZE:
+                self._cond.notify()
+        metrics.set_gauge('write_behind.depth', depth, queue=self.name)
+        return record['client_ref']
+
+    # -- lifecycle --------------------------------------------------------
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._app = app
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        self._spool_path = os.path.join(SPOOL_DIR, f'{self.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.spool')
+        self._spool = open(self._spool_path, 'ab+')
+        fcntl.flock(self._spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._flushed_offset = self._spool.tell()
+        self._write_checkpoint(self._spool_path, self._flushed_offset)
+        self._adopt_orphans()
+        self._thread = threading.Thread(target=self._run, name=f'{self.name}-write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.flush_all)
+
+    def _adopt_orphans(self):
+        for path in glob.glob(os.path.join(SPOOL_DIR, f'{self.name}.*.spool')):
+            if path == self._spool_path:
+                continue
+            with open(path, 'rb') as orphan:
+                try:
+                    fcntl.flock(orphan.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # owned by a live worker
+                orphan.seek(self._read_checkpoint(path))
+                records = [json.loads(line) for line in orphan if line.strip()]
+            for record in records:
+                self._readopt(record)
+            os.remove(path)
+            if os.path.exists(path + '.offset'):
+                os.remove(path + '.offset')
+            logger.info("Recovered %d queued %s rows from %s", len(records), self.name, path)
+
+    def _readopt(self, record):
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self._cond:
+            self._spool.write(line)
+            self._spool.flush()
+            self._buffer.append((record, self._spool.tell()))
+
+    # -- consumer side ----------------------------------------------------
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if len(self._buffer) < BATCH_SIZE:
+                    self._cond.wait(FLUSH_SECONDS)
+            if not self.flush():
+                time.sleep(FLUSH_SECONDS)
+
+    def flush(self):
+        """Insert up to one batch; returns False if the insert failed"""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._cond:
+            batch = self._buffer[:BATCH_SIZE]
+        if not batch:
+            return True
+
+        columns = ['client_ref'] + self.columns
+        query = (f"INSERT INTO {self.table} ({', '.join(columns)}) "
+                 f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                 f"ON DUPLICATE KEY UPDATE client_ref = client_ref")
+        rows = [tuple(record[c] for c in columns) for record, _ in batch]
+        started = time.monotonic()
+        try:
+            with self._app.app_context():
+                try:
+                    inserted, written = db.insert_many(query, rows), rows
+                except (MySQLdb.IntegrityError, MySQLdb.DataError):
+                    inserted, written = self._insert_each(query, rows)
+                if inserted < len(written):
+                    self._report_duplicates(written)
+        except Exception as e:
+            metrics.incr('write_behind.flush_failures', queue=self.name)
+            logger.error("Write-behind flush of %d %s rows failed: %s", len(rows), self.name, e)
+            return False
+        metrics.observe('write_behind.flush', time.monotonic() - started, queue=self.name)
+        metrics.incr('write_behind.rows_flushed', inserted, queue=self.name)
+
+        with self._cond:
+            del self._buffer[:len(batch)]
+            self._flushed_offset = batch[-1][1]
+            depth = len(self._buffer)
+            if not self._buffer:
+                # Everything is in MySQL: start the spool over
+                self._spool.truncate(0)
+                self._spool.seek(0)
+                self._flushed_offset = 0
+            self._write_checkpoint(self._spool_path, self._flushed_offset)
+        metrics.set_gauge('write_behind.depth', depth, queue=self.name)
+        return True
+
+    def _insert_each(self, query, rows):
+        """Insert rows one at a time, dropping the ones the table refuses; returns (inserted, rows kept)"""
+        metrics.incr('write_behind.batch_replays', queue=self.name)
+        inserted, written = 0, []
+        for row in rows:
+            try:
+                inserted += db.insert_many(query, [row])
+                written.append(row)
+            except (MySQLdb.IntegrityError, MySQLdb.DataError) as e:
+                metrics.incr('write_behind.rows_rejected', queue=self.name)
+                logger.error("Dropped queued %s row %s: %s", self.name, row[0], e)
+        return inserted, written
+
+    def _report_duplicates(self, rows):
+        # Rows that hit an existing key: a replayed client_ref is expected, any other key is a lost row
+        refs = [row[0] for row in rows]
+        placeholders = ', '.join(['%s'] * len(refs))
+        found = {r['client_ref'] for r in db.execute_query(
+            f"SELECT client_ref FROM {self.table} WHERE client_ref IN ({placeholders})", tuple(refs)).fetchall()}
+        for row in rows:
+            if row[0] not in found:
+                metrics.incr('write_behind.rows_rejected', queue=self.name)
+                logger.warning("Dropped queued %s row %s: duplicate of an existing row", self.name, row[0])
+
+    def flush_all(self):
+        while self._buffer and self.flush():
+            pass
+
+    @staticmethod
+    def _write_checkpoint(spool_path, offset):
+        tmp = spool_path + '.offset.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(offset))
+        os.replace(tmp, spool_path + '.offset')
+
+    @staticmethod
+    def _read_checkpoint(spool_path):
+        try:
+            with open(spool_path + '.offset') as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+
+feedback_queue = WriteBehindQueue('feedback', 'feedback', ['user_id', 'feedback_text', 'rating'])
+referral_queue = WriteBehindQueue('referrals', 'referrals', ['referrer_id', 'referred_email', 'referred_name', 'message'])
+
+
+def init_app(app):
+    """Start the flushers in this worker (no-op unless WRITE_BEHIND_ENABLED)"""
+    if ENABLED:
+        feedback_queue.start(app)
+        referral_queue.start(app)
+
+
+def flush_all():
+    """Drain both queues, e.g. when a worker shuts down"""
+    feedback_queue.flush_all()
+    referral_queue.flush_all()